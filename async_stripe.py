@@ -0,0 +1,120 @@
+"""
+Async access to the Stripe API for flows and monitors sharing one event loop.
+
+All calls go through a single StripeClient backed by one httpx AsyncClient,
+so connections are pooled and kept alive across calls instead of being
+opened per request. Concurrency is capped per API host and every call has
+an overall timeout, which lets one process drive dozens of card checks
+concurrently without a thread per card. Requests draw from the shared
+rate-limit scheduler, so they are throttled together with the synchronous
+stripe.* calls of the same process.
+
+    async with AsyncStripe() as client:
+        card = await client.retrieve_card(card_id, expand=["number", "cvc"])
+"""
+import asyncio
+import stripe
+from stripe_scheduler import RateLimitedHTTPClient, request_priority
+
+API_HOST = "api.stripe.com"
+DEFAULT_MAX_CONCURRENCY = 10
+DEFAULT_TIMEOUT = 30
+
+
+class AsyncStripe:
+    """Pooled, concurrency-limited async Stripe client"""
+
+    def __init__(self, api_key=None, max_concurrency=DEFAULT_MAX_CONCURRENCY, timeout=DEFAULT_TIMEOUT, scheduler=None):
+        """
+        Args:
+            api_key (str): Secret key to use (defaults to stripe.api_key)
+            max_concurrency (int): Maximum in-flight requests per API host
+            timeout (float): Seconds before a single call is abandoned
+            scheduler: RateLimitScheduler to draw from (defaults to the shared one)
+        """
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._http_client = RateLimitedHTTPClient(stripe.HTTPXClient(timeout=timeout), scheduler)
+        self._client = stripe.StripeClient(api_key or stripe.api_key, http_client=self._http_client)
+        # Newer SDKs group the API resources under `v1`
+        self._services = getattr(self._client, "v1", self._client)
+        self._host_limits = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """Close the pooled connections"""
+        await self._http_client.close_async()
+
+    def _limit(self, host):
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.max_concurrency)
+        return self._host_limits[host]
+
+    async def request(self, call, params=None, host=API_HOST, priority=None):
+        """
+        Run one async service call under the host's concurrency limit.
+
+        Args:
+            call: An async StripeClient service method, e.g.
+                client.services.issuing.cards.retrieve_async
+            params: Positional arguments for the call
+            host (str): API host the call goes to
+            priority: stripe_scheduler.INTERACTIVE or BULK (defaults to the
+                priority of the calling context)
+
+        Raises:
+            stripe.error.StripeError: On API errors, including a RateLimitError
+                once the scheduler's retries are exhausted
+            asyncio.TimeoutError: If the call exceeds the timeout
+        """
+        if priority is not None:
+            with request_priority(priority):
+                return await self.request(call, params, host)
+        async with self._limit(host):
+            return await asyncio.wait_for(call(*(params or ())), self.timeout)
+
+    @property
+    def services(self):
+        """The StripeClient services, for calls without a helper below"""
+        return self._services
+
+    def list_method(self, resource):
+        """Return the async list method matching a Stripe resource class"""
+        methods = {
+            stripe.issuing.Authorization: self._services.issuing.authorizations.list_async,
+            stripe.issuing.Transaction: self._services.issuing.transactions.list_async,
+            stripe.issuing.Card: self._services.issuing.cards.list_async,
+            stripe.Event: self._services.events.list_async,
+        }
+        return methods[resource]
+
+    async def list(self, resource, priority=None, **params):
+        """List one page of a resource"""
+        return await self.request(self.list_method(resource), (params,), priority=priority)
+
+    async def list_all(self, resource, priority=None, **params):
+        """
+        List a resource and follow auto-pagination to the end.
+
+        Pages are fetched one after another, each under the concurrency limit.
+        With `ending_before` the list walks towards newer objects and is
+        returned oldest first, like ListObject.auto_paging_iter.
+        """
+        backwards = "ending_before" in params and "starting_after" not in params
+        page = await self.list(resource, priority, **params)
+        objects = []
+        while True:
+            objects.extend(reversed(page.data) if backwards else page.data)
+            if not page.has_more:
+                return objects
+            page = await self.request(page.previous_page_async if backwards else page.next_page_async, priority=priority)
+
+    async def retrieve_card(self, card_id, expand=None):
+        """Retrieve an issuing card"""
+        params = {"expand": expand} if expand else {}
+        return await self.request(self._services.issuing.cards.retrieve_async, (card_id, params))
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Shared start-up for the scripts: configuration, the Stripe key and lazily
+built clients.
+
+Importing a module of this repo has no side effects: nothing reads .env,
+validates keys, prints, exits or connects anywhere. Entry points call
+require_stripe() once they actually start. The heavy clients (Browserbase,
+ChatOpenAI) and their packages are imported and constructed the first time
+they are asked for, so a script that never opens a browser never pays for
+them:
+
+    if __name__ == "__main__":
+        require_stripe()
+        session = browserbase().sessions.create(project_id=os.environ["BROWSERBASE_PROJECT_ID"])
+
+`python3 bootstrap.py` imports every entry point in a fresh interpreter and
+fails when one takes longer than its budget or prints while importing.
+"""
+import os
+import re
+import sys
+import time
+import argparse
+import threading
+import subprocess
+
+_lock = threading.RLock()
+_config_loaded = False
+_stripe_ready = False
+_browserbase = None
+_chat_model = None
+
+# Seconds an entry point may take to import in a fresh interpreter; stripe
+# itself accounts for most of it
+IMPORT_BUDGET = 0.4
+ENTRY_POINTS = (
+    "browserbase_redcross", "bulk_provision", "card_pool", "check_redcross_payment",
+    "check_stripe_activity", "create_cardholder", "create_test_payment", "create_test_payout",
+    "create_virtual_card", "donation_with_monitoring", "event_stream", "formfiller",
+    "get_card_details", "issuing_webhook", "langgraph_amazon_chatbot", "monitor_card_activity",
+    "redcross_donation", "redcross_donation_sync", "replay_webhook_event", "run_and_monitor",
+    "stripe_test_flow", "stripe_test_payment",
+)
+# Third-party packages only some entry points need; an entry point that can't
+# import one of them is reported but not failed
+OPTIONAL_PACKAGES = ("flask", "langgraph", "langchain_openai")
+
+
+def load_config():
+    """Load .env into the environment, once per process"""
+    global _config_loaded
+    with _lock:
+        if not _config_loaded:
+            from dotenv import load_dotenv
+
+            load_dotenv()
+            _config_loaded = True
+
+
+def require_stripe():
+    """
+    Configure the stripe module with the test key from the environment.
+
+    Exits when the key is missing or is not a test key. Safe to call more
+    than once; only the first call configures and reports.
+
+    Returns:
+        The configured stripe module
+    """
+    global _stripe_ready
+    load_config()
+    import stripe
+    from stripe_scheduler import install_scheduler
+
+    with _lock:
+        if _stripe_ready:
+            return stripe
+        stripe_api_key = os.getenv("STRIPE_API_KEY")
+
+        # Validate that we're using a test API key
+        if not stripe_api_key:
+            print("\n⚠️  No Stripe API key found in .env file. Please add your test API key.")
+            print("    Get a test API key from https://dashboard.stripe.com/test/apikeys")
+            sys.exit(1)
+        elif not stripe_api_key.startswith("sk_test_"):
+            print("\n❌ ERROR: You must use a Stripe TEST API key (starts with sk_test_)")
+            print("    This program is designed to run in test mode only.")
+            print("    Get a test API key from https://dashboard.stripe.com/test/apikeys")
+            sys.exit(1)
+
+        stripe.api_key = stripe_api_key
+        install_scheduler()
+        _stripe_ready = True
+        print("✅ Using Stripe TEST mode")
+        return stripe
+
+
+def browserbase():
+    """Return the process-wide Browserbase client, creating it on first use"""
+    global _browserbase
+    load_config()
+    with _lock:
+        if _browserbase is None:
+            if not os.getenv("BROWSERBASE_API_KEY") or not os.getenv("BROWSERBASE_PROJECT_ID"):
+                print("\n⚠️  BrowserBase API key or project ID not found in .env file.")
+                sys.exit(1)
+            from browserbase import Browserbase
+
+            _browserbase = Browserbase(api_key=os.environ["BROWSERBASE_API_KEY"])
+        return _browserbase
+
+
+def chat_model():
+    """Return the process-wide GPT-4 chat model, creating it on first use"""
+    global _chat_model
+    load_config()
+    with _lock:
+        if _chat_model is None:
+            from langchain_openai import ChatOpenAI
+
+            _chat_model = ChatOpenAI(model="gpt-4", temperature=0)
+        return _chat_model
+
+
+def measure_import(module):
+    """
+    Import a module in a fresh interpreter.
+
+    Returns:
+        (seconds, output) where output is anything printed during the import,
+        or (None, error) if the import failed
+    """
+    code = (
+        "import sys, time\n"
+        "started = time.perf_counter()\n"
+        f"import {module}\n"
+        "sys.stderr.write(f'\\n{time.perf_counter() - started}')\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if result.returncode != 0:
+        return None, result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "import failed"
+    return float(result.stderr.rsplit("\n", 1)[-1]), result.stdout.strip()
+
+
+def check_imports(modules=ENTRY_POINTS, budget=IMPORT_BUDGET):
+    """
+    Compare the import time of entry points against the budget.
+
+    Returns:
+        True if every module imported silently within its budget
+    """
+    ok = True
+    for module in modules:
+        seconds, output = measure_import(module)
+        if seconds is None:
+            missing = re.match(r"ModuleNotFoundError: No module named '([\w.]+)'", output)
+            if missing and missing.group(1).split(".")[0] in OPTIONAL_PACKAGES:
+                # Missing optional packages are reported, not counted against the budget
+                print(f"⚠️  {module:<26} could not be imported: {output}")
+            else:
+                ok = False
+                print(f"❌ {module:<26} could not be imported: {output}")
+            continue
+        status = "✅"
+        if seconds > budget:
+            status, ok = "❌", False
+        if output:
+            status, ok = "❌", False
+            print(f"❌ {module} printed while importing: {output.splitlines()[0]}")
+        print(f"{status} {module:<26} {seconds * 1000:6.0f} ms")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that every entry point imports quickly and silently")
+    parser.add_argument("modules", nargs="*", help="Modules to check (default: every entry point)")
+    parser.add_argument("--budget", type=float, default=IMPORT_BUDGET, help="Seconds each import may take")
+    args = parser.parse_args()
+
+    # Warm the bytecode cache so the first module isn't charged for compiling
+    subprocess.run([sys.executable, "-m", "compileall", "-q", "."], cwd=os.path.dirname(os.path.abspath(__file__)))
+    started = time.perf_counter()
+    passed = check_imports(args.modules or ENTRY_POINTS, args.budget)
+    print(f"\nChecked in {time.perf_counter() - started:.1f}s")
+    sys.exit(0 if passed else 1)
@@ -1,85 +1,149 @@
 #!/usr/bin/env python3
-from playwright.sync_api import Playwright, sync_playwright
-from browserbase import Browserbase
 from get_card_details import get_card as getCard
+from card_pool import CardPool
 import os
 import sys
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
-
-# Validate Stripe API key is in test mode
-stripe_api_key = os.getenv("STRIPE_API_KEY")
-if not stripe_api_key or not stripe_api_key.startswith("sk_test_"):
-    print("\n❌ ERROR: You must use a Stripe TEST API key (starts with sk_test_)")
-    exit(1)
-
-# Set up BrowserBase
-bb = Browserbase(api_key=os.environ["BROWSERBASE_API_KEY"])
-
-def run(playwright: Playwright, card_id: str) -> None:
-    session = bb.sessions.create(
-        project_id=os.environ["BROWSERBASE_PROJECT_ID"],
-    )
-
-    browser = playwright.chromium.connect_over_cdp(session.connect_url)
-    context = browser.contexts[0]
-    page = context.pages[0]
-
-    payment_info = getCard(card_id)
-
-    # Watch the session
-    print(f"Session URL: https://browserbase.com/sessions/{session.id}")
-
-    # Navigate to the donation page
-    page.goto("https://www.redcross.org/donate/donation.html")
-
-    # Perform actions on the donation page
-    page.click("#modf-handle-0-radio")
-    page.click("text=Continue")
-    page.click("text=credit card")
-
-    # Fill billing information
-    page.fill("input[name='bill_to_forename']", payment_info["cardholder_firstName"])
-    page.fill("input[name='bill_to_surname']", payment_info["cardholder_lastName"])
-    page.fill("input[name='bill_to_email']", payment_info["cardholder_email"])
-    page.fill("input[name='bill_to_phone']", payment_info["cardholder_phone"])
-
-    # Fill in the address information
-    page.fill("input[name='bill_to_address_line1']", payment_info["cardholder_address"]["line1"])
-    page.fill("input[name='bill_to_address_city']", payment_info["cardholder_address"]["city"])
-    page.fill("input[name='bill_to_address_postal_code']", payment_info["cardholder_address"]["postal_code"])
-    page.select_option("select#bill_to_address_state", payment_info["cardholder_address"]["state"])
-
-    # Fill in the card information
-    page.fill("input#cardnumber", payment_info["card_number"])
-    page.fill("input#MM", str(payment_info["expiration_month"]))
-    page.fill("input#YY", str(payment_info["expiration_year"]))
-    page.fill("input#CVC", str(payment_info["cvc"]))
-
-    # Wait for user confirmation before submitting
-    print("\n✅ Form filled with virtual card details")
-    print("⚠️  This is a TEST donation using a TEST card in Stripe's test mode")
-    print("⚠️  No actual charges will be made")
-    
-    # Click donate button
-    print("Clicking Donate button...")
-    page.click("text=Donate")
-    
-    print("\n✅ Donation process completed")
-    print("Note: Since this is using Stripe's test mode, no actual donation was made")
-    
-    page.close()
-    browser.close()
+from typing import TYPE_CHECKING
+from bootstrap import require_stripe
+from session_pool import SessionPool
+from request_blocking import RequestBlocker, describe, pop_block_option
+from flows import redcross_donation_flow, run_flow, timed_step
+from flow_profiler import DEFAULT_DIRECTORY, record_run, start_tracing, stop_tracing
+
+if TYPE_CHECKING:
+    from playwright.sync_api import Playwright
+
+def run(playwright: "Playwright", card_id: str, payment_info=None, pool=None, trace_path=None,
+        blocking="off") -> dict:
+    """
+    Fill in and submit the Red Cross donation form with a virtual card.
+
+    Args:
+        playwright: The sync Playwright instance
+        card_id (str): The virtual card to donate with
+        payment_info: The card's CardProfile, if the caller already has it
+        pool: A SessionPool on `playwright` to take a warm session from
+        trace_path (str): Save a Playwright trace of the run here
+        blocking (str): Request-blocking profile of a one-off session
+
+    Returns:
+        The outcome: {"card_id", "session_id", "ok", "error", "steps"}, where
+        each step is {"name", "ok", "start", "seconds", "error"} and flow
+        steps also time their page "calls"
+    """
+    result = {"card_id": card_id, "session_id": None, "ok": False, "error": None, "steps": []}
+    if pool is None:
+        # A one-off run: the session is released as soon as the run is done
+        pool = SessionPool(playwright, size=0, blocker=RequestBlocker.from_profile(blocking))
+    lease = None
+    try:
+        with timed_step(result, "acquire_session"):
+            lease = pool.acquire()
+        result["session_id"] = lease.session_id
+        if trace_path:
+            start_tracing(lease.context)
+
+        if payment_info is None:
+            with timed_step(result, "get_card"):
+                payment_info = getCard(card_id)
+        if payment_info is None:
+            raise RuntimeError(f"Could not retrieve card {card_id}")
+
+        # Watch the session
+        print(f"Session URL: {lease.session_url}")
+
+        run_flow(lease.page, redcross_donation_flow(), payment_info, result)
+
+        result["ok"] = True
+        print("\n✅ Donation process completed")
+        print("Note: Since this is using Stripe's test mode, no actual donation was made")
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        print(f"❌ Donation failed: {e}")
+    finally:
+        if lease:
+            if trace_path:
+                stop_tracing(lease.context, trace_path)
+            pool.release(lease, failed=not result["ok"])
+        if pool.blocker:
+            print(f"🚫 {describe(pool.blocker.stats())}")
+    return result
+
+def donate(card_id, payment_info=None, trace_path=None, blocking="off"):
+    """
+    Run the donation in this process.
+
+    Args:
+        card_id (str): The virtual card to donate with
+        payment_info: The card's CardProfile, if the caller already has it
+        trace_path (str): Save a Playwright trace of the run here
+        blocking (str): Request-blocking profile of the session
+
+    Returns:
+        The outcome dict of run()
+    """
+    from playwright.sync_api import sync_playwright
+
+    with sync_playwright() as playwright:
+        return run(playwright, card_id, payment_info, trace_path=trace_path, blocking=blocking)
+
+def playwright_trace_path(card_id, directory=DEFAULT_DIRECTORY):
+    """Where --trace saves the Playwright trace of a card's run"""
+    return os.path.join(directory, f"{card_id}.playwright.zip")
+
+def profile_run(card_id, payment_info=None, directory=DEFAULT_DIRECTORY, blocking="off", trace=False):
+    """
+    Donate, then add the run to this script's recorded runs and write the
+    step timelines and percentiles of all of them.
+
+    Args:
+        trace (bool): Also save a Playwright trace of the run in the directory
+
+    Returns:
+        The outcome dict of run()
+    """
+    trace_path = playwright_trace_path(card_id, directory) if trace else None
+    result = donate(card_id, payment_info, trace_path, blocking)
+    record_run(result, directory, "browserbase_redcross")
+    return result
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python3 browserbase_redcross.py <card_id>")
+    require_stripe()
+    try:
+        blocking, args = pop_block_option(sys.argv[1:])
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    profiling = "--profile" in args
+    tracing = "--trace" in args
+    args = [arg for arg in args if arg not in ("--profile", "--trace")]
+    if len(args) != 1:
+        print("Usage: python3 browserbase_redcross.py <card_id|--pool> [--profile] [--trace] [--block PROFILE]")
         print("Example: python3 browserbase_redcross.py ic_1RffUCLP54m13jvUESeDqzHz")
+        print("  --profile  add the run's step timeline to profiles/ and print percentiles over all runs")
+        print("  --trace    save a Playwright trace (screenshots, DOM snapshots) to profiles/")
         sys.exit(1)
+
+    def run_donation(card_id, payment_info=None):
+        if profiling:
+            return profile_run(card_id, payment_info, blocking=blocking, trace=tracing)
+        trace_path = playwright_trace_path(card_id) if tracing else None
+        return donate(card_id, payment_info, trace_path, blocking)
     
-    card_id = sys.argv[1]
+    if args[0] == "--pool":
+        # Lease a pre-provisioned card instead of passing one in
+        pool = CardPool()
+        profile = pool.lease()
+        if not profile:
+            print("❌ Could not lease a card from the pool")
+            sys.exit(1)
+        result = run_donation(profile.card_id, profile)
+        # A card whose donation failed may be in an unknown state
+        pool.release(profile.card_id, retire=not result["ok"])
+        pool.close()
+        sys.exit(0 if result["ok"] else 1)
     
-    with sync_playwright() as playwright:
-        run(playwright, card_id)
+    card_id = args[0]
+    
+    result = run_donation(card_id)
+    sys.exit(0 if result["ok"] else 1)
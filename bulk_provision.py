@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Provision many cardholders and virtual cards in one run for load tests.
+
+Creates run concurrently on a bounded thread pool, all drawing from the
+shared Stripe rate limiter, and every create carries an idempotency key
+derived from the batch ID and its position. Rerunning an interrupted or
+partly failed batch with the same --batch-id therefore never creates a
+duplicate: objects already in the manifest are skipped and retried creates
+return the original objects.
+
+The manifest (JSON) maps every cardholder and card of the batch to its ID:
+
+    python3 bulk_provision.py --count 200 --batch-id loadtest-1
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from bootstrap import require_stripe
+from create_cardholder import create_cardholder
+from create_virtual_card import create_card
+
+DEFAULT_WORKERS = 16
+DEFAULT_MANIFEST = "provisioned_cards.json"
+# $75.00, enough for one Red Cross donation per day
+DEFAULT_SPENDING_LIMIT = 7500
+
+
+def load_manifest(path, batch_id):
+    """Return the manifest of a batch, empty if the file is missing or belongs to another batch"""
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        manifest = None
+    if not manifest or manifest.get("batch_id") != batch_id:
+        return {"batch_id": batch_id, "cardholders": {}, "cards": {}}
+    return manifest
+
+
+def save_manifest(path, manifest):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def cardholder_email(batch_id, index):
+    # Plus-addressing keeps every cardholder of a batch distinct
+    return f"hello+{batch_id}-{index}@browserbase.com"
+
+
+def provision(count, cards_per_cardholder=1, batch_id=None, manifest_path=DEFAULT_MANIFEST,
+              workers=DEFAULT_WORKERS, spending_limit=DEFAULT_SPENDING_LIMIT):
+    """
+    Create `count` virtual cards, `cards_per_cardholder` per cardholder.
+
+    Args:
+        count (int): Number of cards in the batch
+        cards_per_cardholder (int): Cards issued to each cardholder
+        batch_id (str): Names the batch in idempotency keys and the manifest
+        manifest_path (str): JSON file the IDs are written to
+        workers (int): Maximum creates in flight at once
+        spending_limit (int): Daily spending limit of each card in cents
+
+    Returns:
+        The manifest dict
+    """
+    batch_id = batch_id or time.strftime("batch-%Y%m%d-%H%M%S")
+    manifest = load_manifest(manifest_path, batch_id)
+    cardholder_count = -(-count // cards_per_cardholder)
+    failures = 0
+
+    def make_cardholder(index):
+        cardholder = create_cardholder(
+            email=cardholder_email(batch_id, index),
+            idempotency_key=f"{batch_id}-cardholder-{index}",
+        )
+        return "cardholder", index, cardholder.id if cardholder else None
+
+    def make_card(key, cardholder_id):
+        card = create_card(cardholder_id, spending_limit, idempotency_key=f"{batch_id}-card-{key}")
+        return "card", key, cardholder_id, card.id if card else None
+
+    def cards_of(index):
+        first = index * cards_per_cardholder
+        return [f"{index}-{n}" for n in range(min(cards_per_cardholder, count - first))]
+
+    started = time.perf_counter()
+    print(f"Provisioning {count} card(s) for {cardholder_count} cardholder(s) in batch {batch_id}")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for index in range(cardholder_count):
+            cardholder_id = manifest["cardholders"].get(str(index))
+            if cardholder_id:
+                pending.update(
+                    executor.submit(make_card, key, cardholder_id)
+                    for key in cards_of(index) if key not in manifest["cards"]
+                )
+            else:
+                pending.add(executor.submit(make_cardholder, index))
+
+        try:
+            # Cards are submitted as soon as their cardholder exists
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    kind, *result = future.result()
+                    if result[-1] is None:
+                        failures += 1
+                    elif kind == "cardholder":
+                        index, cardholder_id = result
+                        manifest["cardholders"][str(index)] = cardholder_id
+                        pending.update(executor.submit(make_card, key, cardholder_id) for key in cards_of(index))
+                    else:
+                        key, cardholder_id, card_id = result
+                        manifest["cards"][key] = {"id": card_id, "cardholder": cardholder_id}
+        finally:
+            for future in pending:
+                future.cancel()
+            save_manifest(manifest_path, manifest)
+
+    elapsed = time.perf_counter() - started
+    print(f"\n✅ {len(manifest['cards'])}/{count} card(s) provisioned in {elapsed:.1f}s, manifest: {manifest_path}")
+    if failures:
+        print(f"⚠️  {failures} create(s) failed; rerun with --batch-id {batch_id} to finish the batch")
+    return manifest
+
+
+if __name__ == "__main__":
+    require_stripe()
+    parser = argparse.ArgumentParser(description="Create many cardholders and virtual cards concurrently")
+    parser.add_argument("--count", type=int, required=True, help="Number of virtual cards to create")
+    parser.add_argument("--cards-per-cardholder", type=int, default=1, help="Cards issued to each cardholder")
+    parser.add_argument("--batch-id", help="Batch name; reuse it to resume a batch without duplicates")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST, help="JSON file the created IDs are written to")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Maximum creates in flight")
+    parser.add_argument("--spending-limit", type=int, default=DEFAULT_SPENDING_LIMIT,
+                        help="Daily spending limit per card in cents")
+    args = parser.parse_args()
+
+    if args.count < 1 or args.cards_per_cardholder < 1:
+        parser.error("--count and --cards-per-cardholder must be positive")
+
+    manifest = provision(args.count, args.cards_per_cardholder, args.batch_id, args.manifest,
+                         args.workers, args.spending_limit)
+    sys.exit(0 if len(manifest["cards"]) == args.count else 1)
@@ -0,0 +1,142 @@
+"""
+Shared handling of newly detected card activity.
+
+Authorizations and transactions can reach a monitor from more than one
+source (the incremental poller, the event stream and the webhook receiver).
+Account-wide sources hand objects to a CardRouter, which delivers them to
+the subscribers of each card, and everything is funnelled through
+NewActivity so each object is reported exactly once, whichever source saw
+it first.
+"""
+import threading
+
+
+def card_id_of(obj):
+    """Return the card ID of an authorization or transaction"""
+    # Authorizations embed the full card object, transactions only its ID
+    card = obj.card
+    return card if isinstance(card, str) else card.id
+
+
+def _on_card(card_id):
+    return f" ON CARD {card_id}" if card_id else ""
+
+
+def report_new_authorizations(new_auths, card_id=None):
+    """Print newly detected authorizations"""
+    print(f"\n✅ DETECTED {len(new_auths)} NEW AUTHORIZATION(S){_on_card(card_id)}!")
+    for auth in new_auths:
+        print(f"  New authorization: {auth.id}")
+        print(f"  Merchant: {auth.merchant_data.name}")
+        print(f"  Amount: ${auth.amount/100:.2f} {auth.currency.upper()}")
+        print(f"  Status: {auth.status}")
+        print(f"  Approved: {auth.approved}")
+
+
+def report_new_transactions(new_txs, card_id=None):
+    """Print newly detected transactions"""
+    print(f"\n✅ DETECTED {len(new_txs)} NEW TRANSACTION(S){_on_card(card_id)}!")
+    for tx in new_txs:
+        print(f"  New transaction: {tx.id}")
+        print(f"  Type: {tx.type}")
+        print(f"  Amount: ${tx.amount/100:.2f} {tx.currency.upper()}")
+
+        if hasattr(tx, 'purchase_details') and tx.purchase_details:
+            if hasattr(tx.purchase_details, 'merchant') and tx.purchase_details.merchant:
+                print(f"  Merchant: {tx.purchase_details.merchant.name}")
+
+
+class NewActivity:
+    """Report each authorization and transaction once and count them"""
+
+    def __init__(self, card_id=None, report=True):
+        """
+        Args:
+            card_id (str): Named in reports when several cards share a console
+            report (bool): Print new objects as they are detected
+        """
+        self.card_id = card_id
+        self.report = report
+        self._lock = threading.Lock()
+        self._seen_ids = set()
+        self.auth_count = 0
+        self.tx_count = 0
+
+    def _unseen(self, objects):
+        with self._lock:
+            fresh = [obj for obj in objects if obj.id not in self._seen_ids]
+            self._seen_ids.update(obj.id for obj in fresh)
+        return fresh
+
+    def authorizations(self, auths):
+        """Report the authorizations not seen before and return them"""
+        fresh = self._unseen(auths)
+        if fresh and self.report:
+            report_new_authorizations(fresh, self.card_id)
+        with self._lock:
+            self.auth_count += len(fresh)
+        return fresh
+
+    def transactions(self, txs):
+        """Report the transactions not seen before and return them"""
+        fresh = self._unseen(txs)
+        if fresh and self.report:
+            report_new_transactions(fresh, self.card_id)
+        with self._lock:
+            self.tx_count += len(fresh)
+        return fresh
+
+
+class CardRouter:
+    """Route authorizations and transactions to per-card subscribers"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, card_id, on_authorization, on_transaction):
+        """Register handlers called with lists of a card's new objects"""
+        with self._lock:
+            self._subscribers.setdefault(card_id, []).append((on_authorization, on_transaction))
+
+    def unsubscribe(self, card_id, on_authorization=None, on_transaction=None):
+        """Remove the given handlers for a card, or all of them if none are given"""
+        with self._lock:
+            if on_authorization is None and on_transaction is None:
+                self._subscribers.pop(card_id, None)
+                return
+            remaining = [
+                handlers for handlers in self._subscribers.get(card_id, [])
+                if handlers != (on_authorization, on_transaction)
+            ]
+            if remaining:
+                self._subscribers[card_id] = remaining
+            else:
+                self._subscribers.pop(card_id, None)
+
+    @property
+    def card_ids(self):
+        with self._lock:
+            return list(self._subscribers)
+
+    def _route(self, objects, handler_index):
+        by_card = {}
+        for obj in objects:
+            by_card.setdefault(card_id_of(obj), []).append(obj)
+
+        with self._lock:
+            targets = [
+                (handlers[handler_index], by_card[card_id])
+                for card_id, card_handlers in self._subscribers.items() if card_id in by_card
+                for handlers in card_handlers
+            ]
+        for handler, card_objects in targets:
+            handler(card_objects)
+
+    def route_authorizations(self, auths):
+        """Deliver authorizations to the subscribers of their cards"""
+        self._route(auths, 0)
+
+    def route_transactions(self, txs):
+        """Deliver transactions to the subscribers of their cards"""
+        self._route(txs, 1)
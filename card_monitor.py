@@ -0,0 +1,496 @@
+"""
+Reusable, thread-safe monitor for the activity on one virtual card.
+
+A CardMonitor owns all of its state, so any number of them can run in one
+process (e.g. one per concurrent donation run). It polls the card
+incrementally on a background thread and, when webhooks are configured,
+also receives deliveries through the process-wide webhook router, polling
+only as a fallback. AsyncCardMonitor offers the same API as coroutines for
+flows that run on an asyncio event loop with an AsyncStripe client.
+
+    monitor = CardMonitor(card_id)
+    monitor.subscribe(lambda kind, obj: print(kind, obj.id))
+    monitor.start()
+    auth = monitor.wait_for(lambda kind, obj: kind == AUTHORIZATION, timeout=60)
+    monitor.stop()
+"""
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from card_activity import NewActivity, card_id_of
+from card_poller import authorization_poller, transaction_poller
+from issuing_webhook import FALLBACK_POLL_INTERVAL, shared_webhook_router
+
+AUTHORIZATION = "authorization"
+TRANSACTION = "transaction"
+# Number of recent tick timings kept per monitor
+TIMING_HISTORY = 100
+# Allowance between our clock and Stripe's when filtering by creation time
+CLOCK_SKEW = 60
+
+
+def _timed(fn, *args):
+    """Call fn and return (result, elapsed seconds)"""
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+async def _timed_async(coro):
+    """Await coro and return (result, elapsed seconds)"""
+    start = time.perf_counter()
+    result = await coro
+    return result, time.perf_counter() - start
+
+
+def _tick_record(started, tick_seconds, auth_seconds, tx_seconds, auths, txs):
+    # "failed" lists the fetches that errored, so a quiet tick and a failed
+    # one can be told apart
+    return {
+        "started": started,
+        "tick": tick_seconds,
+        AUTHORIZATION: auth_seconds,
+        TRANSACTION: tx_seconds,
+        "failed": [kind for kind, objects in ((AUTHORIZATION, auths), (TRANSACTION, txs)) if objects is None],
+    }
+
+
+def authorization_matching(card_id=None, amount=None, merchant=None, since=None):
+    """
+    Build a wait_for predicate that matches one expected authorization.
+
+    Args:
+        card_id (str): Required card, if given
+        amount (int): Required amount in cents, if given
+        merchant: Substring (or tuple of alternative substrings) the
+            merchant name must contain, case-insensitive, if given
+        since (float): Ignore authorizations created before this Unix time,
+            e.g. ones caught up from the event store after a restart
+    """
+    if isinstance(merchant, str):
+        merchant = (merchant,)
+    keywords = tuple(keyword.lower() for keyword in merchant or ())
+
+    def predicate(kind, obj):
+        if kind != AUTHORIZATION:
+            return False
+        if since is not None and obj.created < since:
+            return False
+        if card_id and card_id_of(obj) != card_id:
+            return False
+        if amount is not None and obj.amount != amount:
+            return False
+        if keywords:
+            name = (obj.merchant_data.name or "").lower()
+            if not any(keyword in name for keyword in keywords):
+                return False
+        return True
+
+    return predicate
+
+
+class CardMonitor:
+    """Watch one card on a background thread and notify subscribers"""
+
+    def __init__(self, card_id, interval=5, use_webhooks=True, report=True, store=None):
+        """
+        Args:
+            card_id (str): The Stripe issuing card ID
+            interval (int): Poll interval in seconds (raised to the fallback
+                interval while webhooks deliver events)
+            use_webhooks (bool): Subscribe to the shared webhook receiver
+                when STRIPE_WEBHOOK_SECRET is configured
+            report (bool): Print new activity as it is detected
+            store: Optional EventStore that persists everything seen and
+                lets a restarted monitor resume where it stopped
+        """
+        self.card_id = card_id
+        self.store = store
+        self.started_at = None
+        self.interval = interval
+        self.use_webhooks = use_webhooks
+        self.activity = NewActivity(report=report)
+
+        self._condition = threading.Condition()
+        self._objects = []
+        self._subscribers = []
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._webhook_router = None
+        self._primed = False
+        self._auth_poller = authorization_poller(card_id, store=store)
+        self._tx_poller = transaction_poller(card_id, store=store)
+        self._executor = None
+        self.tick_timings = deque(maxlen=TIMING_HISTORY)
+        self.failed_ticks = 0
+
+    @property
+    def authorizations(self):
+        """New authorizations seen so far, oldest first"""
+        with self._condition:
+            return [obj for kind, obj in self._objects if kind == AUTHORIZATION]
+
+    @property
+    def transactions(self):
+        """New transactions seen so far, oldest first"""
+        with self._condition:
+            return [obj for kind, obj in self._objects if kind == TRANSACTION]
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def subscribe(self, callback):
+        """
+        Call `callback(kind, obj)` for every new authorization or transaction.
+
+        `kind` is AUTHORIZATION or TRANSACTION. Callbacks run on the monitor
+        (or webhook) thread and should return quickly.
+        """
+        with self._condition:
+            self._subscribers.append(callback)
+
+    def start(self):
+        """
+        Record the card's current state and start watching it.
+
+        Raises:
+            stripe.error.StripeError: If the initial state cannot be read
+        """
+        if self.running:
+            return self
+
+        self.started_at = time.time()
+        if not self._primed:
+            executor = self._fetch_executor()
+            primes = [executor.submit(self._auth_poller.prime), executor.submit(self._tx_poller.prime)]
+            for future in primes:
+                future.result()
+            self._primed = True
+
+        interval = self.interval
+        if self.use_webhooks:
+            self._webhook_router = shared_webhook_router()
+        if self._webhook_router:
+            self._webhook_router.subscribe(self.card_id, self._on_webhook_authorizations, self._on_webhook_transactions)
+            interval = max(interval, FALLBACK_POLL_INTERVAL)
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        """
+        Stop watching, after one last poll for activity that arrived late.
+
+        The last poll is skipped if a tick is still running after `timeout`
+        seconds, so it never races that tick's pollers.
+        """
+        self._stop_event.set()
+        ticking = False
+        if self._thread:
+            self._thread.join(timeout=timeout)
+            ticking = self._thread.is_alive()
+            self._thread = None
+        if self._webhook_router:
+            self._webhook_router.unsubscribe(self.card_id, self._on_webhook_authorizations, self._on_webhook_transactions)
+            self._webhook_router = None
+        if ticking:
+            print(f"⚠️  Monitor for {self.card_id} still polling after {timeout}s; skipping the final poll")
+        elif self._primed:
+            self.poll()
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def poll(self):
+        """
+        Poll the card once and deliver anything not already seen.
+
+        Authorizations and transactions are fetched concurrently; the tick's
+        latency, each call's latency and the calls that failed are appended
+        to `tick_timings`, and `failed_ticks` counts ticks with a failure.
+        """
+        started = time.time()
+        tick_start = time.perf_counter()
+        executor = self._fetch_executor()
+        auth_future = executor.submit(_timed, self._auth_poller.poll)
+        tx_future = executor.submit(_timed, self._tx_poller.poll)
+        auths, auth_seconds = auth_future.result()
+        txs, tx_seconds = tx_future.result()
+        self._record_tick(started, time.perf_counter() - tick_start, auth_seconds, tx_seconds, auths, txs)
+
+        # None means the fetch failed, which must not count as "no activity"
+        if auths is not None:
+            self._on_authorizations(auths)
+        if txs is not None:
+            self._on_transactions(txs)
+
+    @property
+    def last_tick(self):
+        """Timings of the most recent tick, or None before the first one"""
+        return self.tick_timings[-1] if self.tick_timings else None
+
+    def _fetch_executor(self):
+        # Both lists are fetched side by side on every tick
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix=f"monitor-{self.card_id}")
+        return self._executor
+
+    def _record_tick(self, started, tick_seconds, auth_seconds, tx_seconds, auths, txs):
+        self.tick_timings.append(_tick_record(started, tick_seconds, auth_seconds, tx_seconds, auths, txs))
+        if auths is None or txs is None:
+            self.failed_ticks += 1
+
+    def wait_for(self, predicate=None, timeout=None):
+        """
+        Block until an object matching `predicate(kind, obj)` has been seen.
+
+        Objects seen before the call count too. With no predicate, any new
+        authorization or transaction matches.
+
+        Returns:
+            The matching object, or None if the timeout expired first
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        checked = 0
+        with self._condition:
+            while True:
+                for kind, obj in self._objects[checked:]:
+                    if predicate is None or predicate(kind, obj):
+                        return obj
+                checked = len(self._objects)
+
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+
+    def _run(self, interval):
+        # Ticks start every `interval` seconds; a slow tick delays the next
+        # one instead of overlapping it
+        next_tick = time.monotonic() + interval
+        while not self._stop_event.wait(max(0, next_tick - time.monotonic())):
+            self.poll()
+            next_tick = max(next_tick + interval, time.monotonic())
+
+    def _on_authorizations(self, auths):
+        self._deliver(AUTHORIZATION, self.activity.authorizations(auths))
+
+    def _on_transactions(self, txs):
+        self._deliver(TRANSACTION, self.activity.transactions(txs))
+
+    def _on_webhook_authorizations(self, auths):
+        # Polled objects are stored by the pollers, pushed ones here
+        if self.store:
+            self.store.save(self._auth_poller.kind, auths)
+        self._on_authorizations(auths)
+
+    def _on_webhook_transactions(self, txs):
+        if self.store:
+            self.store.save(self._tx_poller.kind, txs)
+        self._on_transactions(txs)
+
+    def _deliver(self, kind, fresh):
+        if not fresh:
+            return
+        with self._condition:
+            self._objects.extend((kind, obj) for obj in fresh)
+            subscribers = list(self._subscribers)
+            self._condition.notify_all()
+        for obj in fresh:
+            for callback in subscribers:
+                callback(kind, obj)
+
+
+class AsyncCardMonitor:
+    """CardMonitor counterpart that polls on the running event loop"""
+
+    def __init__(self, client, card_id, interval=5, use_webhooks=True, report=True, store=None):
+        """
+        Args:
+            client: The AsyncStripe client shared with the rest of the loop
+            card_id (str): The Stripe issuing card ID
+            interval (int): Poll interval in seconds (raised to the fallback
+                interval while webhooks deliver events)
+            use_webhooks (bool): Subscribe to the shared webhook receiver
+                when STRIPE_WEBHOOK_SECRET is configured
+            report (bool): Print new activity as it is detected
+            store: Optional EventStore that persists everything seen
+        """
+        self.client = client
+        self.card_id = card_id
+        self.store = store
+        self.started_at = None
+        self.interval = interval
+        self.use_webhooks = use_webhooks
+        self.activity = NewActivity(report=report)
+
+        # Bound to the loop on first use, so wait_for() may be awaited before start()
+        self._condition = asyncio.Condition()
+        self._notify_tasks = set()
+        self._objects = []
+        self._subscribers = []
+        self._task = None
+        self._loop = None
+        self._webhook_router = None
+        self._primed = False
+        self._auth_poller = authorization_poller(card_id, store=store)
+        self._tx_poller = transaction_poller(card_id, store=store)
+        self.tick_timings = deque(maxlen=TIMING_HISTORY)
+        self.failed_ticks = 0
+
+    @property
+    def authorizations(self):
+        """New authorizations seen so far, oldest first"""
+        return [obj for kind, obj in self._objects if kind == AUTHORIZATION]
+
+    @property
+    def transactions(self):
+        """New transactions seen so far, oldest first"""
+        return [obj for kind, obj in self._objects if kind == TRANSACTION]
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def subscribe(self, callback):
+        """Call `callback(kind, obj)` for every new authorization or transaction"""
+        self._subscribers.append(callback)
+
+    async def start(self):
+        """
+        Record the card's current state and start watching it.
+
+        Raises:
+            stripe.error.StripeError: If the initial state cannot be read
+        """
+        if self.running:
+            return self
+
+        self.started_at = time.time()
+        self._loop = asyncio.get_running_loop()
+        if not self._primed:
+            await asyncio.gather(
+                self._auth_poller.prime_async(self.client),
+                self._tx_poller.prime_async(self.client),
+            )
+            self._primed = True
+
+        interval = self.interval
+        if self.use_webhooks:
+            self._webhook_router = shared_webhook_router()
+        if self._webhook_router:
+            # Deliveries arrive on the receiver's thread; hop onto the loop
+            self._webhook_router.subscribe(self.card_id, self._on_authorizations_threadsafe, self._on_transactions_threadsafe)
+            interval = max(interval, FALLBACK_POLL_INTERVAL)
+
+        self._task = asyncio.create_task(self._run(interval))
+        return self
+
+    async def stop(self):
+        """Stop watching, after one last poll for activity that arrived late"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._webhook_router:
+            self._webhook_router.unsubscribe(self.card_id, self._on_authorizations_threadsafe, self._on_transactions_threadsafe)
+            self._webhook_router = None
+        if self._primed:
+            await self.poll()
+        if self._notify_tasks:
+            await asyncio.gather(*self._notify_tasks, return_exceptions=True)
+
+    async def poll(self):
+        """Poll the card once, fetching both lists concurrently and timing the tick"""
+        started = time.time()
+        tick_start = time.perf_counter()
+        (auths, auth_seconds), (txs, tx_seconds) = await asyncio.gather(
+            _timed_async(self._auth_poller.poll_async(self.client)),
+            _timed_async(self._tx_poller.poll_async(self.client)),
+        )
+        self.tick_timings.append(
+            _tick_record(started, time.perf_counter() - tick_start, auth_seconds, tx_seconds, auths, txs)
+        )
+        if auths is None or txs is None:
+            self.failed_ticks += 1
+        if auths is not None:
+            self._on_authorizations(auths)
+        if txs is not None:
+            self._on_transactions(txs)
+
+    async def wait_for(self, predicate=None, timeout=None):
+        """
+        Wait until an object matching `predicate(kind, obj)` has been seen.
+
+        Returns:
+            The matching object, or None if the timeout expired first
+        """
+        checked = 0
+
+        async def first_match():
+            nonlocal checked
+            async with self._condition:
+                while True:
+                    for kind, obj in self._objects[checked:]:
+                        if predicate is None or predicate(kind, obj):
+                            return obj
+                    checked = len(self._objects)
+                    await self._condition.wait()
+
+        try:
+            return await asyncio.wait_for(first_match(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    @property
+    def last_tick(self):
+        """Timings of the most recent tick, or None before the first one"""
+        return self.tick_timings[-1] if self.tick_timings else None
+
+    async def _run(self, interval):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time() + interval
+        while True:
+            await asyncio.sleep(max(0, next_tick - loop.time()))
+            await self.poll()
+            next_tick = max(next_tick + interval, loop.time())
+
+    def _on_authorizations(self, auths):
+        self._deliver(AUTHORIZATION, self.activity.authorizations(auths))
+
+    def _on_transactions(self, txs):
+        self._deliver(TRANSACTION, self.activity.transactions(txs))
+
+    def _on_authorizations_threadsafe(self, auths):
+        if self.store:
+            self.store.save(self._auth_poller.kind, auths)
+        self._loop.call_soon_threadsafe(self._on_authorizations, auths)
+
+    def _on_transactions_threadsafe(self, txs):
+        if self.store:
+            self.store.save(self._tx_poller.kind, txs)
+        self._loop.call_soon_threadsafe(self._on_transactions, txs)
+
+    def _deliver(self, kind, fresh):
+        if not fresh:
+            return
+        self._objects.extend((kind, obj) for obj in fresh)
+        # Keep a reference until the waiters are woken; the loop holds only a weak one
+        task = asyncio.ensure_future(self._notify())
+        self._notify_tasks.add(task)
+        task.add_done_callback(self._notify_tasks.discard)
+        for obj in fresh:
+            for callback in self._subscribers:
+                callback(kind, obj)
+
+    async def _notify(self):
+        async with self._condition:
+            self._condition.notify_all()
@@ -0,0 +1,181 @@
+"""
+Incremental polling of issuing authorizations and transactions for a card.
+
+Stripe lists objects newest first, so instead of re-listing the last few
+objects every tick and diffing IDs, a poller remembers the newest ID it has
+seen and asks only for objects created after it (`ending_before`). The list
+is auto-paginated, so a burst larger than one page is never dropped, and an
+idle card costs a single empty page per tick.
+
+With an EventStore attached, every fetched object is persisted and the
+cursor is resumed from the store on startup, so a restarted monitor neither
+re-reports nor misses objects and skips the baseline listing. Objects are
+listed once, so refresh() re-fetches the stored ones that are still pending
+before the store is asked for their status.
+
+Polls run at INTERACTIVE priority in the shared rate-limit scheduler, and a
+failed poll returns None rather than an empty list, so callers can tell a
+quiet card from one they could not check.
+"""
+import asyncio
+import stripe
+from stripe_scheduler import BULK, INTERACTIVE, request_priority
+
+
+class IncrementalPoller:
+    """Fetch only the objects created on a card since the previous poll"""
+
+    def __init__(self, resource, card_id, page_size=100, store=None, priority=INTERACTIVE):
+        """
+        Args:
+            resource: A listable Stripe resource, e.g. stripe.issuing.Authorization
+            card_id (str): The Stripe issuing card ID
+            page_size (int): Objects per page when catching up after a burst
+            store: Optional EventStore to persist objects and the cursor in
+            priority: Scheduler priority of the polls (stripe_scheduler.INTERACTIVE or BULK)
+        """
+        self.resource = resource
+        self.card_id = card_id
+        self.page_size = page_size
+        self.store = store
+        self.priority = priority
+        self.cursor = None
+        self.last_error = None
+
+    @property
+    def kind(self):
+        """The Stripe object type polled, e.g. issuing.authorization"""
+        return self.resource.OBJECT_NAME
+
+    def prime(self, backfill_since=None):
+        """
+        Treat everything already on the card as seen.
+
+        With a store that already holds a cursor for the card, polling
+        resumes from it without any API call, so objects created while
+        nothing was watching are still delivered.
+
+        Args:
+            backfill_since (int): When starting without a stored cursor, also
+                store every object created at or after this Unix time
+
+        Returns:
+            The ID of the newest existing object, or None if the card has none
+        """
+        if self._resume():
+            return self.cursor
+        if backfill_since is not None and self.store:
+            params = {"card": self.card_id, "created": {"gte": backfill_since}, "limit": self.page_size}
+            with request_priority(BULK):
+                recent = list(self.resource.list(**params).auto_paging_iter())
+            if recent:
+                return self._set_baseline(recent)
+        with request_priority(self.priority):
+            latest = self.resource.list(card=self.card_id, limit=1)
+        return self._set_baseline(latest.data)
+
+    async def prime_async(self, client, backfill_since=None):
+        """prime() through an AsyncStripe client"""
+        if self._resume():
+            return self.cursor
+        if backfill_since is not None and self.store:
+            recent = await client.list_all(self.resource, priority=BULK, card=self.card_id,
+                                           created={"gte": backfill_since}, limit=self.page_size)
+            if recent:
+                return self._set_baseline(recent)
+        latest = await client.list(self.resource, card=self.card_id, limit=1, priority=self.priority)
+        return self._set_baseline(latest.data)
+
+    def poll(self):
+        """
+        Return the objects created since the last poll, oldest first.
+
+        On a Stripe error (including rate limiting that outlasted the
+        scheduler's retries) None is returned, the error is kept in
+        `last_error` and the cursor is left alone, so the missed objects are
+        picked up by the next successful poll.
+        """
+        params = self._poll_params()
+        try:
+            with request_priority(self.priority):
+                new_objects = list(self.resource.list(**params).auto_paging_iter())
+        except stripe.error.StripeError as e:
+            return self._failed(e)
+        return self._advance(new_objects)
+
+    async def poll_async(self, client):
+        """poll() through an AsyncStripe client"""
+        params = self._poll_params()
+        try:
+            new_objects = await client.list_all(self.resource, priority=self.priority, **params)
+        except (stripe.error.StripeError, asyncio.TimeoutError) as e:
+            return self._failed(e)
+        return self._advance(new_objects)
+
+    def refresh(self):
+        """
+        Re-fetch the stored objects whose status may have changed since they were saved.
+
+        Returns:
+            The refreshed objects, or None if Stripe could not be reached
+        """
+        if not self.store:
+            return []
+        refreshed = []
+        try:
+            with request_priority(self.priority):
+                for object_id in self.store.unsettled(self.card_id, self.kind):
+                    refreshed.append(self.resource.retrieve(object_id))
+        except stripe.error.StripeError as e:
+            return self._failed(e)
+        finally:
+            self.store.save(self.kind, refreshed)
+        return refreshed
+
+    def _failed(self, error):
+        self.last_error = error
+        print(f"❌ Error polling {self.resource.__name__} for card {self.card_id}: {error!r}")
+        return None
+
+    def _resume(self):
+        if self.store:
+            self.cursor = self.store.cursor(self.card_id, self.kind)
+        return self.cursor is not None
+
+    def _set_baseline(self, newest_first):
+        if newest_first:
+            self.cursor = newest_first[0].id
+            if self.store:
+                self.store.save(self.kind, newest_first)
+                self.store.set_cursor(self.card_id, self.kind, self.cursor)
+        return self.cursor
+
+    def _poll_params(self):
+        params = {"card": self.card_id, "limit": self.page_size}
+        if self.cursor:
+            # With ending_before the iterator walks towards newer pages
+            # and yields each page reversed, i.e. oldest first
+            params["ending_before"] = self.cursor
+        return params
+
+    def _advance(self, new_objects):
+        self.last_error = None
+        if not self.cursor:
+            # Nothing seen yet: every object on the card is new, newest first
+            new_objects.reverse()
+        if new_objects:
+            self.cursor = new_objects[-1].id
+            if self.store:
+                self.store.save(self.kind, new_objects)
+                self.store.set_cursor(self.card_id, self.kind, self.cursor)
+        return new_objects
+
+
+def authorization_poller(card_id, page_size=100, store=None):
+    """Create an incremental poller for a card's authorizations"""
+    return IncrementalPoller(stripe.issuing.Authorization, card_id, page_size, store)
+
+
+def transaction_poller(card_id, page_size=100, store=None):
+    """Create an incremental poller for a card's transactions"""
+    return IncrementalPoller(stripe.issuing.Transaction, card_id, page_size, store)
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Warm pool of pre-provisioned virtual cards for donation runs.
+
+The pool keeps a configurable number of ready cards in a small SQLite
+database (card_pool.db unless CARD_POOL_DB points elsewhere), so any number
+of processes can lease from it safely. A run leases a card, whose profile
+was fetched when the card was added, and returns it afterwards; a card is
+retired (deactivated) once it has been used `max_uses` times or when the
+run failed. A background thread, or `card_pool.py serve`, tops the pool up
+again, so starting a run costs no Stripe provisioning or retrieval calls.
+
+Each card's profile is fetched once when the card is added. With
+CARD_CACHE_KEY set it is kept in the card's pool row, encrypted like the
+profile disk cache, so the process that leases the card rebuilds it from the
+database; without a key only the card ID is kept and the lease fetches the
+profile. The pool only ever holds test-mode cards (require_stripe() refuses
+live keys).
+
+    pool = CardPool(size=5)
+    with pool.leased() as profile:
+        run_donation(profile.card_id)
+"""
+import os
+import sys
+import time
+import uuid
+import sqlite3
+import argparse
+import threading
+from contextlib import contextmanager
+import stripe
+from bootstrap import require_stripe
+from card_profiles import shared_profiles
+from create_cardholder import get_or_create_cardholder
+from create_virtual_card import create_card
+
+DEFAULT_PATH = "card_pool.db"
+DEFAULT_SIZE = 3
+# $75.00, enough for one Red Cross donation per day
+DEFAULT_SPENDING_LIMIT = 7500
+# Leases older than this are assumed abandoned and their cards retired
+LEASE_TIMEOUT = 30 * 60
+REFILL_INTERVAL = 30
+
+READY = "ready"
+LEASED = "leased"
+RETIRED = "retired"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pool_cards (
+    id TEXT PRIMARY KEY,
+    cardholder_id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    uses INTEGER NOT NULL DEFAULT 0,
+    added_at INTEGER NOT NULL,
+    leased_at INTEGER,
+    profile TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_pool_cards_state ON pool_cards (state, added_at);
+"""
+
+
+class CardPool:
+    """Lease, return and replenish pre-provisioned virtual cards"""
+
+    def __init__(self, size=DEFAULT_SIZE, path=None, max_uses=1, spending_limit=DEFAULT_SPENDING_LIMIT):
+        """
+        Args:
+            size (int): Number of ready cards to keep
+            path (str): Pool database (defaults to $CARD_POOL_DB or card_pool.db)
+            max_uses (int): Leases after which a card is retired
+            spending_limit (int): Daily spending limit of new cards in cents
+        """
+        self.size = size
+        self.path = path or os.getenv("CARD_POOL_DB", DEFAULT_PATH)
+        self.max_uses = max_uses
+        self.spending_limit = spending_limit
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.executescript(SCHEMA)
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(pool_cards)")]
+            if "profile" not in columns:
+                # Pools created before profiles were kept in the row
+                self._db.execute("ALTER TABLE pool_cards ADD COLUMN profile TEXT")
+            # Drop profiles an earlier version stored unencrypted
+            self._db.execute("UPDATE pool_cards SET profile = NULL WHERE profile LIKE '{%'")
+        self._refill_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def close(self):
+        self.stop()
+        with self._lock:
+            self._db.close()
+
+    def counts(self):
+        """Return the number of cards in each state"""
+        with self._lock:
+            rows = self._db.execute("SELECT state, COUNT(*) FROM pool_cards GROUP BY state").fetchall()
+        counts = {READY: 0, LEASED: 0, RETIRED: 0}
+        counts.update(rows)
+        return counts
+
+    def _add_card(self, leased=False):
+        """
+        Provision a card and add it to the pool, ready or already leased.
+
+        Returns:
+            (card_id, profile), or None if no card could be provisioned
+        """
+        # All pool cards share the standard test cardholder, cached by the registry
+        cardholder_id = get_or_create_cardholder()
+        if not cardholder_id:
+            return None
+        card = create_card(cardholder_id, self.spending_limit, idempotency_key=f"card-pool-{uuid.uuid4()}")
+        if not card:
+            return None
+        profile = sealed = None
+        try:
+            # Prefetch the profile so leasing the card needs no API call
+            profile = shared_profiles().get(card.id)
+        except stripe.error.StripeError as e:
+            print(f"⚠️  Could not prefetch the profile of {card.id}: {e}")
+        disk_cache = shared_profiles().disk_cache
+        if profile and disk_cache:
+            sealed = disk_cache.encrypt(profile)
+        now = int(time.time())
+        with self._lock, self._db:
+            self._db.execute(
+                """
+                INSERT INTO pool_cards (id, cardholder_id, state, uses, added_at, leased_at, profile)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    card.id, cardholder_id, LEASED if leased else READY, int(leased), now,
+                    now if leased else None, sealed,
+                ),
+            )
+        return card.id, profile
+
+    def refill(self):
+        """
+        Retire abandoned leases and provision cards until `size` are ready.
+
+        Returns:
+            The number of cards added
+        """
+        with self._refill_lock:
+            self._reclaim_stale()
+            added = 0
+            while self.counts()[READY] < self.size:
+                if not self._add_card():
+                    break
+                added += 1
+            return added
+
+    def _reclaim_stale(self):
+        cutoff = int(time.time()) - LEASE_TIMEOUT
+        with self._lock:
+            stale = [row[0] for row in self._db.execute(
+                "SELECT id FROM pool_cards WHERE state = ? AND leased_at < ?", (LEASED, cutoff)
+            )]
+        for card_id in stale:
+            print(f"⚠️  Lease of {card_id} expired, retiring the card")
+            self.retire(card_id)
+
+    def lease(self):
+        """
+        Take a ready card out of the pool.
+
+        Falls back to provisioning a card on the spot when none is ready.
+
+        Returns:
+            The card's CardProfile, or None if no card could be provisioned or
+            its profile could not be retrieved (the card then stays in the pool)
+        """
+        with self._lock, self._db:
+            row = self._db.execute(
+                """
+                UPDATE pool_cards SET state = ?, leased_at = ?, uses = uses + 1
+                WHERE id = (SELECT id FROM pool_cards WHERE state = ? ORDER BY added_at LIMIT 1)
+                RETURNING id, profile
+                """,
+                (LEASED, int(time.time()), READY),
+            ).fetchone()
+        # Top the pool back up without making this run wait for it
+        self._wake.set()
+
+        if not row:
+            print("⚠️  Card pool is empty, provisioning a card for this run")
+            # Added as leased, so no other process can take it first
+            added = self._add_card(leased=True)
+            if not added:
+                return None
+            card_id, profile = added
+        else:
+            disk_cache = shared_profiles().disk_cache
+            card_id, profile = row[0], disk_cache.decrypt(row[1]) if row[1] and disk_cache else None
+        if profile:
+            return profile
+        # The profile could not be prefetched or kept, e.g. without CARD_CACHE_KEY
+        try:
+            return shared_profiles().get(card_id)
+        except stripe.error.StripeError as e:
+            print(f"❌ Could not retrieve the profile of {card_id}: {e}")
+            self._unlease(card_id)
+            return None
+
+    def _unlease(self, card_id):
+        """Put a card leased by lease() back as it was, unused"""
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE pool_cards SET state = ?, leased_at = NULL, uses = uses - 1 WHERE id = ? AND state = ?",
+                (READY, card_id, LEASED),
+            )
+
+    def release(self, card_id, retire=False):
+        """
+        Return a leased card, retiring it if asked to or once it is used up.
+
+        Returns:
+            True if the card went back into the pool
+        """
+        with self._lock:
+            row = self._db.execute("SELECT uses FROM pool_cards WHERE id = ?", (card_id,)).fetchone()
+        if row is None:
+            return False
+        if retire or row[0] >= self.max_uses:
+            self.retire(card_id)
+            return False
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE pool_cards SET state = ?, leased_at = NULL WHERE id = ? AND state = ?",
+                (READY, card_id, LEASED),
+            )
+        return True
+
+    def retire(self, card_id):
+        """Deactivate a card and take it out of circulation"""
+        try:
+            stripe.issuing.Card.modify(card_id, status="inactive")
+        except stripe.error.StripeError as e:
+            print(f"⚠️  Could not deactivate {card_id}: {e}")
+        shared_profiles().invalidate(card_id)
+        with self._lock, self._db:
+            self._db.execute("UPDATE pool_cards SET state = ? WHERE id = ?", (RETIRED, card_id))
+        self._wake.set()
+
+    @contextmanager
+    def leased(self):
+        """Lease a card for the block; it is retired if the block raises"""
+        profile = self.lease()
+        if profile is None:
+            raise RuntimeError("No card could be leased from the pool")
+        try:
+            yield profile
+        except BaseException:
+            self.release(profile.card_id, retire=True)
+            raise
+        self.release(profile.card_id)
+
+    def start(self, interval=REFILL_INTERVAL):
+        """Refill the pool on a background thread now and every `interval` seconds"""
+        if self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        if self._thread:
+            self._stop.set()
+            self._wake.set()
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self, interval):
+        while not self._stop.is_set():
+            try:
+                self.refill()
+            except (stripe.error.StripeError, sqlite3.Error) as e:
+                print(f"❌ Error refilling the card pool: {e}")
+            self._wake.wait(interval)
+            self._wake.clear()
+
+
+if __name__ == "__main__":
+    require_stripe()
+    parser = argparse.ArgumentParser(description="Manage the warm pool of virtual cards")
+    parser.add_argument("command", choices=["status", "fill", "serve", "lease", "release"])
+    parser.add_argument("card_id", nargs="?", help="Card to release")
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE, help="Ready cards to keep")
+    parser.add_argument("--retire", action="store_true", help="Retire the released card")
+    args = parser.parse_args()
+
+    pool = CardPool(size=args.size)
+    if args.command == "fill":
+        print(f"Added {pool.refill()} card(s)")
+    elif args.command == "serve":
+        pool.start()
+        print(f"Keeping {args.size} card(s) ready, press Ctrl+C to stop")
+        try:
+            while True:
+                time.sleep(REFILL_INTERVAL)
+                print(pool.counts())
+        except KeyboardInterrupt:
+            print("\nCard pool refill stopped")
+    elif args.command == "lease":
+        profile = pool.lease()
+        if not profile:
+            sys.exit(1)
+        print(profile.card_id)
+    elif args.command == "release":
+        if not args.card_id:
+            parser.error("release needs a card ID")
+        returned = pool.release(args.card_id, retire=args.retire)
+        print(f"{args.card_id} {'returned to the pool' if returned else 'retired'}")
+    print(pool.counts())
+    pool.close()
@@ -0,0 +1,296 @@
+"""
+Cached, typed card profiles for the donation and form-filling flows.
+
+A CardProfile holds the cardholder and card fields the flows fill into
+checkout forms, built once from a card retrieved with its number and CVC.
+Profiles are cached in process for a few minutes, so repeated runs with the
+same card skip the `Card.retrieve` round trip entirely. With CARD_CACHE_KEY
+set (a Fernet key, requires the `cryptography` package) they are also kept
+encrypted on disk, so the next process starts warm too.
+
+Cached profiles are dropped when the card is changed through
+CardProfileService.update_card, in every process sharing the disk cache, or
+when an `issuing_card.updated` webhook arrives. Webhook invalidation only
+works in a process that runs the webhook router (issuing_webhook.py); the
+command-line scripts don't, so a card changed or canceled elsewhere can be
+served from cache until its entry expires, which is why the disk TTL is
+short.
+
+    profile = shared_profiles().get(card_id)
+    page.fill("input#cardnumber", profile.number)
+"""
+import os
+import json
+import time
+import threading
+import stripe
+from issuing_webhook import add_card_update_listener
+
+# Seconds a profile is served from memory / from the disk cache; both bound
+# how long a card changed outside this process can be served stale
+DEFAULT_TTL = 15 * 60
+DEFAULT_DISK_TTL = 60 * 60
+DEFAULT_DISK_PATH = ".card_profiles.enc"
+
+
+class CardProfile:
+    """The fields of a card and its cardholder that checkout forms ask for"""
+
+    __slots__ = (
+        "card_id", "first_name", "last_name", "email", "phone",
+        "line1", "city", "state", "postal_code", "country",
+        "number", "exp_month", "exp_year", "cvc", "brand", "currency",
+    )
+
+    # Form field types (as named by formfiller's field mapping) -> attribute
+    FIELD_TYPES = {
+        "name": "full_name",
+        "email": "email",
+        "phone": "phone",
+        "address": "line1",
+        "city": "city",
+        "state": "state",
+        "zipcode": "postal_code",
+        "card": "number",
+        "expiry": "expiry",
+        "cvv": "cvc",
+    }
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    @classmethod
+    def from_card(cls, card):
+        """Build a profile from a card retrieved with expand=['number', 'cvc']"""
+        cardholder = card.cardholder
+        first_name, _, last_name = cardholder.name.partition(" ")
+        address = cardholder.billing.address
+        return cls(
+            card_id=card.id,
+            first_name=first_name,
+            last_name=last_name,
+            email=cardholder.email,
+            phone=cardholder.phone_number,
+            line1=address.line1,
+            city=address.city,
+            state=address.state,
+            postal_code=address.postal_code,
+            country=address.country,
+            number=card.number,
+            exp_month=card.exp_month,
+            exp_year=card.exp_year,
+            cvc=card.cvc,
+            brand=card.brand,
+            currency=card.currency,
+        )
+
+    @property
+    def full_name(self):
+        return f"{self.first_name} {self.last_name}".strip()
+
+    @property
+    def exp_year_short(self):
+        """Two-digit expiry year, e.g. "28" for 2028"""
+        return str(self.exp_year)[-2:]
+
+    @property
+    def expiry(self):
+        """Expiry as MM/YY"""
+        return f"{self.exp_month:02d}/{self.exp_year_short}"
+
+    def field(self, field_type):
+        """Return the value for a form field type such as "email" or "cvv", or None"""
+        attribute = self.FIELD_TYPES.get(field_type)
+        return getattr(self, attribute) if attribute else None
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def masked(self):
+        """The profile as a dict with the card number and CVC masked, for printing"""
+        info = self.to_dict()
+        if info["number"]:
+            info["number"] = f"****-****-****-{info['number'][-4:]}"
+        if info["cvc"]:
+            info["cvc"] = "***"
+        return info
+
+    def __repr__(self):
+        # Never let the full number or CVC end up in a log line
+        return f"CardProfile({self.card_id}, {self.brand} ****{(self.number or '')[-4:]}, {self.expiry})"
+
+
+class EncryptedProfileCache:
+    """Fernet-encrypted file of card profiles, keyed by card ID"""
+
+    def __init__(self, key, path=DEFAULT_DISK_PATH, ttl=DEFAULT_DISK_TTL):
+        """
+        Args:
+            key (str): A Fernet key, e.g. from Fernet.generate_key()
+            path (str): The cache file
+            ttl (int): Seconds an entry stays valid
+        """
+        # Optional dependency, only needed when the disk cache is enabled
+        from cryptography.fernet import Fernet
+
+        self._fernet = Fernet(key)
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+    def _load(self):
+        from cryptography.fernet import InvalidToken
+
+        try:
+            with open(self.path, "rb") as f:
+                return json.loads(self._fernet.decrypt(f.read()))
+        except FileNotFoundError:
+            return {}
+        except (InvalidToken, ValueError):
+            print(f"⚠️  Ignoring unreadable card profile cache {self.path}")
+            return {}
+
+    def _store(self, entries):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self._fernet.encrypt(json.dumps(entries).encode()))
+        os.replace(tmp_path, self.path)
+
+    def get(self, card_id):
+        """Return the cached profile for a card, or None if missing or expired"""
+        with self._lock:
+            entry = self._load().get(card_id)
+        if not entry or time.time() - entry["fetched_at"] > self.ttl:
+            return None
+        return CardProfile(**entry["profile"])
+
+    def put(self, profile):
+        with self._lock:
+            entries = self._load()
+            entries[profile.card_id] = {"fetched_at": time.time(), "profile": profile.to_dict()}
+            self._store(entries)
+
+    def invalidate(self, card_id):
+        with self._lock:
+            entries = self._load()
+            if entries.pop(card_id, None) is not None:
+                self._store(entries)
+
+    def encrypt(self, profile):
+        """The profile as a Fernet token, for keeping it elsewhere (e.g. the card pool)"""
+        return self._fernet.encrypt(json.dumps(profile.to_dict()).encode()).decode()
+
+    def decrypt(self, token):
+        """The profile of an encrypt() token, or None if this key can't read it"""
+        from cryptography.fernet import InvalidToken
+
+        try:
+            return CardProfile(**json.loads(self._fernet.decrypt(token.encode())))
+        except (InvalidToken, ValueError):
+            return None
+
+
+class CardProfileService:
+    """Serve card profiles from memory, then disk, then the Stripe API"""
+
+    def __init__(self, ttl=DEFAULT_TTL, disk_cache=None):
+        """
+        Args:
+            ttl (int): Seconds a profile is served from memory
+            disk_cache: Optional EncryptedProfileCache shared across runs
+        """
+        self.ttl = ttl
+        self.disk_cache = disk_cache
+        self._lock = threading.Lock()
+        self._profiles = {}
+        self.hits = 0
+        self.misses = 0
+        add_card_update_listener(self.invalidate)
+
+    def _cached(self, card_id):
+        with self._lock:
+            entry = self._profiles.get(card_id)
+            if entry and time.monotonic() - entry[0] <= self.ttl:
+                self.hits += 1
+                return entry[1]
+        profile = self.disk_cache.get(card_id) if self.disk_cache else None
+        if profile:
+            self._remember(profile, persist=False)
+            with self._lock:
+                self.hits += 1
+        return profile
+
+    def _remember(self, profile, persist=True):
+        with self._lock:
+            self._profiles[profile.card_id] = (time.monotonic(), profile)
+        if persist and self.disk_cache:
+            self.disk_cache.put(profile)
+        return profile
+
+    def _fetched(self, card):
+        with self._lock:
+            self.misses += 1
+        return self._remember(CardProfile.from_card(card))
+
+    def get(self, card_id):
+        """
+        Return the profile of a card.
+
+        Raises:
+            stripe.error.StripeError: If the card has to be fetched and can't be
+        """
+        return self._cached(card_id) or self._fetched(
+            stripe.issuing.Card.retrieve(card_id, expand=["number", "cvc"])
+        )
+
+    async def get_async(self, card_id, client):
+        """get() through an AsyncStripe client"""
+        return self._cached(card_id) or self._fetched(
+            await client.retrieve_card(card_id, expand=["number", "cvc"])
+        )
+
+    def update_card(self, card_id, **params):
+        """
+        Update a card and refresh its cached profile.
+
+        Args:
+            card_id (str): The Stripe issuing card ID
+            **params: Parameters for stripe.issuing.Card.modify
+
+        Returns:
+            The updated card
+        """
+        self.invalidate(card_id)
+        card = stripe.issuing.Card.modify(card_id, expand=["number", "cvc"], **params)
+        self._fetched(card)
+        return card
+
+    def invalidate(self, card_id):
+        """Forget the cached profile of a card"""
+        with self._lock:
+            self._profiles.pop(card_id, None)
+        if self.disk_cache:
+            self.disk_cache.invalidate(card_id)
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_profiles():
+    """
+    Return the process-wide CardProfileService.
+
+    The encrypted disk cache is enabled when CARD_CACHE_KEY is set, at the
+    path in CARD_CACHE_PATH (default .card_profiles.enc).
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            key = os.getenv("CARD_CACHE_KEY")
+            disk_cache = None
+            if key:
+                disk_cache = EncryptedProfileCache(key, os.getenv("CARD_CACHE_PATH", DEFAULT_DISK_PATH))
+            _shared = CardProfileService(disk_cache=disk_cache)
+        return _shared
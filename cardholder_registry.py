@@ -0,0 +1,131 @@
+"""
+Reuse existing cardholders instead of creating a duplicate on every run.
+
+Cardholders are identified by email and name. The registry first looks in a
+local cache file (.cardholders.json unless CARDHOLDER_CACHE points
+elsewhere), then asks Stripe for an active cardholder with that email, and
+only creates one when neither has it. In the common case providing a
+cardholder therefore costs no API writes and, once cached, no API calls.
+
+A cached ID is not checked against Stripe. When a card create is rejected
+because of its cardholder (deactivated or deleted since), the creator calls
+forget() so the next lookup finds or creates an active one.
+
+    cardholder_id = shared_registry().get_or_create(name, email, create)
+"""
+import os
+import json
+import threading
+import stripe
+
+DEFAULT_PATH = ".cardholders.json"
+
+
+def identity(name, email):
+    """The cache key of a cardholder"""
+    return f"{email.strip().lower()}|{name.strip().lower()}"
+
+
+class CardholderRegistry:
+    """Local cache of cardholder IDs by identity, with a Stripe lookup fallback"""
+
+    def __init__(self, path=None):
+        """
+        Args:
+            path (str): Cache file (defaults to $CARDHOLDER_CACHE or .cardholders.json)
+        """
+        self.path = path or os.getenv("CARDHOLDER_CACHE", DEFAULT_PATH)
+        self._lock = threading.Lock()
+        # One lock per identity, so concurrent callers never both create
+        self._identity_locks = {}
+        try:
+            with open(self.path) as f:
+                self._ids = json.load(f)
+        except FileNotFoundError:
+            self._ids = {}
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._ids, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def remember(self, name, email, cardholder_id):
+        with self._lock:
+            self._ids[identity(name, email)] = cardholder_id
+            self._save()
+
+    def forget(self, cardholder_id):
+        """Drop a cached cardholder, e.g. after it was deactivated"""
+        with self._lock:
+            stale = [key for key, cached_id in self._ids.items() if cached_id == cardholder_id]
+            for key in stale:
+                del self._ids[key]
+            if stale:
+                self._save()
+
+    def find(self, name, email):
+        """
+        Return the ID of an active cardholder with this email and name, or None.
+
+        A cached ID is returned as is; see forget().
+
+        Raises:
+            stripe.error.StripeError: If the remote lookup fails
+        """
+        with self._lock:
+            cardholder_id = self._ids.get(identity(name, email))
+        if cardholder_id:
+            return cardholder_id
+
+        matches = stripe.issuing.Cardholder.list(email=email, status="active", limit=100)
+        for cardholder in matches.auto_paging_iter():
+            if cardholder.name.strip().lower() == name.strip().lower():
+                self.remember(name, email, cardholder.id)
+                return cardholder.id
+        return None
+
+    def get_or_create(self, name, email, create):
+        """
+        Return an existing cardholder's ID, creating the cardholder if needed.
+
+        Args:
+            name (str): The cardholder's name
+            email (str): The cardholder's email
+            create: Called with no arguments when no cardholder exists; returns
+                the new cardholder, or None if it could not be created
+
+        Returns:
+            The cardholder ID, or None if it had to be created and creation failed
+        """
+        with self._lock:
+            identity_lock = self._identity_locks.setdefault(identity(name, email), threading.Lock())
+        with identity_lock:
+            cardholder_id = self.find(name, email)
+            if cardholder_id:
+                return cardholder_id
+            cardholder = create()
+            if not cardholder:
+                return None
+            self.remember(name, email, cardholder.id)
+            return cardholder.id
+
+
+def is_cardholder_error(error):
+    """Whether a Stripe error rejects the request because of its cardholder"""
+    return isinstance(error, stripe.error.InvalidRequestError) and (
+        getattr(error, "param", None) == "cardholder" or "cardholder" in str(error).lower()
+    )
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_registry():
+    """Return the process-wide CardholderRegistry"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = CardholderRegistry()
+        return _shared
@@ -1,129 +1,131 @@
 #!/usr/bin/env python3
-import os
-import time
+import json
 import stripe
 import sys
 import datetime
-from dotenv import load_dotenv
+from bootstrap import require_stripe
+from card_poller import authorization_poller, transaction_poller
+from event_store import EventStore
 
-# Load environment variables
-load_dotenv()
 
-# Set up Stripe API key
-stripe_api_key = os.getenv("STRIPE_API_KEY")
+REDCROSS_MERCHANT = ("redcross", "red cross")
 
-# Validate that we're using a test API key
-if not stripe_api_key:
-    print("\n⚠️  No Stripe API key found in .env file. Please add your test API key.")
-    exit(1)
-elif not stripe_api_key.startswith("sk_test_"):
-    print("\n❌ ERROR: You must use a Stripe TEST API key (starts with sk_test_)")
-    exit(1)
 
-stripe.api_key = stripe_api_key
-print("✅ Using Stripe TEST mode")
-
-def check_card_authorizations(card_id):
+def sync_card_activity(card_id, store, since):
     """
-    Check for recent authorizations on the virtual card
+    Bring the local event store up to date for the card.
+
+    The first run backfills everything created since `since`; later runs
+    only fetch what was created after the newest object already stored, and
+    re-fetch the stored authorizations that were still pending.
+
+    Returns:
+        True if both lists were synced, False if the store may be stale
     """
+    synced = True
+    for poller in (authorization_poller(card_id, store=store), transaction_poller(card_id, store=store)):
+        try:
+            poller.prime(backfill_since=since)
+        except stripe.error.StripeError as e:
+            print(f"❌ Stripe error: {e}")
+            synced = False
+            continue
+        if poller.poll() is None or poller.refresh() is None:
+            synced = False
+    return synced
+
+
+def confirm_merchant(name):
+    if name and any(part in name.lower() for part in REDCROSS_MERCHANT):
+        print("✅ Confirmed Red Cross merchant")
+    else:
+        print(f"⚠️  Merchant name doesn't contain 'Red Cross': {name}")
+
+
+def show_card(card_id):
+    """Print the card's last 4 digits, as Stripe has them"""
     try:
-        # Get the card details
         card = stripe.issuing.Card.retrieve(card_id)
-        print(f"Card: {card.id} (Last 4: {card.last4})")
-        
-        # Get recent authorizations for this card
-        now = datetime.datetime.now()
-        one_hour_ago = int((now - datetime.timedelta(hours=1)).timestamp())
-        
-        authorizations = stripe.issuing.Authorization.list(
-            card=card_id,
-            created={
-                "gte": one_hour_ago
-            },
-            limit=5
-        )
-        
-        if not authorizations.data:
-            print("❌ No recent authorizations found for this card")
-            return None
-        
-        print(f"✅ Found {len(authorizations.data)} recent authorization(s)")
-        
-        # Get the most recent authorization
-        auth = authorizations.data[0]
-        print(f"Authorization ID: {auth.id}")
-        print(f"Merchant: {auth.merchant_data.name}")
-        print(f"Amount: ${auth.amount/100:.2f} {auth.currency.upper()}")
-        print(f"Status: {auth.status}")
-        print(f"Approved: {auth.approved}")
-        
-        if "redcross" in auth.merchant_data.name.lower() or "red cross" in auth.merchant_data.name.lower():
-            print("✅ Confirmed Red Cross merchant")
-        else:
-            print(f"⚠️  Merchant name doesn't contain 'Red Cross': {auth.merchant_data.name}")
-        
-        return auth
-            
     except stripe.error.StripeError as e:
         print(f"❌ Stripe error: {e}")
+        return
+    print(f"Card: {card.id} (Last 4: {card.last4})")
+
+
+def check_card_authorizations(card_id, store, since, offline=False):
+    """
+    Check for recent authorizations on the virtual card
+
+    Offline the status is the one last synced, so it is labelled as such.
+    """
+    authorizations = store.recent(card_id, "issuing.authorization", since=since)
+    if not authorizations:
+        print("❌ No recent authorizations found for this card")
         return None
 
-def check_card_transactions(card_id):
+    print(f"✅ Found {len(authorizations)} recent authorization(s)")
+
+    # Get the most recent authorization
+    auth = authorizations[0]
+    print(f"Authorization ID: {auth['id']}")
+    print(f"Merchant: {auth['merchant']}")
+    print(f"Amount: ${auth['amount']/100:.2f} {auth['currency'].upper()}")
+    as_of = " (as last synced)" if offline else ""
+    print(f"Status{as_of}: {auth['status']}")
+    print(f"Approved{as_of}: {bool(auth['approved'])}")
+    confirm_merchant(auth['merchant'])
+
+    return auth
+
+def check_card_transactions(card_id, store, since):
     """
     Check for recent transactions on the virtual card
     """
-    try:
-        # Get recent transactions for this card
-        now = datetime.datetime.now()
-        one_hour_ago = int((now - datetime.timedelta(hours=1)).timestamp())
-        
-        transactions = stripe.issuing.Transaction.list(
-            card=card_id,
-            created={
-                "gte": one_hour_ago
-            },
-            limit=5
-        )
-        
-        if not transactions.data:
-            print("❌ No recent transactions found for this card")
-            return None
-        
-        print(f"✅ Found {len(transactions.data)} recent transaction(s)")
-        
-        # Get the most recent transaction
-        tx = transactions.data[0]
-        print(f"Transaction ID: {tx.id}")
-        print(f"Type: {tx.type}")
-        print(f"Amount: ${tx.amount/100:.2f} {tx.currency.upper()}")
-        
-        if hasattr(tx, 'purchase_details') and tx.purchase_details:
-            if hasattr(tx.purchase_details, 'merchant') and tx.purchase_details.merchant:
-                print(f"Merchant: {tx.purchase_details.merchant.name}")
-                
-                if "redcross" in tx.purchase_details.merchant.name.lower() or "red cross" in tx.purchase_details.merchant.name.lower():
-                    print("✅ Confirmed Red Cross merchant")
-                else:
-                    print(f"⚠️  Merchant name doesn't contain 'Red Cross': {tx.purchase_details.merchant.name}")
-        
-        return tx
-            
-    except stripe.error.StripeError as e:
-        print(f"❌ Stripe error: {e}")
+    transactions = store.recent(card_id, "issuing.transaction", since=since)
+    if not transactions:
+        print("❌ No recent transactions found for this card")
         return None
 
-def monitor_payment_flow(card_id):
+    print(f"✅ Found {len(transactions)} recent transaction(s)")
+
+    # Get the most recent transaction
+    tx = transactions[0]
+    print(f"Transaction ID: {tx['id']}")
+    print(f"Type: {json.loads(tx['payload']).get('type')}")
+    print(f"Amount: ${tx['amount']/100:.2f} {tx['currency'].upper()}")
+    if tx['merchant']:
+        print(f"Merchant: {tx['merchant']}")
+        confirm_merchant(tx['merchant'])
+
+    return tx
+
+def monitor_payment_flow(card_id, offline=False):
     """
     Monitor the payment flow for the Red Cross donation
+
+    Args:
+        card_id: The Stripe issuing card ID
+        offline: Answer from the local event store without calling Stripe
     """
-    print("\n=== Checking for Card Authorizations ===")
-    auth = check_card_authorizations(card_id)
-    
-    print("\n=== Checking for Card Transactions ===")
-    tx = check_card_transactions(card_id)
+    store = EventStore()
+    try:
+        one_hour_ago = int((datetime.datetime.now() - datetime.timedelta(hours=1)).timestamp())
+        if offline:
+            print("Answering from the local event store only")
+        elif not sync_card_activity(card_id, store, one_hour_ago):
+            print("⚠️  Could not reach Stripe; answering from the local event store, which may be incomplete or out of date")
+
+        print("\n=== Checking for Card Authorizations ===")
+        if not offline:
+            show_card(card_id)
+        auth = check_card_authorizations(card_id, store, one_hour_ago, offline)
+        
+        print("\n=== Checking for Card Transactions ===")
+        tx = check_card_transactions(card_id, store, one_hour_ago)
+    finally:
+        store.close()
     
-    if auth and auth.approved:
+    if auth and auth['approved']:
         print("\n✅ The payment was authorized successfully")
         
         if tx:
@@ -139,7 +141,7 @@ def monitor_payment_flow(card_id):
             print("Try running this script again in a few minutes.")
     elif auth:
         print("\n❌ The payment was NOT approved")
-        print(f"Authorization status: {auth.status}")
+        print(f"Authorization status: {auth['status']}")
     else:
         print("\n❌ No authorization was found")
         print("This could mean:")
@@ -153,10 +155,12 @@ def monitor_payment_flow(card_id):
     print("3. Check the card details and transaction history")
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python3 check_redcross_payment.py <card_id>")
+    require_stripe()
+    args = [arg for arg in sys.argv[1:] if arg != "--offline"]
+    if len(args) != 1:
+        print("Usage: python3 check_redcross_payment.py <card_id> [--offline]")
         print("Example: python3 check_redcross_payment.py ic_1RffUCLP54m13jvUESeDqzHz")
         sys.exit(1)
     
-    card_id = sys.argv[1]
-    monitor_payment_flow(card_id)
+    card_id = args[0]
+    monitor_payment_flow(card_id, offline="--offline" in sys.argv[1:])
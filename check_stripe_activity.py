@@ -1,108 +1,101 @@
 #!/usr/bin/env python3
+import io
 import os
+import sys
+import csv
+import json
+import argparse
+import datetime
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import stripe
-from dotenv import load_dotenv
+from bootstrap import require_stripe
+from event_store import EventStore
 
-# Load environment variables
-load_dotenv()
 
-# Set up Stripe API key
-stripe_api_key = os.getenv("STRIPE_API_KEY")
-
-# Validate that we're using a test API key
-if not stripe_api_key:
-    print("\n⚠️  No Stripe API key found in .env file. Please add your test API key.")
-    exit(1)
-elif not stripe_api_key.startswith("sk_test_"):
-    print("\n❌ ERROR: You must use a Stripe TEST API key (starts with sk_test_)")
-    exit(1)
-
-stripe.api_key = stripe_api_key
-print("✅ Using Stripe TEST mode")
-
-def check_payment_intents():
+def check_payment_intents(out=sys.stdout):
     """Check recent payment intents"""
     try:
         payment_intents = stripe.PaymentIntent.list(limit=5)
         
         if not payment_intents.data:
-            print("No payment intents found")
+            print("No payment intents found", file=out)
             return
         
-        print(f"\n=== Recent Payment Intents ({len(payment_intents.data)}) ===")
+        print(f"\n=== Recent Payment Intents ({len(payment_intents.data)}) ===", file=out)
         for pi in payment_intents.data:
-            print(f"ID: {pi.id}")
-            print(f"Amount: ${pi.amount/100:.2f} {pi.currency.upper()}")
-            print(f"Status: {pi.status}")
-            print(f"Created: {pi.created}")
-            print(f"Description: {pi.description}")
-            print("-" * 40)
+            print(f"ID: {pi.id}", file=out)
+            print(f"Amount: ${pi.amount/100:.2f} {pi.currency.upper()}", file=out)
+            print(f"Status: {pi.status}", file=out)
+            print(f"Created: {pi.created}", file=out)
+            print(f"Description: {pi.description}", file=out)
+            print("-" * 40, file=out)
             
     except stripe.error.StripeError as e:
-        print(f"❌ Error checking payment intents: {e}")
+        print(f"❌ Error checking payment intents: {e}", file=out)
 
-def check_charges():
+def check_charges(out=sys.stdout):
     """Check recent charges"""
     try:
         charges = stripe.Charge.list(limit=5)
         
         if not charges.data:
-            print("No charges found")
+            print("No charges found", file=out)
             return
         
-        print(f"\n=== Recent Charges ({len(charges.data)}) ===")
+        print(f"\n=== Recent Charges ({len(charges.data)}) ===", file=out)
         for charge in charges.data:
-            print(f"ID: {charge.id}")
-            print(f"Amount: ${charge.amount/100:.2f} {charge.currency.upper()}")
-            print(f"Status: {charge.status}")
-            print(f"Created: {charge.created}")
+            print(f"ID: {charge.id}", file=out)
+            print(f"Amount: ${charge.amount/100:.2f} {charge.currency.upper()}", file=out)
+            print(f"Status: {charge.status}", file=out)
+            print(f"Created: {charge.created}", file=out)
             if charge.description:
-                print(f"Description: {charge.description}")
-            print("-" * 40)
+                print(f"Description: {charge.description}", file=out)
+            print("-" * 40, file=out)
             
     except stripe.error.StripeError as e:
-        print(f"❌ Error checking charges: {e}")
+        print(f"❌ Error checking charges: {e}", file=out)
 
-def check_payouts():
+def check_payouts(out=sys.stdout):
     """Check recent payouts"""
     try:
         payouts = stripe.Payout.list(limit=5)
         
         if not payouts.data:
-            print("No payouts found")
+            print("No payouts found", file=out)
             return
         
-        print(f"\n=== Recent Payouts ({len(payouts.data)}) ===")
+        print(f"\n=== Recent Payouts ({len(payouts.data)}) ===", file=out)
         for payout in payouts.data:
-            print(f"ID: {payout.id}")
-            print(f"Amount: ${payout.amount/100:.2f} {payout.currency.upper()}")
-            print(f"Status: {payout.status}")
-            print(f"Created: {payout.created}")
-            print(f"Arrival Date: {payout.arrival_date}")
-            print("-" * 40)
+            print(f"ID: {payout.id}", file=out)
+            print(f"Amount: ${payout.amount/100:.2f} {payout.currency.upper()}", file=out)
+            print(f"Status: {payout.status}", file=out)
+            print(f"Created: {payout.created}", file=out)
+            print(f"Arrival Date: {payout.arrival_date}", file=out)
+            print("-" * 40, file=out)
             
     except stripe.error.StripeError as e:
-        print(f"❌ Error checking payouts: {e}")
+        print(f"❌ Error checking payouts: {e}", file=out)
 
-def check_balance():
+def check_balance(out=sys.stdout):
     """Check current balance"""
     try:
         balance = stripe.Balance.retrieve()
         
-        print("\n=== Current Balance ===")
+        print("\n=== Current Balance ===", file=out)
         for balance_item in balance.available:
-            print(f"Available: ${balance_item.amount/100:.2f} {balance_item.currency.upper()}")
+            print(f"Available: ${balance_item.amount/100:.2f} {balance_item.currency.upper()}", file=out)
         
         for balance_item in balance.pending:
-            print(f"Pending: ${balance_item.amount/100:.2f} {balance_item.currency.upper()}")
+            print(f"Pending: ${balance_item.amount/100:.2f} {balance_item.currency.upper()}", file=out)
             
     except stripe.error.StripeError as e:
-        print(f"❌ Error checking balance: {e}")
+        print(f"❌ Error checking balance: {e}", file=out)
 
-def check_card_authorizations(card_id):
-    """Check for authorizations on the card"""
+def check_card_authorizations(card_id, store=None, out=sys.stdout):
+    """Check for authorizations on the card, saving them to an EventStore if given"""
     if not card_id:
-        print("No card ID provided, skipping card authorizations check")
+        print("No card ID provided, skipping card authorizations check", file=out)
         return
         
     try:
@@ -112,32 +105,224 @@ def check_card_authorizations(card_id):
         )
         
         if not authorizations.data:
-            print("No card authorizations found")
+            print("No card authorizations found", file=out)
             return
+        if store:
+            store.save("issuing.authorization", authorizations.data)
         
-        print(f"\n=== Recent Card Authorizations ({len(authorizations.data)}) ===")
+        print(f"\n=== Recent Card Authorizations ({len(authorizations.data)}) ===", file=out)
         for auth in authorizations.data:
-            print(f"ID: {auth.id}")
-            print(f"Amount: ${auth.amount/100:.2f} {auth.currency.upper()}")
-            print(f"Status: {auth.status}")
-            print(f"Created: {auth.created}")
+            print(f"ID: {auth.id}", file=out)
+            print(f"Amount: ${auth.amount/100:.2f} {auth.currency.upper()}", file=out)
+            print(f"Status: {auth.status}", file=out)
+            print(f"Created: {auth.created}", file=out)
             if hasattr(auth, 'merchant_data') and auth.merchant_data:
-                print(f"Merchant: {auth.merchant_data.name}")
-            print("-" * 40)
+                print(f"Merchant: {auth.merchant_data.name}", file=out)
+            print("-" * 40, file=out)
             
     except stripe.error.StripeError as e:
-        print(f"❌ Error checking card authorizations: {e}")
+        print(f"❌ Error checking card authorizations: {e}", file=out)
+
+DEFAULT_WORKERS = 8
+
+
+def run_checks(checks, workers=DEFAULT_WORKERS):
+    """
+    Run independent checks concurrently and print their output in order.
+
+    Each check is a callable taking an `out` text stream. Output is buffered
+    per check and printed in the order given once every check has finished,
+    so the report reads the same as a sequential run while taking about as
+    long as the slowest check.
+
+    Args:
+        checks (list): Callables such as check_charges
+        workers (int): Maximum checks in flight at once
+    """
+    def run(check):
+        out = io.StringIO()
+        check(out=out)
+        return out.getvalue()
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(checks)))) as executor:
+        for output in executor.map(run, checks):
+            print(output, end="")
+
+
+# Resources covered by the streaming report: name -> (resource, row builder)
+REPORT_RESOURCES = {
+    "payment_intents": (stripe.PaymentIntent, lambda pi: (pi.status, pi.description)),
+    "charges": (stripe.Charge, lambda charge: (charge.status, charge.description)),
+    "payouts": (stripe.Payout, lambda payout: (payout.status, payout.description)),
+    "issuing_authorizations": (
+        stripe.issuing.Authorization,
+        lambda auth: (auth.status, auth.merchant_data.name if auth.merchant_data else None),
+    ),
+    "issuing_transactions": (
+        stripe.issuing.Transaction,
+        lambda tx: (tx.type, tx.merchant_data.name if tx.merchant_data else None),
+    ),
+}
+REPORT_COLUMNS = ["resource", "id", "created", "amount", "currency", "status", "details"]
+DEFAULT_CURSOR_FILE = ".stripe_report_cursors.json"
+PAGE_SIZE = 100
+
+
+def load_cursors(path):
+    """Return the last reported object ID per resource (and per card) from the cursor file"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_cursors(path, cursors):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cursors, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def stream_objects(name, cursors, since=None, card_id=None):
+    """
+    Lazily yield the objects of a report resource, one page in memory at a time.
+
+    With a cursor for the resource only newer objects are fetched, oldest
+    first, and the cursor advances with every object yielded, so an
+    interrupted run resumes where it stopped. Without one the objects come
+    newest first and the cursor is set once the listing completes.
+
+    Args:
+        name (str): A key of REPORT_RESOURCES
+        cursors (dict): Last reported object ID per resource, updated in place;
+            a listing restricted to one card has its own "<resource>:<card>" cursor
+        since (int): Only objects created at or after this Unix time
+        card_id (str): Restrict issuing resources to one card
+    """
+    resource, _ = REPORT_RESOURCES[name]
+    params = {"limit": PAGE_SIZE}
+    if since is not None:
+        params["created"] = {"gte": since}
+    key = name
+    if card_id and name.startswith("issuing_"):
+        params["card"] = card_id
+        key = f"{name}:{card_id}"
+
+    cursor = cursors.get(key)
+    if cursor:
+        params["ending_before"] = cursor
+        for obj in resource.list(**params).auto_paging_iter():
+            cursors[key] = obj.id
+            yield obj
+        return
+
+    newest = None
+    for obj in resource.list(**params).auto_paging_iter():
+        newest = newest or obj.id
+        yield obj
+    if newest:
+        cursors[key] = newest
+
+
+def report_row(name, obj):
+    _, details = REPORT_RESOURCES[name]
+    created = datetime.datetime.fromtimestamp(obj.created).isoformat()
+    return [name, obj.id, created, obj.amount, obj.currency, *details(obj)]
+
+
+def stream_report(out, names=None, since=None, card_id=None, cursor_file=DEFAULT_CURSOR_FILE):
+    """
+    Write a CSV row for every new object of each resource as it is fetched.
+
+    Args:
+        out: Text stream to write the CSV to
+        names (list): Resources to report (defaults to all of REPORT_RESOURCES)
+        since (int): Only objects created at or after this Unix time
+        card_id (str): Restrict issuing resources to one card
+        cursor_file (str): Where per-resource cursors are kept, or None to
+            report everything matching `since` and remember nothing
+
+    Returns:
+        A dict of resource name to the number of rows written
+    """
+    cursors = load_cursors(cursor_file) if cursor_file else {}
+    writer = csv.writer(out)
+    writer.writerow(REPORT_COLUMNS)
+    counts = {}
+    try:
+        for name in names or REPORT_RESOURCES:
+            counts[name] = 0
+            try:
+                for obj in stream_objects(name, cursors, since, card_id):
+                    writer.writerow(report_row(name, obj))
+                    counts[name] += 1
+            except stripe.error.StripeError as e:
+                print(f"❌ Error reporting {name}: {e}", file=sys.stderr)
+            out.flush()
+    finally:
+        if cursor_file:
+            save_cursors(cursor_file, cursors)
+    return counts
+
+
+def parse_since(value):
+    """Parse --since as Unix seconds, an ISO date/datetime, or a duration like 24h or 7d"""
+    if value.isdigit():
+        return int(value)
+    units = {"m": 60, "h": 3600, "d": 86400}
+    if value[-1:] in units and value[:-1].isdigit():
+        return int(datetime.datetime.now().timestamp()) - int(value[:-1]) * units[value[-1]]
+    try:
+        return int(datetime.datetime.fromisoformat(value).timestamp())
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid --since value: {value}")
+
 
 if __name__ == "__main__":
+    require_stripe()
+    parser = argparse.ArgumentParser(description="Check recent Stripe activity in TEST mode")
+    parser.add_argument("--report", action="store_true",
+                        help="Stream every new object as CSV instead of the 5 most recent of each")
+    parser.add_argument("--since", type=parse_since,
+                        help="Only objects created since then (Unix time, ISO date, or e.g. 24h / 7d)")
+    parser.add_argument("--resources", nargs="+", choices=list(REPORT_RESOURCES),
+                        help="Resources to report (default: all)")
+    parser.add_argument("--card", help="Restrict issuing resources to one card")
+    parser.add_argument("--output", help="CSV file to write (default: stdout)")
+    parser.add_argument("--cursor-file", default=DEFAULT_CURSOR_FILE,
+                        help="Where the last reported object per resource is remembered")
+    parser.add_argument("--no-cursor", action="store_true",
+                        help="Report everything matching --since and don't remember where we stopped")
+    parser.add_argument("--cards", nargs="+", default=[],
+                        help="Also check recent authorizations on these cards")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Maximum checks run concurrently")
+    args = parser.parse_args()
+
+    if args.report:
+        cursor_file = None if args.no_cursor else args.cursor_file
+        out = open(args.output, "w", newline="") if args.output else sys.stdout
+        try:
+            counts = stream_report(out, args.resources, args.since, args.card, cursor_file)
+        finally:
+            if args.output:
+                out.close()
+        print(", ".join(f"{count} {name}" for name, count in counts.items()), file=sys.stderr)
+        sys.exit(0)
+
     print("Checking recent Stripe activity in TEST mode...")
     
-    check_payment_intents()
-    check_charges()
-    check_payouts()
-    check_balance()
-    
-    # If you want to check a specific card, uncomment and provide the card ID
-    # check_card_authorizations("ic_1RffUCLP54m13jvUESeDqzHz")
+    # The checks are independent, so they run side by side
+    checks = [check_payment_intents, check_charges, check_payouts, check_balance]
+    # Card authorizations seen here are kept in the local event store too
+    store = EventStore() if args.cards else None
+    checks += [functools.partial(check_card_authorizations, card_id, store) for card_id in args.cards]
+    try:
+        run_checks(checks, args.workers)
+    finally:
+        if store:
+            store.close()
     
     print("\nIf you don't see your transactions, make sure:")
     print("1. You're using the correct Stripe account")
@@ -1,37 +1,22 @@
-import os
 import stripe
-from dotenv import load_dotenv
+from bootstrap import require_stripe
+from cardholder_registry import shared_registry
 
-# Load environment variables
-load_dotenv()
 
-# Set up Stripe API key
-stripe_api_key = os.getenv("STRIPE_API_KEY")
-
-# Validate that we're using a test API key
-if not stripe_api_key:
-    print("\n⚠️  No Stripe API key found in .env file. Please add your test API key.")
-    print("    Get a test API key from https://dashboard.stripe.com/test/apikeys")
-    exit(1)
-elif not stripe_api_key.startswith("sk_test_"):
-    print("\n❌ ERROR: You must use a Stripe TEST API key (starts with sk_test_)")
-    print("    This program is designed to run in test mode only.")
-    print("    Get a test API key from https://dashboard.stripe.com/test/apikeys")
-    exit(1)
-
-stripe.api_key = stripe_api_key
-print("✅ Using Stripe TEST mode")
-
-
-def create_cardholder():
+def create_cardholder(name="Browserbase User", email="hello@browserbase.com", idempotency_key=None):
     """
     Create a new cardholder in Stripe.
     A cardholder must be created before issuing virtual cards.
+    
+    Args:
+        name (str): The cardholder's name
+        email (str): The cardholder's email
+        idempotency_key (str): Makes a retried create return the original cardholder
     """
     try:
         cardholder = stripe.issuing.Cardholder.create(
-            name="Browserbase User",
-            email="hello@browserbase.com",
+            name=name,
+            email=email,
             phone_number="+15555555555",
             status='active',
             type='individual',
@@ -44,6 +29,7 @@ def create_cardholder():
                     "postal_code": "94111",
                 }
             },
+            idempotency_key=idempotency_key,
         )
         print("Cardholder created:", cardholder.id)
         return cardholder
@@ -51,10 +37,22 @@ def create_cardholder():
         print(f"Error creating cardholder: {e}")
         return None
 
+def get_or_create_cardholder(name="Browserbase User", email="hello@browserbase.com"):
+    """
+    Return the ID of the active cardholder with this name and email,
+    creating it only if none exists yet.
+    """
+    try:
+        return shared_registry().get_or_create(name, email, lambda: create_cardholder(name, email))
+    except stripe.error.StripeError as e:
+        print(f"Error looking up cardholder: {e}")
+        return None
+
 if __name__ == "__main__":
-    card_holder = create_cardholder()
-    if card_holder:
-        print(f"Successfully created cardholder with ID: {card_holder.id}")
+    require_stripe()
+    cardholder_id = get_or_create_cardholder()
+    if cardholder_id:
+        print(f"Using cardholder with ID: {cardholder_id}")
         print("Save this ID for creating virtual cards.")
     else:
         print("Failed to create cardholder. Check your Stripe API key and try again.")
@@ -1,24 +1,7 @@
 #!/usr/bin/env python3
-import os
 import stripe
-from dotenv import load_dotenv
+from bootstrap import require_stripe
 
-# Load environment variables
-load_dotenv()
-
-# Set up Stripe API key
-stripe_api_key = os.getenv("STRIPE_API_KEY")
-
-# Validate that we're using a test API key
-if not stripe_api_key:
-    print("\n⚠️  No Stripe API key found in .env file. Please add your test API key.")
-    exit(1)
-elif not stripe_api_key.startswith("sk_test_"):
-    print("\n❌ ERROR: You must use a Stripe TEST API key (starts with sk_test_)")
-    exit(1)
-
-stripe.api_key = stripe_api_key
-print("✅ Using Stripe TEST mode")
 
 def create_payment_intent():
     """
@@ -71,6 +54,7 @@ def create_payment_intent():
         return None
 
 if __name__ == "__main__":
+    require_stripe()
     print("Creating a test payment with the bypass pending card...")
     print("This should trigger the following events in order:")
     print("1. payment_intent.succeeded")
@@ -1,34 +1,16 @@
-import os
 import stripe
-from dotenv import load_dotenv
+from bootstrap import require_stripe
+from cardholder_registry import is_cardholder_error, shared_registry
 
-# Load environment variables
-load_dotenv()
 
-# Set up Stripe API key
-stripe_api_key = os.getenv("STRIPE_API_KEY")
-
-# Validate that we're using a test API key
-if not stripe_api_key:
-    print("\n⚠️  No Stripe API key found in .env file. Please add your test API key.")
-    print("    Get a test API key from https://dashboard.stripe.com/test/apikeys")
-    exit(1)
-elif not stripe_api_key.startswith("sk_test_"):
-    print("\n❌ ERROR: You must use a Stripe TEST API key (starts with sk_test_)")
-    print("    This program is designed to run in test mode only.")
-    print("    Get a test API key from https://dashboard.stripe.com/test/apikeys")
-    exit(1)
-
-stripe.api_key = stripe_api_key
-print("✅ Using Stripe TEST mode")
-
-
-def create_card(cardholder_id):
+def create_card(cardholder_id, spending_limit=100, idempotency_key=None):
     """
     Create a virtual card for the given cardholder.
     
     Args:
         cardholder_id (str): The ID of the cardholder to create a card for
+        spending_limit (int): Daily spending limit in cents
+        idempotency_key (str): Makes a retried create return the original card
         
     Returns:
         The created card object
@@ -44,19 +26,24 @@ def create_card(cardholder_id):
                 # "blocked_categories": ['automated_cash_disburse'],
                 "spending_limits": [
                     {
-                        "amount": 100,  # $1.00 measured in cents
+                        "amount": spending_limit,  # $1.00 by default, measured in cents
                         "interval": "daily",  # all_time, daily, weekly, monthly, yearly, per_authorization
                     }
                 ]
             },
+            idempotency_key=idempotency_key,
         )
         print("Card created:", card.id)
         return card
     except Exception as e:
         print(f"Error creating virtual card: {e}")
+        if is_cardholder_error(e):
+            # Most likely deactivated; don't hand out its cached ID again
+            shared_registry().forget(cardholder_id)
         return None
 
 if __name__ == "__main__":
+    require_stripe()
     # Get cardholder ID from command line or input
     import sys
     if len(sys.argv) > 1:
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Run many Red Cross donations concurrently on one event loop.
+
+Every run uses the async flow of redcross_donation.py. The runs share one
+AsyncStripe client, so all Stripe calls go through the same rate limiter,
+and they share a pool of warm Browserbase sessions. At most --concurrency
+runs are in flight at once. A run that takes longer than --timeout is
+cancelled and counted as failed, and its session is recycled.
+
+Cards come from the command line, from a file, or are leased from the card
+pool (--pool N). Leased cards are returned afterwards, and retired if their
+run failed. --block lean (or strict) keeps images, fonts, media and
+trackers out of the sessions; see request_blocking.py. --profile DIR writes
+every run's step timeline and a Chrome trace of all runs into DIR (add
+--trace for a Playwright trace per run); see flow_profiler.py. The summary shows successes, failures, throughput and how long
+each step took across the runs:
+
+    python3 donation_runner.py --cards-file cards.txt --concurrency 8 --json results.json
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from bootstrap import require_stripe
+from async_stripe import AsyncStripe
+from card_pool import CardPool
+from flow_profiler import print_percentiles, step_percentiles, write_profile
+from request_blocking import RequestBlocker, block_option, describe
+from redcross_donation import DEFAULT_DEADLINE, make_donation
+from session_pool import AsyncSessionPool
+
+DEFAULT_CONCURRENCY = 4
+# Seconds a single run may take, including the wait for its authorization
+DEFAULT_TIMEOUT = 180
+
+
+async def run_donations(card_ids, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT,
+                        deadline=DEFAULT_DEADLINE, sessions=None, blocking="off", trace_dir=None):
+    """
+    Donate with every card, `concurrency` runs at a time.
+
+    Args:
+        card_ids (list): The virtual cards to donate with
+        concurrency (int): Maximum runs in flight at once
+        timeout (int): Seconds after which a run is cancelled
+        deadline (int): Seconds each run waits for its authorization
+        sessions (int): Warm Browserbase sessions to keep (defaults to `concurrency`)
+        blocking (str): Request-blocking profile of the sessions
+        trace_dir (str): Save a Playwright trace of every run in this directory
+
+    Returns:
+        (results, pool_stats): one make_donation() outcome per card, in the
+        order given, each with its wall time in "seconds"; and the session
+        pool's stats()
+    """
+    from playwright.async_api import async_playwright
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with AsyncStripe() as client, async_playwright() as playwright:
+        pool = AsyncSessionPool(playwright, size=concurrency if sessions is None else sessions,
+                                blocker=RequestBlocker.from_profile(blocking))
+
+        async def run(card_id):
+            async with semaphore:
+                started = time.perf_counter()
+                trace_path = os.path.join(trace_dir, f"{card_id}.playwright.zip") if trace_dir else None
+                try:
+                    result = await asyncio.wait_for(
+                        make_donation(card_id, client, deadline, pool, review_delay=0, trace_path=trace_path), timeout
+                    )
+                except asyncio.TimeoutError:
+                    result = {"card_id": card_id, "ok": False, "error": f"Timed out after {timeout}s", "steps": []}
+                except Exception as e:
+                    result = {"card_id": card_id, "ok": False, "error": f"{type(e).__name__}: {e}", "steps": []}
+                result["seconds"] = round(time.perf_counter() - started, 3)
+                status = "✅" if result["ok"] else "❌"
+                print(f"{status} {card_id} finished in {result['seconds']:.1f}s")
+                return result
+
+        try:
+            await pool.warm()
+        except Exception as e:
+            # Runs start their own sessions when none are warm
+            print(f"⚠️  Could not warm up Browserbase sessions: {e}")
+        try:
+            results = await asyncio.gather(*(run(card_id) for card_id in card_ids))
+        finally:
+            await pool.close()
+        return results, pool.stats()
+
+
+def summarize(results, elapsed, pool_stats=None):
+    """
+    Aggregate the outcomes of a batch of runs.
+
+    Returns:
+        A dict with the run counts, throughput, the errors by card and, per
+        step, how often it ran and its p50, p95 and slowest duration
+    """
+    succeeded = [result for result in results if result["ok"]]
+    return {
+        "runs": len(results),
+        "succeeded": len(succeeded),
+        "failed": len(results) - len(succeeded),
+        "authorized": sum(1 for result in succeeded if result.get("authorization")),
+        "elapsed_seconds": round(elapsed, 3),
+        "runs_per_minute": round(len(results) / elapsed * 60, 2) if elapsed else 0.0,
+        "errors": {result["card_id"]: result["error"] for result in results if not result["ok"]},
+        "steps": step_percentiles(results),
+        "sessions": pool_stats,
+    }
+
+
+def print_summary(summary):
+    print("\n=== Summary ===")
+    print(f"Runs: {summary['runs']}  ✅ {summary['succeeded']} succeeded  ❌ {summary['failed']} failed"
+          f"  ({summary['authorized']} authorization(s) confirmed)")
+    print(f"Elapsed: {summary['elapsed_seconds']:.1f}s  ({summary['runs_per_minute']:.1f} runs/minute)")
+    if summary["steps"]:
+        print_percentiles(summary["steps"])
+    if summary["sessions"]:
+        sessions = summary["sessions"]
+        print(f"\nBrowserbase sessions: {sessions['hits']} reused, {sessions['misses']} started, "
+              f"{sessions['recycled']} recycled (hit rate {sessions['hit_rate']:.0%})")
+        requests = sessions.get("requests")
+        if requests:
+            print(f"Requests: {describe(requests)}")
+    for card_id, error in summary["errors"].items():
+        print(f"❌ {card_id}: {error}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run many Red Cross donations concurrently")
+    parser.add_argument("card_ids", nargs="*", help="Virtual cards to donate with")
+    parser.add_argument("--cards-file", help="File with one card ID per line")
+    parser.add_argument("--pool", type=int, metavar="N", help="Lease N cards from the card pool")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Runs in flight at once")
+    parser.add_argument("--timeout", type=int, default=DEFAULT_TIMEOUT, help="Seconds before a run is cancelled")
+    parser.add_argument("--deadline", type=int, default=DEFAULT_DEADLINE,
+                        help="Seconds each run waits for its authorization")
+    parser.add_argument("--sessions", type=int, help="Warm Browserbase sessions to keep (default: --concurrency)")
+    parser.add_argument("--block", type=block_option, default="off", metavar="PROFILE[:DOMAIN,...]",
+                        help="Request-blocking profile for the browser sessions (off, lean, strict), optionally with extra domains to allow")
+    parser.add_argument("--profile", metavar="DIR", help="Write step timelines and a Chrome trace to DIR")
+    parser.add_argument("--trace", action="store_true", help="Also save a Playwright trace of every run (needs --profile)")
+    parser.add_argument("--json", metavar="PATH", help="Write every run's outcome and the summary to this file")
+    args = parser.parse_args()
+
+    if args.concurrency < 1:
+        parser.error("--concurrency must be positive")
+    if args.trace and not args.profile:
+        parser.error("--trace needs --profile")
+    require_stripe()
+
+    card_ids = list(args.card_ids)
+    if args.cards_file:
+        with open(args.cards_file) as f:
+            card_ids.extend(line.strip() for line in f if line.strip())
+
+    card_pool = None
+    leased = set()
+    if args.pool:
+        card_pool = CardPool()
+        for _ in range(args.pool):
+            profile = card_pool.lease()
+            if not profile:
+                print("⚠️  The card pool ran out of cards")
+                break
+            leased.add(profile.card_id)
+            card_ids.append(profile.card_id)
+
+    if not card_ids:
+        parser.error("no cards given; pass card IDs, --cards-file or --pool")
+
+    print(f"Running {len(card_ids)} donation(s), {args.concurrency} at a time")
+    started = time.perf_counter()
+    results, pool_stats = asyncio.run(run_donations(
+        card_ids, args.concurrency, args.timeout, args.deadline, args.sessions, args.block,
+        args.profile if args.trace else None,
+    ))
+    summary = summarize(results, time.perf_counter() - started, pool_stats)
+
+    if card_pool:
+        for result in results:
+            if result["card_id"] in leased:
+                card_pool.release(result["card_id"], retire=not result["ok"])
+        card_pool.close()
+
+    print_summary(summary)
+    if args.profile:
+        timeline_path, trace_path = write_profile(results, args.profile)
+        print(f"\nTimelines written to {timeline_path}, Chrome trace to {trace_path}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"summary": summary, "results": results}, f, indent=2)
+        print(f"\nResults written to {args.json}")
+    sys.exit(0 if summary["failed"] == 0 else 1)
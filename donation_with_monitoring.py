@@ -1,330 +1,178 @@
 #!/usr/bin/env python3
-import os
 import sys
 import time
-import threading
 import stripe
 import datetime
-from dotenv import load_dotenv
-from playwright.sync_api import sync_playwright
-from browserbase import Browserbase
+from bootstrap import require_stripe
+from session_pool import SessionPool
+from request_blocking import RequestBlocker, describe, pop_block_option
+from flows import redcross_donation_flow, run_flow, timed_step
+from flow_profiler import record_run
 from get_card_details import get_card as getCard
-
-# Load environment variables
-load_dotenv()
-
-# Set up Stripe API key
-stripe_api_key = os.getenv("STRIPE_API_KEY")
-
-# Validate that we're using a test API key
-if not stripe_api_key:
-    print("\n⚠️  No Stripe API key found in .env file. Please add your test API key.")
-    exit(1)
-elif not stripe_api_key.startswith("sk_test_"):
-    print("\n❌ ERROR: You must use a Stripe TEST API key (starts with sk_test_)")
-    exit(1)
-
-stripe.api_key = stripe_api_key
-print("✅ Using Stripe TEST mode")
-
-# Set up BrowserBase
-bb = Browserbase(api_key=os.environ["BROWSERBASE_API_KEY"])
-
-# Global variables for monitoring
-monitoring_active = True
-initial_auth_ids = set()
-initial_tx_ids = set()
-card_id = None
-
-def check_card_authorizations():
-    """Check for authorizations on the card"""
-    try:
-        authorizations = stripe.issuing.Authorization.list(
-            card=card_id,
-            limit=5
-        )
-        
-        if not authorizations.data:
-            return []
-        
-        return authorizations.data
-    except stripe.error.StripeError as e:
-        print(f"❌ Error checking authorizations: {e}")
-        return []
-
-def check_card_transactions():
-    """Check for transactions on the card"""
+from card_monitor import CLOCK_SKEW, CardMonitor, authorization_matching
+from event_store import EventStore
+from card_pool import CardPool
+
+# The $75 option selected on the donation page, and how the merchant appears
+DONATION_AMOUNT = 7500
+REDCROSS_MERCHANT = ("redcross", "red cross")
+# Default upper bound on waiting for the authorization after submitting
+DEFAULT_DEADLINE = 60
+
+def start_card_monitor(card_id):
+    """Start monitoring the card in a background thread"""
+    print("\n=== Starting Card Activity Monitoring ===")
+    store = EventStore()
+    monitor = CardMonitor(card_id, store=store)
     try:
-        transactions = stripe.issuing.Transaction.list(
-            card=card_id,
-            limit=5
-        )
-        
-        if not transactions.data:
-            return []
-        
-        return transactions.data
+        monitor.start()
     except stripe.error.StripeError as e:
-        print(f"❌ Error checking transactions: {e}")
-        return []
-
-def monitor_card_activity():
-    """Monitor card activity in a separate thread"""
-    global initial_auth_ids, initial_tx_ids, monitoring_active
-    
-    print("\n=== Starting Card Activity Monitoring ===")
-    
-    # Get initial state
-    print("Checking for existing authorizations...")
-    initial_auths = check_card_authorizations()
-    initial_auth_ids = set(auth.id for auth in initial_auths)
-    
-    print("Checking for existing transactions...")
-    initial_txs = check_card_transactions()
-    initial_tx_ids = set(tx.id for tx in initial_txs)
-    
-    print(f"Initial state: {len(initial_auth_ids)} authorizations, {len(initial_tx_ids)} transactions")
-    
-    # Monitor for changes
-    while monitoring_active:
-        time.sleep(5)  # Check every 5 seconds
-        
-        # Check for new authorizations
-        current_auths = check_card_authorizations()
-        current_auth_ids = set(auth.id for auth in current_auths)
-        
-        new_auth_ids = current_auth_ids - initial_auth_ids
-        if new_auth_ids:
-            print(f"\n✅ DETECTED {len(new_auth_ids)} NEW AUTHORIZATION(S)!")
-            for auth in current_auths:
-                if auth.id in new_auth_ids:
-                    print(f"  New authorization: {auth.id}")
-                    print(f"  Merchant: {auth.merchant_data.name}")
-                    print(f"  Amount: ${auth.amount/100:.2f} {auth.currency.upper()}")
-                    print(f"  Status: {auth.status}")
-                    print(f"  Approved: {auth.approved}")
-            initial_auth_ids = current_auth_ids
-        
-        # Check for new transactions
-        current_txs = check_card_transactions()
-        current_tx_ids = set(tx.id for tx in current_txs)
-        
-        new_tx_ids = current_tx_ids - initial_tx_ids
-        if new_tx_ids:
-            print(f"\n✅ DETECTED {len(new_tx_ids)} NEW TRANSACTION(S)!")
-            for tx in current_txs:
-                if tx.id in new_tx_ids:
-                    print(f"  New transaction: {tx.id}")
-                    print(f"  Type: {tx.type}")
-                    print(f"  Amount: ${tx.amount/100:.2f} {tx.currency.upper()}")
-                    
-                    if hasattr(tx, 'purchase_details') and tx.purchase_details:
-                        if hasattr(tx.purchase_details, 'merchant') and tx.purchase_details.merchant:
-                            print(f"  Merchant: {tx.purchase_details.merchant.name}")
-            initial_tx_ids = current_tx_ids
-    
-    print("\n=== Card Monitoring Stopped ===")
-
-def run_donation(playwright, card_id_param):
-    """Run the Red Cross donation process"""
-    global card_id
-    card_id = card_id_param
-    
-    session = bb.sessions.create(
-        project_id=os.environ["BROWSERBASE_PROJECT_ID"],
+        print(f"❌ Error establishing initial card state: {e}")
+        store.close()
+        return None
+    
+    print("Initial state recorded, watching for new authorizations and transactions")
+    return monitor
+
+def wait_for_donation_authorization(monitor, card_id, deadline):
+    """Block until the monitor sees the donation's authorization or the deadline passes"""
+    print(f"Waiting up to {deadline} seconds for the donation authorization...")
+    predicate = authorization_matching(
+        card_id, DONATION_AMOUNT, REDCROSS_MERCHANT, since=monitor.started_at - CLOCK_SKEW
     )
-
-    browser = playwright.chromium.connect_over_cdp(session.connect_url)
-    context = browser.contexts[0]
-    page = context.pages[0]
-
-    payment_info = getCard(card_id)
-
-    # Watch the session
-    print(f"Session URL: https://browserbase.com/sessions/{session.id}")
-    print("✅ BrowserBase session created")
-
+    auth = monitor.wait_for(predicate, timeout=deadline)
+    if auth:
+        print(f"✅ Authorization {auth.id} received")
+    else:
+        print(f"⚠️  No matching authorization within {deadline} seconds")
+    return auth
+
+def run_donation(playwright, card_id, monitor=None, deadline=DEFAULT_DEADLINE, pool=None, payment_info=None,
+                 blocking="off"):
+    """
+    Run the Red Cross donation process
+    
+    Args:
+        playwright: The sync Playwright instance
+        card_id: The Stripe issuing card ID
+        monitor: A started CardMonitor for the card; the run finishes as soon
+            as it reports the donation's authorization
+        deadline: Maximum seconds to wait for that authorization
+        pool: A SessionPool on `playwright` to take a warm session from
+        payment_info: The card's CardProfile, if the caller already has it
+        blocking (str): Request-blocking profile of a one-off session
+
+    Returns:
+        The outcome: {"card_id", "session_id", "ok", "error", "authorization",
+        "steps"}, with the flow's timed steps; with a monitor, a run whose
+        authorization never arrives fails with error "authorization_timeout"
+    """
+    result = {"card_id": card_id, "session_id": None, "ok": False, "error": None,
+              "authorization": None, "steps": []}
+    if pool is None:
+        # A one-off run: the session is released as soon as the run is done
+        pool = SessionPool(playwright, size=0, blocker=RequestBlocker.from_profile(blocking))
+    lease = None
     try:
-        # Navigate to the donation page
-        print("Navigating to Red Cross donation page...")
-        page.goto("https://www.redcross.org/donate/donation.html", wait_until="networkidle")
-        print("Page loaded successfully")
-        
-        # Wait for the page to be fully loaded
-        page.wait_for_load_state("networkidle")
-        
-        # Perform actions on the donation page with increased timeouts
-        print("Selecting $75 donation amount...")
-        page.wait_for_selector("#modf-handle-0-radio", timeout=60000)
-        page.click("#modf-handle-0-radio")
-        
-        print("Proceeding to next step...")
-        page.wait_for_selector("text=Continue", timeout=60000)
-        page.click("text=Continue")
-        
-        # Wait for the next page to load
-        page.wait_for_load_state("networkidle")
-        
-        print("Selecting credit card payment method...")
-        try:
-            page.wait_for_selector("text=credit card", timeout=60000)
-            page.click("text=credit card")
-            
-            page.wait_for_selector("text=Continue", timeout=60000)
-            page.click("text=Continue")
-        except Exception as e:
-            print(f"Warning: Could not find credit card option or continue button: {e}")
-            print("Attempting to proceed with form filling anyway...")
-            
-        # Wait for the payment form to load
-        page.wait_for_load_state("networkidle")
-
-        # Fill billing information with error handling
-        print("Filling billing information...")
-        try:
-            # Wait for form fields to be available
-            page.wait_for_selector("input[name='bill_to_forename']", timeout=60000)
-            
-            # Fill billing information
-            page.fill("input[name='bill_to_forename']", payment_info["cardholder_firstName"])
-            page.fill("input[name='bill_to_surname']", payment_info["cardholder_lastName"])
-            page.fill("input[name='bill_to_email']", payment_info["cardholder_email"])
-            page.fill("input[name='bill_to_phone']", payment_info["cardholder_phone"])
-            print("✅ Billing information filled")
-        except Exception as e:
-            print(f"Warning: Could not fill billing information: {e}")
-
-        # Fill in the address information with error handling
-        print("Filling address information...")
-        try:
-            # Wait for address fields to be available
-            page.wait_for_selector("input[name='bill_to_address_line1']", timeout=60000)
-            
-            # Fill address information
-            page.fill("input[name='bill_to_address_line1']", payment_info["cardholder_address"]["line1"])
-            page.fill("input[name='bill_to_address_city']", payment_info["cardholder_address"]["city"])
-            page.fill("input[name='bill_to_address_postal_code']", payment_info["cardholder_address"]["postal_code"])
-            
-            # Wait for state dropdown and select option
-            page.wait_for_selector("select#bill_to_address_state", timeout=60000)
-            page.select_option("select#bill_to_address_state", payment_info["cardholder_address"]["state"])
-            print("✅ Address information filled")
-        except Exception as e:
-            print(f"Warning: Could not fill address information: {e}")
-
-        # Fill in the card information with error handling
-        print("Filling card information...")
-        try:
-            # Wait for card fields to be available
-            page.wait_for_selector("input#cardnumber", timeout=60000)
-            
-            # Fill card information
-            page.fill("input#cardnumber", payment_info["card_number"])
-            page.fill("input#MM", str(payment_info["expiration_month"]))
-            page.fill("input#YY", str(payment_info["expiration_year"]))
-            page.fill("input#CVC", str(payment_info["cvc"]))
-            print("✅ Card information filled")
-        except Exception as e:
-            print(f"Warning: Could not fill card information: {e}")
-
-        # Wait for user confirmation before submitting
-        print("\n✅ Form filled with virtual card details")
-        print("⚠️  This is a TEST donation using a TEST card in Stripe's test mode")
-        print("⚠️  No actual charges will be made")
-        print("\nSubmitting donation...")
-
-        # Click donate button with error handling
-        try:
-            # Try different possible selectors for the donate button
-            donate_selectors = [
-                "text=Donate",
-                "button:has-text('Donate')",
-                "input[type='submit'][value='Donate']",
-                "#donate-button",
-                ".donate-button"
-            ]
-            
-            button_clicked = False
-            for selector in donate_selectors:
-                try:
-                    if page.is_visible(selector, timeout=5000):
-                        page.click(selector)
-                        button_clicked = True
-                        print(f"Clicked donate button using selector: {selector}")
-                        break
-                except Exception:
-                    continue
-            
-            if not button_clicked:
-                print("Could not find donate button with standard selectors")
-                print("Taking screenshot of current page state...")
-                page.screenshot(path="redcross_form_filled.png")
-                print("Screenshot saved as redcross_form_filled.png")
-                print("You can manually complete the donation process by viewing the BrowserBase session")
-            else:
-                # Wait for confirmation
-                print("Waiting for confirmation...")
-                time.sleep(10)  # Wait a bit longer to see if the payment processes
-                
-                print("\n✅ Donation process completed")
-                print("Note: Since this is using Stripe's test mode, no actual donation was made")
-        except Exception as e:
-            print(f"Error during donation submission: {e}")
-            print("Taking screenshot of current page state...")
-            page.screenshot(path="redcross_error.png")
-            print("Screenshot saved as redcross_error.png")
+        with timed_step(result, "acquire_session"):
+            lease = pool.acquire()
+        result["session_id"] = lease.session_id
+
+        # Watch the session
+        print(f"Session URL: {lease.session_url}")
+        print("✅ BrowserBase session created")
+
+        if payment_info is None:
+            with timed_step(result, "get_card"):
+                payment_info = getCard(card_id)
+        if payment_info is None:
+            raise RuntimeError(f"Could not retrieve card {card_id}")
+        run_flow(lease.page, redcross_donation_flow(review_delay=0), payment_info, result)
+
+        # Wait for confirmation
+        print("Waiting for confirmation...")
+        if monitor:
+            auth = wait_for_donation_authorization(monitor, card_id, deadline)
+            result["authorization"] = auth.id if auth else None
+        else:
+            time.sleep(10)  # No monitor to signal us, give the payment a moment
+
+        if monitor and auth is None:
+            # The form went through but the payment never reached the card
+            result["error"] = "authorization_timeout"
+            print("\n❌ Donation was not authorized")
+        else:
+            result["ok"] = True
+            print("\n✅ Donation process completed")
+            print("Note: Since this is using Stripe's test mode, no actual donation was made")
         
     except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
         print(f"❌ Error: {e}")
     finally:
-        # Keep the browser open for a while to allow monitoring to detect any delayed transactions
-        print("Keeping browser open for 30 more seconds to monitor for payment activity...")
-        time.sleep(30)
-        
-        # Close the browser
-        page.close()
-        browser.close()
+        # Hand the session back, recycling it if the run failed
+        if lease:
+            pool.release(lease, failed=not result["ok"])
+        if pool.blocker:
+            print(f"🚫 {describe(pool.blocker.stats())}")
+    return result
 
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python3 donation_with_monitoring.py <card_id>")
-        print("Example: python3 donation_with_monitoring.py ic_1RffUCLP54m13jvUESeDqzHz")
+    from playwright.sync_api import sync_playwright
+
+    try:
+        blocking, args = pop_block_option(sys.argv[1:])
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    profiling = "--profile" in args
+    args = [arg for arg in args if arg != "--profile"]
+    if len(args) not in (1, 2):
+        print("Usage: python3 donation_with_monitoring.py <card_id|--pool> [deadline_seconds] [--profile] [--block PROFILE]")
+        print("Example: python3 donation_with_monitoring.py ic_1RffUCLP54m13jvUESeDqzHz 60")
+        print("         python3 donation_with_monitoring.py --pool   (lease a card from card_pool.py)")
+        print("  --profile  add the run's step timeline to profiles/ and print percentiles over all runs")
         sys.exit(1)
     
-    global card_id, monitoring_active
-    card_id = sys.argv[1]
+    deadline = int(args[1]) if len(args) == 2 else DEFAULT_DEADLINE
+    pool = None
+    profile = None
+    if args[0] == "--pool":
+        pool = CardPool()
+        profile = pool.lease()
+        if not profile:
+            print("❌ Could not lease a card from the pool")
+            sys.exit(1)
+        card_id = profile.card_id
+        print(f"✅ Leased card {card_id} from the pool")
+    else:
+        card_id = args[0]
     
     # Start monitoring thread
-    monitor_thread = threading.Thread(target=monitor_card_activity)
-    monitor_thread.daemon = True
-    monitor_thread.start()
+    monitor = start_card_monitor(card_id)
     
     # Run donation process
     with sync_playwright() as playwright:
-        run_donation(playwright, card_id)
-    
-    # Stop monitoring
-    monitoring_active = False
-    monitor_thread.join(timeout=5)
+        result = run_donation(playwright, card_id, monitor, deadline, payment_info=profile, blocking=blocking)
+    if profiling:
+        record_run(result, name="donation_with_monitoring")
     
-    # Final check for any activity that might have been missed
+    # Stop monitoring, with a final check for any activity that might have been missed
     print("\n=== Final Card Activity Check ===")
-    
-    # Check for new authorizations
-    current_auths = check_card_authorizations()
-    current_auth_ids = set(auth.id for auth in current_auths)
-    
-    new_auth_count = len(current_auth_ids - initial_auth_ids)
-    
-    # Check for new transactions
-    current_txs = check_card_transactions()
-    current_tx_ids = set(tx.id for tx in current_txs)
-    
-    new_tx_count = len(current_tx_ids - initial_tx_ids)
+    if monitor:
+        monitor.stop()
+        monitor.store.close()
+    print("\n=== Card Monitoring Stopped ===")
+    if pool:
+        # A card whose donation failed may be in an unknown state
+        pool.release(card_id, retire=not result["ok"])
+        pool.close()
     
     print("\n=== Summary ===")
-    if new_auth_count > 0 or new_tx_count > 0:
-        print(f"✅ Detected {new_auth_count} new authorization(s) and {new_tx_count} new transaction(s)")
+    auth_count = monitor.activity.auth_count if monitor else 0
+    tx_count = monitor.activity.tx_count if monitor else 0
+    if auth_count > 0 or tx_count > 0:
+        print(f"✅ Detected {auth_count} new authorization(s) and {tx_count} new transaction(s)")
         print("The payment process is working correctly in test mode!")
     else:
         print("❌ No new activity was detected on this card")
@@ -337,6 +185,8 @@ def main():
     print("1. Go to https://dashboard.stripe.com/test/issuing")
     print("2. Make sure you're in 'Viewing test data' mode")
     print("3. Check the card details and transaction history")
+    return result
 
 if __name__ == "__main__":
-    main()
+    require_stripe()
+    sys.exit(0 if main()["ok"] else 1)
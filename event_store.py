@@ -0,0 +1,177 @@
+"""
+Local SQLite store for the issuing authorizations and transactions the
+monitors have seen.
+
+Every object is kept with its card, creation time and status (indexed), and
+the newest seen ID per card and object type is kept as a resume cursor, so a
+restarted monitor continues exactly where it stopped instead of listing the
+card again. The store also answers "what happened on card X recently"
+without calling the API.
+
+A stored status is the one the object had when it was last saved, and the
+incremental pollers never list an object twice. Pending authorizations are
+brought up to date with IncrementalPoller.refresh(), which re-fetches every
+row unsettled() returns.
+
+The database lives in card_events.db unless CARD_EVENT_STORE points
+elsewhere.
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+from card_activity import card_id_of
+
+DEFAULT_PATH = "card_events.db"
+# Statuses an authorization can still move on from (to closed, reversed or expired)
+OPEN_STATUSES = ("pending",)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS issuing_objects (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    card_id TEXT NOT NULL,
+    created INTEGER NOT NULL,
+    status TEXT,
+    approved INTEGER,
+    amount INTEGER,
+    currency TEXT,
+    merchant TEXT,
+    payload TEXT NOT NULL,
+    seen_at INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_objects_card_created ON issuing_objects (card_id, kind, created);
+CREATE INDEX IF NOT EXISTS idx_objects_status ON issuing_objects (status);
+CREATE TABLE IF NOT EXISTS cursors (
+    card_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    cursor TEXT NOT NULL,
+    updated_at INTEGER NOT NULL,
+    PRIMARY KEY (card_id, kind)
+);
+"""
+
+
+def _merchant_name(obj):
+    merchant_data = getattr(obj, "merchant_data", None)
+    return merchant_data.name if merchant_data else None
+
+
+def _payload(obj):
+    # str() of a StripeObject is its JSON representation on every SDK version
+    return json.dumps(json.loads(str(obj)), separators=(",", ":"))
+
+
+class EventStore:
+    """Thread-safe SQLite store of seen issuing objects and resume cursors"""
+
+    def __init__(self, path=None):
+        """
+        Args:
+            path (str): Database file (defaults to $CARD_EVENT_STORE or card_events.db)
+        """
+        self.path = path or os.getenv("CARD_EVENT_STORE", DEFAULT_PATH)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock, self._db:
+            self._db.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def save(self, kind, objects):
+        """
+        Insert or refresh authorizations or transactions.
+
+        Args:
+            kind (str): The Stripe object type, e.g. "issuing.authorization"
+            objects: Stripe objects of that type
+        """
+        now = int(time.time())
+        rows = [
+            (
+                obj.id, kind, card_id_of(obj), obj.created,
+                getattr(obj, "status", None),
+                None if getattr(obj, "approved", None) is None else int(obj.approved),
+                obj.amount, obj.currency, _merchant_name(obj), _payload(obj), now,
+            )
+            for obj in objects
+        ]
+        if not rows:
+            return
+        with self._lock, self._db:
+            self._db.executemany(
+                """
+                INSERT INTO issuing_objects
+                    (id, kind, card_id, created, status, approved, amount, currency, merchant, payload, seen_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET
+                    status = excluded.status,
+                    approved = excluded.approved,
+                    payload = excluded.payload
+                """,
+                rows,
+            )
+
+    def cursor(self, card_id, kind):
+        """Return the newest seen object ID for a card, or None"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT cursor FROM cursors WHERE card_id = ? AND kind = ?", (card_id, kind)
+            ).fetchone()
+        return row["cursor"] if row else None
+
+    def set_cursor(self, card_id, kind, cursor):
+        """Record the newest seen object ID for a card"""
+        with self._lock, self._db:
+            self._db.execute(
+                """
+                INSERT INTO cursors (card_id, kind, cursor, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (card_id, kind) DO UPDATE SET
+                    cursor = excluded.cursor,
+                    updated_at = excluded.updated_at
+                """,
+                (card_id, kind, cursor, int(time.time())),
+            )
+
+    def unsettled(self, card_id, kind):
+        """Return the IDs of a card's stored objects whose status may still change"""
+        placeholders = ", ".join("?" for _ in OPEN_STATUSES)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT id FROM issuing_objects WHERE card_id = ? AND kind = ? AND status IN ({placeholders})",
+                (card_id, kind, *OPEN_STATUSES),
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+    def recent(self, card_id, kind, since=None, status=None, limit=None):
+        """
+        Return stored objects for a card, newest first.
+
+        Args:
+            card_id (str): The Stripe issuing card ID
+            kind (str): The Stripe object type, e.g. "issuing.authorization"
+            since (int): Only objects created at or after this Unix time
+            status (str): Only objects with this status
+            limit (int): Maximum number of rows
+
+        Returns:
+            A list of sqlite3.Row with the indexed columns and the JSON payload
+        """
+        query = "SELECT * FROM issuing_objects WHERE card_id = ? AND kind = ?"
+        params = [card_id, kind]
+        if since is not None:
+            query += " AND created >= ?"
+            params.append(since)
+        if status is not None:
+            query += " AND status = ?"
+            params.append(status)
+        query += " ORDER BY created DESC, id DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            return self._db.execute(query, params).fetchall()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Watch many virtual cards through a single account-wide event stream.
+
+Instead of listing authorizations and transactions per card per tick, one
+`stripe.Event.list` call per tick fetches every new issuing event on the
+account (auto-paginated from the last seen event), and each object is
+routed to the subscribers of its card. API calls per tick stay constant no
+matter how many cards are watched.
+"""
+import time
+import argparse
+import stripe
+from bootstrap import require_stripe
+from card_activity import CardRouter, NewActivity
+from stripe_scheduler import INTERACTIVE, request_priority
+from issuing_webhook import FALLBACK_POLL_INTERVAL, shared_webhook_router
+
+EVENT_TYPES = ["issuing_authorization.created", "issuing_transaction.created"]
+
+
+class EventStreamPoller:
+    """Poll the account's issuing events once per tick and route them by card"""
+
+    def __init__(self, router=None, page_size=100):
+        self.router = router or CardRouter()
+        self.page_size = page_size
+        self.cursor = None
+        self.started_at = None
+
+    def prime(self):
+        """
+        Treat every event already on the account as seen.
+
+        Returns:
+            The ID of the newest existing issuing event, or None
+        """
+        self.started_at = int(time.time())
+        with request_priority(INTERACTIVE):
+            latest = stripe.Event.list(types=EVENT_TYPES, limit=1)
+        if latest.data:
+            self.cursor = latest.data[0].id
+        return self.cursor
+
+    def poll(self):
+        """
+        Fetch the events created since the last poll and route them.
+
+        Returns:
+            The number of events fetched, or None on a Stripe error (the
+            cursor is kept so the next poll catches up)
+        """
+        try:
+            with request_priority(INTERACTIVE):
+                events = self._fetch()
+        except stripe.error.StripeError as e:
+            print(f"❌ Error polling the event stream: {e}")
+            return None
+
+        if not events:
+            return 0
+        self.cursor = events[-1].id
+
+        auths = [e.data.object for e in events if e.type == "issuing_authorization.created"]
+        txs = [e.data.object for e in events if e.type == "issuing_transaction.created"]
+        if auths:
+            self.router.route_authorizations(auths)
+        if txs:
+            self.router.route_transactions(txs)
+        return len(events)
+
+    def _fetch(self):
+        params = {"types": EVENT_TYPES, "limit": self.page_size}
+        if self.cursor:
+            # ending_before pages towards newer events, oldest first
+            params["ending_before"] = self.cursor
+            return list(stripe.Event.list(**params).auto_paging_iter())
+        # No events existed when primed: take everything since then
+        params["created"] = {"gte": self.started_at}
+        events = list(stripe.Event.list(**params).auto_paging_iter())
+        events.reverse()
+        return events
+
+
+def watch_cards(card_ids, interval=10, duration=None):
+    """
+    Monitor any number of cards with one event-stream request per tick.
+
+    Args:
+        card_ids (list): The Stripe issuing card IDs to watch
+        interval (int): Poll interval in seconds
+        duration (int): Stop after this many seconds (None runs until Ctrl+C)
+
+    Returns:
+        A dict of card ID to the NewActivity tracking it
+    """
+    stream = EventStreamPoller()
+    activities = {}
+    for card_id in card_ids:
+        activities[card_id] = NewActivity(card_id)
+        stream.router.subscribe(card_id, activities[card_id].authorizations, activities[card_id].transactions)
+
+    try:
+        stream.prime()
+    except stripe.error.StripeError as e:
+        print(f"❌ Error establishing initial event stream position: {e}")
+        return activities
+
+    # Webhook deliveries reach the same handlers; polling only backs them up
+    webhook_router = shared_webhook_router()
+    if webhook_router:
+        for card_id, activity in activities.items():
+            webhook_router.subscribe(card_id, activity.authorizations, activity.transactions)
+        interval = max(interval, FALLBACK_POLL_INTERVAL)
+
+    print(f"Watching {len(card_ids)} card(s), polling the event stream every {interval} seconds")
+    print("Press Ctrl+C to stop monitoring\n")
+
+    start_time = time.time()
+    try:
+        while duration is None or time.time() - start_time < duration:
+            time.sleep(interval)
+            stream.poll()
+    except KeyboardInterrupt:
+        print("\nMonitoring stopped by user")
+    finally:
+        if webhook_router:
+            for card_id, activity in activities.items():
+                webhook_router.unsubscribe(card_id, activity.authorizations, activity.transactions)
+
+    return activities
+
+
+if __name__ == "__main__":
+    require_stripe()
+
+    parser = argparse.ArgumentParser(description="Watch many virtual cards through one event stream")
+    parser.add_argument("card_ids", nargs="*", help="Card IDs to watch")
+    parser.add_argument("--cards-file", help="File with one card ID per line")
+    parser.add_argument("--interval", type=int, default=10, help="Poll interval in seconds")
+    parser.add_argument("--duration", type=int, default=None, help="Stop after this many seconds")
+    args = parser.parse_args()
+
+    card_ids = list(args.card_ids)
+    if args.cards_file:
+        with open(args.cards_file) as f:
+            card_ids.extend(line.strip() for line in f if line.strip())
+    if not card_ids:
+        parser.error("Pass card IDs or --cards-file")
+
+    activities = watch_cards(card_ids, args.interval, args.duration)
+
+    print("\n=== Summary ===")
+    for card_id, activity in activities.items():
+        print(f"{card_id}: {activity.auth_count} new authorization(s), {activity.tx_count} new transaction(s)")
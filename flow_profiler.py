@@ -0,0 +1,189 @@
+"""
+Timelines and per-step statistics for browser flow runs.
+
+Every run outcome (browserbase_redcross.run(), make_donation(), ...) holds
+its steps with a monotonic "start", their "seconds" and, for flow steps, the
+page calls made within them. This module turns those outcomes into:
+
+    timeline(result)             the run's steps and calls, in seconds from its start
+    chrome_trace(results)        a trace for chrome://tracing or ui.perfetto.dev,
+                                 one lane per run
+    step_percentiles(results)    count, p50, p95 and max of every step across runs
+    write_profile(results, dir)  <name>.timeline.json and <name>.trace.json in dir
+    record_run(result, dir, name)
+                                 append a run to <name>.runs.jsonl in dir and rewrite
+                                 the profile and percentiles of every run recorded
+                                 there, so repeated single runs of a script add up
+
+Playwright tracing (screenshots, DOM snapshots and network per action,
+viewed with `playwright show-trace`) is optional and heavier; start_tracing()
+and stop_tracing() wrap a context with it:
+
+    start_tracing(lease.context)
+    ...
+    stop_tracing(lease.context, "profiles/ic_123.playwright.zip")
+"""
+import os
+import json
+import math
+
+DEFAULT_DIRECTORY = "profiles"
+
+
+def _relative(steps):
+    starts = [step["start"] for step in steps if step.get("start") is not None]
+    return min(starts) if starts else 0.0
+
+
+def timeline(result):
+    """
+    Lay a run's steps out relative to its first step.
+
+    Returns:
+        {"card_id", "ok", "error", "seconds", "steps"}, each step with its
+        "start" and its calls' "start" in seconds from the run's start
+    """
+    origin = _relative(result["steps"])
+    steps = []
+    for step in result["steps"]:
+        start = step.get("start")
+        entry = dict(step, start=None if start is None else round(start - origin, 3))
+        if "calls" in step:
+            entry["calls"] = [dict(call, start=round(call["start"] - origin, 3)) for call in step["calls"]]
+        steps.append(entry)
+    ends = [step["start"] + step["seconds"] for step in steps if step["start"] is not None and step["seconds"]]
+    return {
+        "card_id": result.get("card_id"),
+        "ok": result.get("ok"),
+        "error": result.get("error"),
+        "seconds": round(max(ends), 3) if ends else 0.0,
+        "steps": steps,
+    }
+
+
+def chrome_trace(results):
+    """
+    Build a Chrome trace of the runs (Trace Event Format, complete events).
+
+    Runs of one process share a clock, so concurrent runs line up; each run
+    is its own thread lane named after its card.
+    """
+    origin = min((_relative(result["steps"]) for result in results if result["steps"]), default=0.0)
+    events = []
+    for lane, result in enumerate(results, start=1):
+        events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": lane,
+                       "args": {"name": f"{result.get('card_id')} ({'ok' if result.get('ok') else 'failed'})"}})
+        for step in result["steps"]:
+            if step.get("start") is None or step["seconds"] is None:
+                continue
+            events.append({
+                "name": step["name"], "cat": "step", "ph": "X", "pid": 1, "tid": lane,
+                "ts": round((step["start"] - origin) * 1e6), "dur": round(step["seconds"] * 1e6),
+                "args": {"ok": step["ok"], "error": step["error"]},
+            })
+            for call in step.get("calls", []):
+                events.append({
+                    "name": call["call"], "cat": "call", "ph": "X", "pid": 1, "tid": lane,
+                    "ts": round((call["start"] - origin) * 1e6), "dur": round(call["seconds"] * 1e6),
+                })
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def _percentile(ordered, p):
+    # Nearest rank, so a percentile is always a duration that was observed
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def step_percentiles(results):
+    """
+    Aggregate every step's duration across runs.
+
+    Returns:
+        {step name: {"count", "p50", "p95", "max"}} in the order steps first ran
+    """
+    durations = {}
+    for result in results:
+        for step in result["steps"]:
+            if step["seconds"] is not None:
+                durations.setdefault(step["name"], []).append(step["seconds"])
+    stats = {}
+    for name, seconds in durations.items():
+        ordered = sorted(seconds)
+        stats[name] = {
+            "count": len(ordered),
+            "p50": _percentile(ordered, 50),
+            "p95": _percentile(ordered, 95),
+            "max": ordered[-1],
+        }
+    return stats
+
+
+def print_percentiles(stats):
+    print(f"\n{'Step':<24}{'Runs':>6}{'p50':>10}{'p95':>10}{'Max':>10}")
+    for name, step in stats.items():
+        print(f"{name:<24}{step['count']:>6}{step['p50']:>9.2f}s{step['p95']:>9.2f}s{step['max']:>9.2f}s")
+
+
+def write_profile(results, directory, name="runs"):
+    """
+    Write the runs' timelines with their step percentiles, and their Chrome trace.
+
+    Returns:
+        (timeline_path, trace_path)
+    """
+    os.makedirs(directory, exist_ok=True)
+    timeline_path = os.path.join(directory, f"{name}.timeline.json")
+    trace_path = os.path.join(directory, f"{name}.trace.json")
+    with open(timeline_path, "w") as f:
+        json.dump({"steps": step_percentiles(results), "runs": [timeline(result) for result in results]}, f, indent=2)
+    with open(trace_path, "w") as f:
+        json.dump(chrome_trace(results), f)
+    return timeline_path, trace_path
+
+
+def record_run(result, directory=DEFAULT_DIRECTORY, name="runs"):
+    """
+    Add a run to the runs recorded in `directory` under `name`, write their
+    profile and print their step percentiles.
+
+    Returns:
+        Every run recorded so far, oldest first
+    """
+    os.makedirs(directory, exist_ok=True)
+    runs_path = os.path.join(directory, f"{name}.runs.jsonl")
+    with open(runs_path, "a") as f:
+        f.write(json.dumps(result, default=str) + "\n")
+    with open(runs_path) as f:
+        runs = [json.loads(line) for line in f if line.strip()]
+    print_percentiles(step_percentiles(runs))
+    timeline_path, trace_path = write_profile(runs, directory, name)
+    print(f"{len(runs)} run(s) profiled in {runs_path}; timeline saved as {timeline_path}, Chrome trace as {trace_path}")
+    return runs
+
+
+def start_tracing(context):
+    """Record a Playwright trace of everything the context does"""
+    context.tracing.start(screenshots=True, snapshots=True)
+
+
+def stop_tracing(context, path):
+    """Save the context's Playwright trace; a failure to save is reported, not raised"""
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        context.tracing.stop(path=path)
+        print(f"Playwright trace saved as {path}")
+    except Exception as e:
+        print(f"⚠️  Could not save the Playwright trace: {e}")
+
+
+async def start_tracing_async(context):
+    await context.tracing.start(screenshots=True, snapshots=True)
+
+
+async def stop_tracing_async(context, path):
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        await context.tracing.stop(path=path)
+        print(f"Playwright trace saved as {path}")
+    except Exception as e:
+        print(f"⚠️  Could not save the Playwright trace: {e}")
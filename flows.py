@@ -0,0 +1,529 @@
+"""
+Declarative browser flows and the one executor that runs them.
+
+A flow is a dict with a name and a list of steps. Each step is a dict with
+a "name", an "action" and the action's keys:
+
+    goto    url, wait_until (load state to wait for, default "load")
+    click   selector, or selectors (all are raced and whichever becomes
+            visible first is clicked; the step records it as "selector")
+    fill    fields: {selector: card profile attribute}, selects: the same
+            for <select> elements; all of them are set in one evaluation
+    pause   seconds
+    wait    selector to wait for, or state (a load state)
+
+Any step may also have:
+
+    message   printed before the step runs
+    wait_for  selector that must appear before the action
+    then      load state to wait for after the action
+    ready     what the next step needs, waited for after the action:
+              {"selector": ...}, {"selectors": [...]} (raced),
+              {"url": glob, regex or predicate} or {"response": part of
+              the URL of a resource that must have finished loading}
+    fallback  load state waited for instead when the ready condition does
+              not hold within ready_timeout (default "networkidle", None
+              to fail the step instead)
+    ready_timeout  milliseconds to wait for it (default 15000)
+    timeout   milliseconds for each page call (default 60000)
+    optional  if true a failure is reported and the flow carries on
+
+Field bindings name CardProfile attributes ("first_name", "exp_year_short",
+...), so one spec serves every card. run_flow() runs a flow on a sync
+Playwright page and run_flow_async() on an async one. Both time every step,
+and every page call within it, into the caller's result, and if a required step fails they save a
+screenshot (when the flow names one) and raise the step's error.
+
+    result = {"steps": []}
+    run_flow(page, redcross_donation_flow(), profile, result)
+"""
+import time
+import asyncio
+from contextlib import contextmanager
+
+DEFAULT_TIMEOUT = 60000
+# A ready condition that hasn't held by then most likely never will, and the
+# step falls back to waiting for the page to go quiet
+READY_TIMEOUT = 15000
+FALLBACK_STATE = "networkidle"
+
+REDCROSS_DONATION_URL = "https://www.redcross.org/donate/donation.html"
+# Raced when submitting; the page has used each of them
+DONATE_SELECTORS = [
+    "text=Donate",
+    "button:has-text('Donate')",
+    "input[type='submit'][value='Donate']",
+    "#donate-button",
+    ".donate-button",
+]
+
+_SLEEP = object()
+_RACE = object()
+
+# True once every selector matches an element; selectors the browser can't
+# parse (Playwright-only syntax) count as present and are filled by Playwright
+_ALL_PRESENT_JS = """
+selectors => selectors.every(selector => {
+    try {
+        return document.querySelector(selector) !== null;
+    } catch (e) {
+        return true;
+    }
+})
+"""
+
+# True once a resource whose URL contains the pattern has finished loading
+_RESPONSE_LOADED_JS = """
+pattern => performance.getEntriesByType("resource").some(
+    entry => entry.name.includes(pattern) && entry.responseEnd > 0
+)
+"""
+
+# Set each field the way typing would (through the native value setter, so
+# framework-controlled inputs notice) and return the selectors it couldn't set
+_BATCH_FILL_JS = """
+fields => {
+    const unfilled = [];
+    for (const {selector, value, select} of fields) {
+        let element = null;
+        try {
+            element = document.querySelector(selector);
+        } catch (e) {}
+        if (!element) {
+            unfilled.push(selector);
+            continue;
+        }
+        try {
+            if (select) {
+                const option = Array.from(element.options || []).find(
+                    option => option.value === value || option.label.trim() === value
+                );
+                if (!option) {
+                    unfilled.push(selector);
+                    continue;
+                }
+                element.value = option.value;
+            } else {
+                const prototype = element instanceof HTMLTextAreaElement
+                    ? HTMLTextAreaElement.prototype : HTMLInputElement.prototype;
+                element.focus();
+                Object.getOwnPropertyDescriptor(prototype, "value").set.call(element, value);
+            }
+            element.dispatchEvent(new Event("input", {bubbles: true}));
+            element.dispatchEvent(new Event("change", {bubbles: true}));
+            element.blur();
+            // A mask or maxlength that rewrote the value needs real typing
+            if (!select && element.value !== value) {
+                unfilled.push(selector);
+            }
+        } catch (e) {
+            unfilled.push(selector);
+        }
+    }
+    return unfilled;
+}
+"""
+
+
+class FlowError(Exception):
+    """A step could not be carried out"""
+
+
+def redcross_donation_flow(review_delay=0):
+    """
+    The $75 Red Cross donation, paid with the card profile.
+
+    Args:
+        review_delay (int): Seconds to pause on the filled form before submitting,
+            so someone watching the session can check it. Each script keeps the
+            pause it always had: 10 s in redcross_donation, 5 s in
+            redcross_donation_sync, none in browserbase_redcross and
+            donation_with_monitoring, and none in the unattended donation_runner
+
+    Returns:
+        The flow spec
+    """
+    return {
+        "name": "redcross_donation",
+        "screenshot": "redcross_error.png",
+        "steps": [
+            {"name": "open_donation_page", "action": "goto", "url": REDCROSS_DONATION_URL,
+             "wait_until": "domcontentloaded", "ready": {"selector": "#modf-handle-0-radio"},
+             "message": "Navigating to Red Cross donation page..."},
+            {"name": "choose_amount", "action": "click", "selector": "#modf-handle-0-radio",
+             "message": "Selecting $75 donation amount..."},
+            {"name": "continue", "action": "click", "selector": "text=Continue",
+             "ready": {"selectors": ["text=credit card", "input[name='bill_to_forename']"]},
+             "message": "Proceeding to next step..."},
+            {"name": "choose_credit_card", "action": "click", "selector": "text=credit card", "optional": True,
+             "message": "Selecting credit card payment method..."},
+            {"name": "continue_to_payment", "action": "click", "selector": "text=Continue", "optional": True,
+             "ready": {"selector": "input[name='bill_to_forename']"}},
+            {"name": "fill_billing", "action": "fill",
+             "message": "Filling billing information...",
+             "fields": {
+                 "input[name='bill_to_forename']": "first_name",
+                 "input[name='bill_to_surname']": "last_name",
+                 "input[name='bill_to_email']": "email",
+                 "input[name='bill_to_phone']": "phone",
+             }},
+            {"name": "fill_address", "action": "fill",
+             "message": "Filling address information...",
+             "fields": {
+                 "input[name='bill_to_address_line1']": "line1",
+                 "input[name='bill_to_address_city']": "city",
+                 "input[name='bill_to_address_postal_code']": "postal_code",
+             },
+             "selects": {"select#bill_to_address_state": "state"}},
+            {"name": "fill_card", "action": "fill",
+             "message": "Filling card information...",
+             "fields": {
+                 "input#cardnumber": "number",
+                 "input#MM": "exp_month",
+                 "input#YY": "exp_year_short",
+                 "input#CVC": "cvc",
+             }},
+            {"name": "review", "action": "pause", "seconds": review_delay,
+             "message": "\n✅ Form filled with virtual card details\n"
+                        "⚠️  This is a TEST donation using a TEST card in Stripe's test mode\n"
+                        "⚠️  No actual charges will be made"},
+            {"name": "submit", "action": "click", "selectors": DONATE_SELECTORS,
+             "message": "Submitting donation..."},
+        ],
+    }
+
+
+@contextmanager
+def timed_step(result, name):
+    """
+    Time the block as a step of `result`, recording whether it raised.
+
+    "start" is the perf_counter() reading when the step began, so the steps
+    of one process can be laid out on a timeline (see flow_profiler.py).
+    """
+    started = time.perf_counter()
+    step = {"name": name, "ok": False, "start": started, "seconds": None, "error": None}
+    result["steps"].append(step)
+    try:
+        yield step
+    except BaseException as e:
+        step["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        step["seconds"] = round(time.perf_counter() - started, 3)
+    step["ok"] = True
+
+
+def _visible_candidates(page, selectors):
+    """One locator per selector, matching only visible elements"""
+    return [page.locator(f"{selector} >> visible=true").first for selector in selectors]
+
+
+def race_selectors(page, selectors, timeout=DEFAULT_TIMEOUT):
+    """
+    Wait for all the selectors at once and return the first to become visible.
+
+    Args:
+        page: A sync Playwright page
+        selectors (list): Candidate selectors, preferred first when several match
+        timeout (int): Milliseconds to wait for any of them
+
+    Returns:
+        The selector that matched
+
+    Raises:
+        FlowError: None of them became visible in time
+    """
+    candidates = _visible_candidates(page, selectors)
+    race = candidates[0]
+    for candidate in candidates[1:]:
+        race = race.or_(candidate)
+    try:
+        race.first.wait_for(state="visible", timeout=timeout)
+    except Exception as e:
+        raise FlowError(f"None of {selectors} became visible within {timeout} ms") from e
+    for selector, candidate in zip(selectors, candidates):
+        if candidate.is_visible():
+            return selector
+    raise FlowError(f"None of {selectors} stayed visible")
+
+
+async def race_selectors_async(page, selectors, timeout=DEFAULT_TIMEOUT):
+    """race_selectors() on an async Playwright page"""
+    candidates = _visible_candidates(page, selectors)
+    race = candidates[0]
+    for candidate in candidates[1:]:
+        race = race.or_(candidate)
+    try:
+        await race.first.wait_for(state="visible", timeout=timeout)
+    except Exception as e:
+        raise FlowError(f"None of {selectors} became visible within {timeout} ms") from e
+    for selector, candidate in zip(selectors, candidates):
+        if await candidate.is_visible():
+            return selector
+    raise FlowError(f"None of {selectors} stayed visible")
+
+
+def _value(profile, key):
+    value = getattr(profile, key)
+    if value is None:
+        raise FlowError(f"The card profile has no {key}")
+    return str(value)
+
+
+def _calls(step, profile, record):
+    """
+    Yield the page calls of a step as (method, args, kwargs).
+
+    The result of each call is sent back in, and a failed call's error is
+    raised at the yield, so a step can branch on either. Details worth
+    keeping (such as the selector a race picked) go into `record`.
+    """
+    action = step["action"]
+    timeout = step.get("timeout", DEFAULT_TIMEOUT)
+    if step.get("wait_for"):
+        yield "wait_for_selector", (step["wait_for"],), {"timeout": timeout}
+
+    if action == "goto":
+        yield "goto", (step["url"],), {"wait_until": step.get("wait_until", "load"), "timeout": timeout}
+    elif action == "click":
+        selectors = step.get("selectors") or [step["selector"]]
+        selector = selectors[0]
+        if len(selectors) > 1:
+            selector = yield _RACE, (selectors, timeout), {}
+            record["selector"] = selector
+        yield "click", (selector,), {"timeout": timeout}
+    elif action == "fill":
+        yield from _batched_fill(step, profile, timeout)
+    elif action == "pause":
+        if step["seconds"]:
+            print(f"Waiting {step['seconds']} seconds before the next step...")
+            yield _SLEEP, (step["seconds"],), {}
+    elif action == "wait":
+        if step.get("selector"):
+            yield "wait_for_selector", (step["selector"],), {"timeout": timeout}
+        else:
+            yield "wait_for_load_state", (step.get("state", "load"),), {"timeout": timeout}
+    else:
+        raise FlowError(f"Unknown action {action!r} in step {step['name']}")
+
+    if step.get("then"):
+        yield "wait_for_load_state", (step["then"],), {"timeout": timeout}
+    if step.get("ready"):
+        yield from _ready_calls(
+            step["ready"], step.get("ready_timeout", READY_TIMEOUT), step.get("fallback", FALLBACK_STATE),
+            timeout, record,
+        )
+
+
+def _ready_calls(ready, ready_timeout, fallback, timeout, record):
+    """
+    Yield the page calls that wait for a ready condition.
+
+    Records what held as record["ready"]; when the condition times out the
+    fallback load state is waited for instead, unless there is none.
+    """
+    if not ready.keys() & {"selector", "selectors", "url", "response"}:
+        raise FlowError(f"Unknown ready condition {ready!r}")
+    try:
+        if "selector" in ready:
+            yield "wait_for_selector", (ready["selector"],), {"state": "visible", "timeout": ready_timeout}
+            record["ready"] = ready["selector"]
+        elif "selectors" in ready:
+            record["ready"] = yield _RACE, (ready["selectors"], ready_timeout), {}
+        elif "url" in ready:
+            yield "wait_for_url", (ready["url"],), {"wait_until": "commit", "timeout": ready_timeout}
+            record["ready"] = "url"
+        else:
+            yield "wait_for_function", (_RESPONSE_LOADED_JS,), {"arg": ready["response"], "timeout": ready_timeout}
+            record["ready"] = ready["response"]
+    except Exception as e:
+        if fallback is None:
+            raise
+        print(f"⚠️  Page not ready ({type(e).__name__}), waiting for {fallback} instead")
+        yield "wait_for_load_state", (fallback,), {"timeout": timeout}
+        record["ready"] = f"{fallback} (fallback)"
+
+
+def wait_until_ready(page, ready, ready_timeout=READY_TIMEOUT, fallback=FALLBACK_STATE, timeout=DEFAULT_TIMEOUT):
+    """
+    Wait for a ready condition on a sync Playwright page.
+
+    Args:
+        page: The page to wait on
+        ready (dict): The condition, as in a flow step's "ready"
+        ready_timeout (int): Milliseconds before falling back
+        fallback (str): Load state to wait for if the condition doesn't hold, or None to raise
+        timeout (int): Milliseconds to wait for the fallback
+
+    Returns:
+        What held: the selector or response pattern, "url", or the fallback
+    """
+    record = {}
+    _drive(page, _ready_calls(ready, ready_timeout, fallback, timeout, record), record)
+    return record["ready"]
+
+
+async def wait_until_ready_async(page, ready, ready_timeout=READY_TIMEOUT, fallback=FALLBACK_STATE,
+                                 timeout=DEFAULT_TIMEOUT):
+    """wait_until_ready() on an async Playwright page"""
+    record = {}
+    await _drive_async(page, _ready_calls(ready, ready_timeout, fallback, timeout, record), record)
+    return record["ready"]
+
+
+def _batched_fill(step, profile, timeout):
+    """
+    Fill every field of a step in one page evaluation.
+
+    Waits once for all the fields, then sets them and fires their events in
+    a single round trip; only fields that could not be set that way are
+    filled one by one with Playwright.
+    """
+    fields = [
+        {"selector": selector, "value": _value(profile, key), "select": False}
+        for selector, key in step.get("fields", {}).items()
+    ] + [
+        {"selector": selector, "value": _value(profile, key), "select": True}
+        for selector, key in step.get("selects", {}).items()
+    ]
+    if not fields:
+        return
+    selectors = [field["selector"] for field in fields]
+    try:
+        yield "wait_for_function", (_ALL_PRESENT_JS,), {"arg": selectors, "timeout": timeout}
+        unfilled = yield "evaluate", (_BATCH_FILL_JS, fields), {}
+    except Exception as e:
+        print(f"⚠️  Batched fill of {step['name']} failed ({type(e).__name__}), filling field by field")
+        unfilled = selectors
+    for field in fields:
+        if field["selector"] in unfilled:
+            method = "select_option" if field["select"] else "fill"
+            yield method, (field["selector"], field["value"]), {"timeout": timeout}
+
+
+def _failed(step, error):
+    """Report a failed step; returns whether the flow must stop"""
+    if step.get("optional"):
+        print(f"⚠️  Skipping {step['name']}: {error}")
+        return False
+    print(f"❌ Step {step['name']} failed: {error}")
+    return True
+
+
+def _call_name(method):
+    if method is _SLEEP:
+        return "sleep"
+    if method is _RACE:
+        return "race_selectors"
+    return method
+
+
+def _drive(page, calls, record):
+    """
+    Make a step's page calls, feeding each result (or error) back to it.
+
+    Every call is timed into record["calls"] as {"call", "start", "seconds"}.
+    """
+    timings = record.setdefault("calls", [])
+    value = error = None
+    while True:
+        try:
+            method, args, kwargs = calls.throw(error) if error else calls.send(value)
+        except StopIteration:
+            return
+        value = error = None
+        started = time.perf_counter()
+        try:
+            if method is _SLEEP:
+                time.sleep(*args)
+            elif method is _RACE:
+                value = race_selectors(page, *args)
+            else:
+                value = getattr(page, method)(*args, **kwargs)
+        except Exception as e:
+            error = e
+        timings.append({"call": _call_name(method), "start": started,
+                        "seconds": round(time.perf_counter() - started, 3)})
+
+
+async def _drive_async(page, calls, record):
+    timings = record.setdefault("calls", [])
+    value = error = None
+    while True:
+        try:
+            method, args, kwargs = calls.throw(error) if error else calls.send(value)
+        except StopIteration:
+            return
+        value = error = None
+        started = time.perf_counter()
+        try:
+            if method is _SLEEP:
+                await asyncio.sleep(*args)
+            elif method is _RACE:
+                value = await race_selectors_async(page, *args)
+            else:
+                value = await getattr(page, method)(*args, **kwargs)
+        except Exception as e:
+            error = e
+        timings.append({"call": _call_name(method), "start": started,
+                        "seconds": round(time.perf_counter() - started, 3)})
+
+
+def run_flow(page, flow, profile, result):
+    """
+    Run a flow on a sync Playwright page.
+
+    Args:
+        page: The page to run it on
+        flow (dict): The flow spec
+        profile: The CardProfile the fields are filled from
+        result (dict): Outcome whose "steps" list receives each step's timing
+
+    Raises:
+        Exception: The error of the first required step that failed
+    """
+    for step in flow["steps"]:
+        if step.get("message"):
+            print(step["message"])
+        try:
+            with timed_step(result, step["name"]) as record:
+                _drive(page, _calls(step, profile, record), record)
+        except Exception as e:
+            if _failed(step, e):
+                _screenshot(page, flow)
+                raise
+    return result
+
+
+async def run_flow_async(page, flow, profile, result):
+    """run_flow() on an async Playwright page"""
+    for step in flow["steps"]:
+        if step.get("message"):
+            print(step["message"])
+        try:
+            with timed_step(result, step["name"]) as record:
+                await _drive_async(page, _calls(step, profile, record), record)
+        except Exception as e:
+            if _failed(step, e):
+                await _screenshot_async(page, flow)
+                raise
+    return result
+
+
+def _screenshot(page, flow):
+    if flow.get("screenshot"):
+        try:
+            page.screenshot(path=flow["screenshot"])
+            print(f"Screenshot saved as {flow['screenshot']}")
+        except Exception:
+            pass
+
+
+async def _screenshot_async(page, flow):
+    if flow.get("screenshot"):
+        try:
+            await page.screenshot(path=flow["screenshot"])
+            print(f"Screenshot saved as {flow['screenshot']}")
+        except Exception:
+            pass
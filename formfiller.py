@@ -1,32 +1,11 @@
-import os
 import json
 import asyncio
 import stripe
 import argparse
-from dotenv import load_dotenv
-from playwright.async_api import async_playwright
-from langchain_openai import ChatOpenAI
-
-load_dotenv()
-gpt4 = ChatOpenAI(model="gpt-4", temperature=0)
-
-# Set up Stripe API key
-stripe_api_key = os.getenv("STRIPE_API_KEY")
-
-# Validate that we're using a test API key
-if not stripe_api_key:
-    print("\n⚠️  No Stripe API key found in .env file. Please add your test API key.")
-    print("    Get a test API key from https://dashboard.stripe.com/test/apikeys")
-    exit(1)
-elif not stripe_api_key.startswith("sk_test_"):
-    print("\n❌ ERROR: You must use a Stripe TEST API key (starts with sk_test_)")
-    print("    This program is designed to run in test mode only.")
-    print("    Get a test API key from https://dashboard.stripe.com/test/apikeys")
-    exit(1)
-
-stripe.api_key = stripe_api_key
-print("✅ Using Stripe TEST mode")
-
+from bootstrap import chat_model, require_stripe
+from card_profiles import shared_profiles
+from cardholder_registry import is_cardholder_error, shared_registry
+from request_blocking import RequestBlocker, block_option, describe
 
 # Default form data (will be overridden if using a virtual card)
 form_data = {
@@ -43,7 +22,10 @@ form_data = {
 }
 
 def create_cardholder():
-    """Create a new cardholder in Stripe."""
+    """Return the Browserbase User cardholder ID, creating the cardholder only if it doesn't exist yet."""
+    return shared_registry().get_or_create("Browserbase User", "hello@browserbase.com", _new_cardholder)
+
+def _new_cardholder():
     try:
         cardholder = stripe.issuing.Cardholder.create(
             name="Browserbase User",
@@ -88,52 +70,39 @@ def create_virtual_card(cardholder_id):
         return card
     except Exception as e:
         print(f"❌ Error creating virtual card: {e}")
+        if is_cardholder_error(e):
+            shared_registry().forget(cardholder_id)
         return None
 
 def get_card_details(card_id):
-    """Retrieve the details of a virtual card."""
+    """Retrieve the (cached) profile of a virtual card."""
     try:
-        card = stripe.issuing.Card.retrieve(card_id, expand=['number', 'cvc'])
-        
-        card_info = {
-            'name': card.cardholder.name,
-            'email': card.cardholder.email,
-            'phone': card.cardholder.phone_number,
-            'address': card.cardholder.billing.address.line1,
-            'city': card.cardholder.billing.address.city,
-            'state': card.cardholder.billing.address.state,
-            'zipcode': card.cardholder.billing.address.postal_code,
-            'card': card.number,
-            'expiry': f"{card.exp_month:02d}/{str(card.exp_year)[-2:]}",
-            'cvv': card.cvc,
-        }
-        
-        # Print card info (with masked card number for security)
-        masked_info = card_info.copy()
-        if masked_info.get('card'):
-            masked_info['card'] = f"****-****-****-{masked_info['card'][-4:]}"
-        if masked_info.get('cvv'):
-            masked_info['cvv'] = "***"
-        
-        print('💳 Card info:', masked_info)
-        return card_info
+        profile = shared_profiles().get(card_id)
     except Exception as e:
         print(f"❌ Error retrieving card details: {e}")
         return None
+    print('💳 Card info:', profile.masked())
+    return profile
 
-async def autofill_smart(url, use_virtual_card=False, card_id=None):
-    # If using a virtual card, get its details
+async def autofill_smart(url, use_virtual_card=False, card_id=None, blocking="off"):
+    """Fill the form at `url`; `blocking` names a request_blocking profile for the page."""
+    # If using a virtual card, fill its details instead of the defaults
+    field_value = form_data.get
     if use_virtual_card and card_id:
         print(f"💳 Using virtual card with ID: {card_id}")
-        card_details = get_card_details(card_id)
-        if card_details:
-            # Update form_data with virtual card details
-            global form_data
-            form_data = card_details
+        card_profile = get_card_details(card_id)
+        if card_profile:
+            field_value = card_profile.field
     
+    from playwright.async_api import async_playwright
+
     async with async_playwright() as p:
         browser = await p.chromium.launch(headless=False)
-        page = await browser.new_page()
+        context = await browser.new_context()
+        blocker = RequestBlocker.from_profile(blocking)
+        if blocker:
+            await blocker.attach_async(context)
+        page = await context.new_page()
 
         print(f"🌐 Navigating to {url}...")
         await page.goto(url, wait_until="domcontentloaded", timeout=60000)
@@ -178,7 +147,7 @@ Inputs:
 
         print("🤖 Asking GPT-4 to map fields...")
         try:
-            response = await gpt4.ainvoke(prompt)
+            response = await chat_model().ainvoke(prompt)
             mappings = json.loads(response.content)
         except Exception as e:
             print("❌ Failed to parse LLM response:", e)
@@ -189,7 +158,7 @@ Inputs:
         for field in mappings:
             selector = field.get("selector")
             field_type = field.get("type")
-            value = form_data.get(field_type)
+            value = field_value(field_type)
             if selector and value:
                 try:
                     await page.fill(selector, value)
@@ -197,25 +166,33 @@ Inputs:
                 except Exception as e:
                     print(f"⚠️ Couldn't fill '{field_type}' → {selector}: {e}")
 
+        if blocker:
+            print(f"🚫 {describe(blocker.stats())}")
         print("\n💡 Form filled with payment information. Review before submitting.")
         print("⏳ Waiting for 30 seconds to allow manual review...")
         await asyncio.sleep(30)
         await browser.close()
 
 if __name__ == "__main__":
+    require_stripe()
     parser = argparse.ArgumentParser(description="Form filler with Stripe virtual card support")
     parser.add_argument("url", nargs='?', default=None, help="URL of the form to fill")
     parser.add_argument("--create-cardholder", action="store_true", help="Create a new cardholder")
     parser.add_argument("--create-card", metavar="CARDHOLDER_ID", help="Create a virtual card for the given cardholder ID")
     parser.add_argument("--use-card", metavar="CARD_ID", help="Use the specified virtual card ID for form filling")
+    parser.add_argument("--block", type=block_option, default="off", metavar="PROFILE[:DOMAIN,...]", help="Request-blocking profile for the page (off, lean, strict), optionally with extra domains to allow")
     
     args = parser.parse_args()
     
     if args.create_cardholder:
         # Create a new cardholder
-        cardholder = create_cardholder()
-        if cardholder:
-            print(f"\n✅ Successfully created cardholder with ID: {cardholder.id}")
+        try:
+            cardholder_id = create_cardholder()
+        except stripe.error.StripeError as e:
+            print(f"❌ Error looking up cardholder: {e}")
+            cardholder_id = None
+        if cardholder_id:
+            print(f"\n✅ Using cardholder with ID: {cardholder_id}")
             print("Use this ID to create a virtual card with --create-card option")
     
     elif args.create_card:
@@ -231,4 +208,4 @@ if __name__ == "__main__":
             parser.error("URL is required when filling forms")
         
         use_virtual_card = args.use_card is not None
-        asyncio.run(autofill_smart(args.url, use_virtual_card, args.use_card))
+        asyncio.run(autofill_smart(args.url, use_virtual_card, args.use_card, args.block))
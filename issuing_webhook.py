@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Local webhook receiver for Stripe Issuing events.
+
+Verifies the `Stripe-Signature` header of every request and dispatches
+`issuing_authorization.created` and `issuing_transaction.created` events to
+the same "new authorization / new transaction" handlers the polling
+monitors use. `issuing_card.updated` events are passed to the listeners
+registered with add_card_update_listener (e.g. to drop cached card
+profiles). Other issuing events are acknowledged and ignored.
+
+Events can come from the Stripe CLI:
+    stripe listen --forward-to localhost:4242/webhook
+or from the local replayer in replay_webhook_event.py.
+
+Configuration (.env):
+    STRIPE_WEBHOOK_SECRET  Signing secret (whsec_...); enables webhook mode
+    WEBHOOK_HOST           Interface to bind (default 127.0.0.1)
+    WEBHOOK_PORT           Port to listen on (default 4242)
+"""
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import stripe
+from bootstrap import load_config
+from card_activity import CardRouter, card_id_of, report_new_authorizations, report_new_transactions
+
+WEBHOOK_PATH = "/webhook"
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 4242
+# Poll interval monitors fall back to while webhooks deliver events
+FALLBACK_POLL_INTERVAL = 60
+ACCEPTED_EVENT_PREFIXES = ("issuing_authorization.", "issuing_transaction.", "issuing_card.")
+
+_shared_lock = threading.Lock()
+_shared_router = None
+_shared_started = False
+_card_update_listeners = []
+
+
+def add_card_update_listener(callback):
+    """Call `callback(card_id)` whenever an issuing_card.updated event arrives"""
+    with _shared_lock:
+        _card_update_listeners.append(callback)
+
+
+class IssuingWebhookHandler(BaseHTTPRequestHandler):
+    """Verify and dispatch one webhook delivery"""
+
+    def do_POST(self):
+        if self.path != WEBHOOK_PATH:
+            self._respond(404, "Not found")
+            return
+
+        payload = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        signature = self.headers.get("Stripe-Signature")
+        try:
+            event = stripe.Webhook.construct_event(payload, signature, self.server.webhook_secret)
+        except ValueError:
+            self._respond(400, "Invalid payload")
+            return
+        except stripe.error.SignatureVerificationError:
+            print("⚠️  Rejected webhook with an invalid signature")
+            self._respond(400, "Invalid signature")
+            return
+
+        # Acknowledge first so Stripe does not retry while handlers run
+        self._respond(200, "OK")
+        if event.type.startswith(ACCEPTED_EVENT_PREFIXES):
+            self.server.dispatch(event)
+
+    def _respond(self, status, message):
+        body = message.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Deliveries are reported by the handlers, not per request
+        pass
+
+
+class IssuingWebhookServer(ThreadingHTTPServer):
+    """HTTP server that routes verified issuing events to handlers"""
+
+    daemon_threads = True
+
+    def __init__(self, address, webhook_secret, on_authorization, on_transaction, card_id=None):
+        """
+        Args:
+            address: (host, port) to listen on
+            webhook_secret (str): The endpoint's signing secret (whsec_...)
+            on_authorization: Called with a list of new authorizations
+            on_transaction: Called with a list of new transactions
+            card_id (str): Only dispatch events for this card, if given
+        """
+        super().__init__(address, IssuingWebhookHandler)
+        self.webhook_secret = webhook_secret
+        self.on_authorization = on_authorization
+        self.on_transaction = on_transaction
+        self.card_id = card_id
+
+    def dispatch(self, event):
+        """Hand a verified event to the matching handler"""
+        obj = event.data.object
+        if event.type == "issuing_card.updated":
+            with _shared_lock:
+                listeners = list(_card_update_listeners)
+            for listener in listeners:
+                listener(obj.id)
+            return
+        if self.card_id and card_id_of(obj) != self.card_id:
+            return
+
+        if event.type == "issuing_authorization.created":
+            self.on_authorization([obj])
+        elif event.type == "issuing_transaction.created":
+            self.on_transaction([obj])
+
+    def start(self):
+        """Serve requests on a daemon thread and return immediately"""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        host, port = self.server_address[:2]
+        print(f"✅ Listening for Stripe webhooks on http://{host}:{port}{WEBHOOK_PATH}")
+        return thread
+
+
+def start_webhook_server(on_authorization, on_transaction, card_id=None):
+    """
+    Start a webhook receiver if STRIPE_WEBHOOK_SECRET is configured.
+
+    Returns:
+        The running IssuingWebhookServer, or None when webhooks are not
+        configured or the port cannot be bound (callers then keep polling)
+    """
+    webhook_secret = os.getenv("STRIPE_WEBHOOK_SECRET")
+    if not webhook_secret:
+        return None
+
+    host = os.getenv("WEBHOOK_HOST", DEFAULT_HOST)
+    port = int(os.getenv("WEBHOOK_PORT", DEFAULT_PORT))
+    try:
+        server = IssuingWebhookServer((host, port), webhook_secret, on_authorization, on_transaction, card_id)
+    except OSError as e:
+        print(f"⚠️  Could not start webhook receiver on {host}:{port}: {e}")
+        return None
+
+    server.start()
+    return server
+
+
+def shared_webhook_router():
+    """
+    Return the process-wide router fed by a single webhook receiver.
+
+    Monitors subscribe their card to this router instead of each binding the
+    webhook port. The receiver is started on first use.
+
+    Returns:
+        A CardRouter, or None when webhooks are not configured or the
+        receiver could not be started
+    """
+    global _shared_router, _shared_started
+    with _shared_lock:
+        if not _shared_started:
+            _shared_started = True
+            router = CardRouter()
+            if start_webhook_server(router.route_authorizations, router.route_transactions):
+                _shared_router = router
+        return _shared_router
+
+
+if __name__ == "__main__":
+    load_config()
+
+    if not os.getenv("STRIPE_WEBHOOK_SECRET"):
+        print("\n⚠️  No STRIPE_WEBHOOK_SECRET found in .env file.")
+        print("    Run `stripe listen --forward-to localhost:4242/webhook` to get one.")
+        sys.exit(1)
+
+    card_id = sys.argv[1] if len(sys.argv) > 1 else None
+    server = start_webhook_server(report_new_authorizations, report_new_transactions, card_id)
+    if not server:
+        sys.exit(1)
+
+    print("Press Ctrl+C to stop")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        print("\nWebhook receiver stopped")
+        server.shutdown()
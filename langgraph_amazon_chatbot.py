@@ -1,26 +1,22 @@
 import os
 import re
 import subprocess
+import threading
 from flask import Flask, request, jsonify
 import requests
-from langgraph.graph import StateGraph
-from langgraph.graph.message import add_messages
-import openai
-from dotenv import load_dotenv
+from bootstrap import load_config
 
-# Load environment variables from .env file
-load_dotenv()
+DEFAULT_SETTINGS = {
+    'ORDER_SERVER': 'http://localhost:3000/login',
+    'AMAZON_EMAIL': 'your-email@domain.com',
+    'AMAZON_PASSWORD': 'your-password',
+    'OPENAI_API_KEY': '',
+}
 
-ORDER_SERVER = os.environ.get('ORDER_SERVER', 'http://localhost:3000/login')
-AMAZON_EMAIL = os.environ.get('AMAZON_EMAIL', 'your-email@domain.com')
-AMAZON_PASSWORD = os.environ.get('AMAZON_PASSWORD', 'your-password')
-OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY', '')
-
-# Initialize OpenAI client
-openai.api_key = OPENAI_API_KEY
-print(f"OpenAI API Key loaded: {'Yes (first 5 chars: ' + OPENAI_API_KEY[:5] + '...)' if OPENAI_API_KEY else 'No'}")
-print(f"Amazon Email loaded: {'Yes' if AMAZON_EMAIL != 'your-email@domain.com' else 'No'}")
-print(f"Amazon Password loaded: {'Yes' if AMAZON_PASSWORD != 'your-password' else 'No'}")
+def setting(name):
+    """A setting from the environment, with .env loaded on first use rather than at import"""
+    load_config()
+    return os.environ.get(name, DEFAULT_SETTINGS[name])
 
 
 from flask import send_from_directory
@@ -29,7 +25,7 @@ app = Flask(__name__, static_folder='public')
 
 # --- TOOL WRAPPERS --- #
 def order_product(email, password, url):
-    resp = requests.post(ORDER_SERVER, json={
+    resp = requests.post(setting('ORDER_SERVER'), json={
         'email': email,
         'password': password,
         'productUrl': url
@@ -70,7 +66,7 @@ def detect_intent_node(state):
 
 def order_node(state):
     url = state.get('url')
-    result = order_product(AMAZON_EMAIL, AMAZON_PASSWORD, url)
+    result = order_product(setting('AMAZON_EMAIL'), setting('AMAZON_PASSWORD'), url)
     return {'response': f"Ordering this product: {url}\n{result}"}
 
 def cancel_node(state):
@@ -84,10 +80,11 @@ def chat_node(state):
     user_input = state.get('input', '')
     
     print(f"\n==== CHAT NODE CALLED ====\nUser input: {user_input}")
-    print(f"OpenAI API Key status: {'Set (first 5 chars: ' + OPENAI_API_KEY[:5] + '...)' if OPENAI_API_KEY else 'Not set'}")
+    openai_api_key = setting('OPENAI_API_KEY')
+    print(f"OpenAI API Key status: {'Set (first 5 chars: ' + openai_api_key[:5] + '...)' if openai_api_key else 'Not set'}")
     
     # If OpenAI API key is not set, use default response
-    if not OPENAI_API_KEY:
+    if not openai_api_key:
         print("No OpenAI API key found, using default response")
         return {'response': "I'm your Amazon assistant. Send me a product link to order, or ask to cancel an order."}
     
@@ -109,7 +106,10 @@ def chat_node(state):
         Keep your responses brief and conversational.
         """
         
-        # Call OpenAI API
+        # Call OpenAI API; the package is imported on first use to keep startup fast
+        import openai
+
+        openai.api_key = openai_api_key
         response = openai.chat.completions.create(
             model="gpt-3.5-turbo",
             messages=[
@@ -139,15 +139,6 @@ class ChatState(TypedDict, total=False):
     product: Optional[str]
     response: Optional[str]
 
-# Build the workflow graph
-state_schema = ChatState
-
-graph = StateGraph(state_schema)
-graph.add_node('detect_intent', detect_intent_node)
-graph.add_node('order', order_node)
-graph.add_node('cancel', cancel_node)
-graph.add_node('chat', chat_node)
-
 def route(state):
     intent = state.get('intent')
     if intent == 'order':
@@ -157,23 +148,40 @@ def route(state):
     else:
         return 'chat'
 
-graph.add_conditional_edges(
-    'detect_intent',
-    route,
-    {'order': 'order', 'cancel': 'cancel', 'chat': 'chat'}
-)
-graph.add_edge('order', '__end__')
-graph.add_edge('cancel', '__end__')
-graph.add_edge('chat', '__end__')
-graph.set_entry_point('detect_intent')
-workflow = graph.compile()
+_workflow = None
+_workflow_lock = threading.Lock()
+
+def workflow():
+    """Return the compiled chat workflow, building it (and importing langgraph) on first use"""
+    global _workflow
+    with _workflow_lock:
+        if _workflow is not None:
+            return _workflow
+        from langgraph.graph import StateGraph
+
+        graph = StateGraph(ChatState)
+        graph.add_node('detect_intent', detect_intent_node)
+        graph.add_node('order', order_node)
+        graph.add_node('cancel', cancel_node)
+        graph.add_node('chat', chat_node)
+        graph.add_conditional_edges(
+            'detect_intent',
+            route,
+            {'order': 'order', 'cancel': 'cancel', 'chat': 'chat'}
+        )
+        graph.add_edge('order', '__end__')
+        graph.add_edge('cancel', '__end__')
+        graph.add_edge('chat', '__end__')
+        graph.set_entry_point('detect_intent')
+        _workflow = graph.compile()
+    return _workflow
 
 @app.route('/chat', methods=['POST'])
 def chat():
     data = request.json
     message = data.get('message', '')
     state = {'input': message}
-    result = workflow.invoke(state)
+    result = workflow().invoke(state)
     return jsonify({'response': result.get('response', '')})
 
 # Static file handler must be defined after all API endpoints!
@@ -186,4 +194,8 @@ def serve_static(path):
         return send_from_directory(app.static_folder, 'index.html')
 
 if __name__ == '__main__':
+    openai_api_key = setting('OPENAI_API_KEY')
+    print(f"OpenAI API Key loaded: {'Yes (first 5 chars: ' + openai_api_key[:5] + '...)' if openai_api_key else 'No'}")
+    print(f"Amazon Email loaded: {'Yes' if setting('AMAZON_EMAIL') != DEFAULT_SETTINGS['AMAZON_EMAIL'] else 'No'}")
+    print(f"Amazon Password loaded: {'Yes' if setting('AMAZON_PASSWORD') != DEFAULT_SETTINGS['AMAZON_PASSWORD'] else 'No'}")
     app.run(port=5001, debug=True)
@@ -1,27 +1,12 @@
 #!/usr/bin/env python3
-import os
 import stripe
 import sys
 import datetime
-from dotenv import load_dotenv
+from bootstrap import require_stripe
 import time
+from card_monitor import CardMonitor
+from event_store import EventStore
 
-# Load environment variables
-load_dotenv()
-
-# Set up Stripe API key
-stripe_api_key = os.getenv("STRIPE_API_KEY")
-
-# Validate that we're using a test API key
-if not stripe_api_key:
-    print("\n⚠️  No Stripe API key found in .env file. Please add your test API key.")
-    exit(1)
-elif not stripe_api_key.startswith("sk_test_"):
-    print("\n❌ ERROR: You must use a Stripe TEST API key (starts with sk_test_)")
-    exit(1)
-
-stripe.api_key = stripe_api_key
-print("✅ Using Stripe TEST mode")
 
 def get_card_details(card_id):
     """Get basic details about the card"""
@@ -62,7 +47,7 @@ def check_card_authorizations(card_id):
         return authorizations.data
     except stripe.error.StripeError as e:
         print(f"❌ Error checking authorizations: {e}")
-        return []
+        return None
 
 def check_card_transactions(card_id):
     """Check for transactions on the card"""
@@ -92,7 +77,7 @@ def check_card_transactions(card_id):
         return transactions.data
     except stripe.error.StripeError as e:
         print(f"❌ Error checking transactions: {e}")
-        return []
+        return None
 
 def monitor_card_activity(card_id, interval=10, duration=60):
     """
@@ -111,14 +96,27 @@ def monitor_card_activity(card_id, interval=10, duration=60):
     if not card:
         return
     
-    print("\n=== Initial Card State ===")
-    print("Checking for existing authorizations...")
-    initial_auths = check_card_authorizations(card_id)
-    initial_auth_ids = set(auth.id for auth in initial_auths)
+    store = EventStore()
+    if store.cursor(card_id, "issuing.authorization") and store.cursor(card_id, "issuing.transaction"):
+        # Anything that happened while we were stopped is reported as new
+        print("\n=== Resuming from the local event store ===")
+        print(f"Using {store.path}; activity since the last run will be reported as new")
+    else:
+        print("\n=== Initial Card State ===")
+        print("Checking for existing authorizations...")
+        check_card_authorizations(card_id)
+        
+        print("\nChecking for existing transactions...")
+        check_card_transactions(card_id)
     
-    print("\nChecking for existing transactions...")
-    initial_txs = check_card_transactions(card_id)
-    initial_tx_ids = set(tx.id for tx in initial_txs)
+    # Only objects created after this point (or the stored cursor) are reported as new
+    monitor = CardMonitor(card_id, interval, store=store)
+    try:
+        monitor.start()
+    except stripe.error.StripeError as e:
+        print(f"❌ Error establishing initial card state: {e}")
+        store.close()
+        return
     
     print("\n=== Starting Monitoring ===")
     print("Run the Red Cross donation script in another terminal.")
@@ -127,65 +125,35 @@ def monitor_card_activity(card_id, interval=10, duration=60):
     start_time = time.time()
     try:
         while time.time() - start_time < duration:
-            time.sleep(interval)
-            
-            print(f"\n=== Checking at {datetime.datetime.now().strftime('%H:%M:%S')} ===")
-            
-            # Check for new authorizations
-            print("Checking for new authorizations...")
-            current_auths = check_card_authorizations(card_id)
-            current_auth_ids = set(auth.id for auth in current_auths)
+            time.sleep(min(interval, max(0, duration - (time.time() - start_time))))
             
-            new_auth_ids = current_auth_ids - initial_auth_ids
-            if new_auth_ids:
-                print(f"\n✅ DETECTED {len(new_auth_ids)} NEW AUTHORIZATION(S)!")
-                for auth in current_auths:
-                    if auth.id in new_auth_ids:
-                        print(f"  New authorization: {auth.id}")
-                        print(f"  Merchant: {auth.merchant_data.name}")
-                        print(f"  Amount: ${auth.amount/100:.2f} {auth.currency.upper()}")
-                        print(f"  Status: {auth.status}")
-                        print(f"  Approved: {auth.approved}")
-                initial_auth_ids = current_auth_ids
-            else:
-                print("No new authorizations detected")
-            
-            # Check for new transactions
-            print("\nChecking for new transactions...")
-            current_txs = check_card_transactions(card_id)
-            current_tx_ids = set(tx.id for tx in current_txs)
-            
-            new_tx_ids = current_tx_ids - initial_tx_ids
-            if new_tx_ids:
-                print(f"\n✅ DETECTED {len(new_tx_ids)} NEW TRANSACTION(S)!")
-                for tx in current_txs:
-                    if tx.id in new_tx_ids:
-                        print(f"  New transaction: {tx.id}")
-                        print(f"  Type: {tx.type}")
-                        print(f"  Amount: ${tx.amount/100:.2f} {tx.currency.upper()}")
-                        
-                        if hasattr(tx, 'purchase_details') and tx.purchase_details:
-                            if hasattr(tx.purchase_details, 'merchant') and tx.purchase_details.merchant:
-                                print(f"  Merchant: {tx.purchase_details.merchant.name}")
-                initial_tx_ids = current_tx_ids
-            else:
-                print("No new transactions detected")
+            print(f"\n=== {datetime.datetime.now().strftime('%H:%M:%S')} ===")
+            print(f"{monitor.activity.auth_count} new authorization(s) and {monitor.activity.tx_count} new transaction(s) so far")
+            tick = monitor.last_tick
+            if tick:
+                print(f"Last check took {tick['tick']*1000:.0f} ms "
+                      f"(authorizations {tick['authorization']*1000:.0f} ms, transactions {tick['transaction']*1000:.0f} ms)")
+                if tick['failed']:
+                    print(f"⚠️  Last check failed for: {', '.join(tick['failed'])}")
             
             remaining = duration - (time.time() - start_time)
-            print(f"\nMonitoring will continue for approximately {int(remaining)} more seconds")
+            print(f"Monitoring will continue for approximately {int(remaining)} more seconds")
             
     except KeyboardInterrupt:
         print("\nMonitoring stopped by user")
+    finally:
+        monitor.stop()
+        store.close()
     
     print("\n=== Monitoring Complete ===")
     print("Summary:")
     
-    new_auth_count = len(current_auth_ids) - len(initial_auth_ids)
-    new_tx_count = len(current_tx_ids) - len(initial_tx_ids)
-    
-    if new_auth_count > 0 or new_tx_count > 0:
-        print(f"✅ Detected {new_auth_count} new authorization(s) and {new_tx_count} new transaction(s)")
+    if monitor.activity.auth_count > 0 or monitor.activity.tx_count > 0:
+        print(f"✅ Detected {monitor.activity.auth_count} new authorization(s) and {monitor.activity.tx_count} new transaction(s)")
         print("The payment process is working correctly in test mode!")
+    elif monitor.failed_ticks:
+        print(f"⚠️  No new activity was detected, but {monitor.failed_ticks} check(s) failed")
+        print("Activity may have been missed; rerun the monitor to catch up")
     else:
         print("❌ No new activity was detected on this card")
         print("This could mean:")
@@ -199,6 +167,7 @@ def monitor_card_activity(card_id, interval=10, duration=60):
     print("3. Check the card details and transaction history")
 
 if __name__ == "__main__":
+    require_stripe()
     if len(sys.argv) < 2:
         print("Usage: python3 monitor_card_activity.py <card_id> [duration_seconds] [interval_seconds]")
         print("Example: python3 monitor_card_activity.py ic_1RffUCLP54m13jvUESeDqzHz 120 5")
@@ -1,143 +1,157 @@
 #!/usr/bin/env python3
-import os
 import sys
-from playwright.async_api import async_playwright
-from browserbase import Browserbase
-from dotenv import load_dotenv
+from bootstrap import require_stripe
 import stripe
 import asyncio
 
 # Import our card details retrieval function
-from get_card_details import get_card
+from get_card_details import get_card_async
+from async_stripe import AsyncStripe
+from card_monitor import AsyncCardMonitor, authorization_matching
+from session_pool import AsyncSessionPool
+from flows import redcross_donation_flow, run_flow_async, timed_step
+from flow_profiler import start_tracing_async, stop_tracing_async
+from request_blocking import RequestBlocker, describe, pop_block_option
 
-# Load environment variables
-load_dotenv()
+# The $75 option selected below, and how the merchant appears on the authorization
+DONATION_AMOUNT = 7500
+REDCROSS_MERCHANT = ("redcross", "red cross")
+# Upper bound on waiting for the authorization after submitting
+DEFAULT_DEADLINE = 60
 
-# Set up Stripe API key
-stripe_api_key = os.getenv("STRIPE_API_KEY")
+async def start_monitor(monitor):
+    """Start an AsyncCardMonitor, returning False if the card can't be read"""
+    try:
+        await monitor.start()
+        return True
+    except (stripe.error.StripeError, asyncio.TimeoutError) as e:
+        print(f"⚠️  Could not start card monitoring: {e!r}")
+        return False
 
-# Validate that we're using a test API key
-if not stripe_api_key:
-    print("\n⚠️  No Stripe API key found in .env file. Please add your test API key.")
-    print("    Get a test API key from https://dashboard.stripe.com/test/apikeys")
-    exit(1)
-elif not stripe_api_key.startswith("sk_test_"):
-    print("\n❌ ERROR: You must use a Stripe TEST API key (starts with sk_test_)")
-    print("    This program is designed to run in test mode only.")
-    print("    Get a test API key from https://dashboard.stripe.com/test/apikeys")
-    exit(1)
-
-stripe.api_key = stripe_api_key
-print("✅ Using Stripe TEST mode")
-
-# Set up BrowserBase
-bb_api_key = os.getenv("BROWSERBASE_API_KEY")
-bb_project_id = os.getenv("BROWSERBASE_PROJECT_ID")
-
-if not bb_api_key or not bb_project_id:
-    print("\n⚠️  BrowserBase API key or project ID not found in .env file.")
-    exit(1)
-
-bb = Browserbase(api_key=bb_api_key)
-
-async def make_donation(card_id):
+async def make_donation(card_id, client=None, deadline=DEFAULT_DEADLINE, pool=None, review_delay=10,
+                        trace_path=None, blocking="off"):
     """
     Make a donation to Red Cross using a virtual card
     
     Args:
         card_id (str): The ID of the virtual card to use
+        client: AsyncStripe client shared with other flows on the loop
+            (a private one is created if not given)
+        deadline (int): Maximum seconds to wait for the authorization
+        pool: AsyncSessionPool to take a warm BrowserBase session from
+            (a one-off session is used if not given)
+        review_delay (int): Seconds to pause on the filled form before submitting
+        trace_path (str): Save a Playwright trace of the run here
+        blocking (str): Request-blocking profile of a one-off session
+    
+    Returns:
+        The outcome: {"card_id", "session_id", "ok", "error", "authorization",
+        "steps"}, where each step is {"name", "ok", "start", "seconds", "error"}
+        and flow steps also time their page "calls"
     """
-    # Get card details
+    if client is None:
+        async with AsyncStripe() as client:
+            return await make_donation(card_id, client, deadline, pool, review_delay, trace_path, blocking)
+    if pool is None:
+        from playwright.async_api import async_playwright
+
+        async with async_playwright() as playwright:
+            # A one-off run: the session is released as soon as the run is done
+            pool = AsyncSessionPool(playwright, size=0, blocker=RequestBlocker.from_profile(blocking))
+            result = await make_donation(card_id, client, deadline, pool, review_delay, trace_path)
+            if pool.blocker:
+                print(f"🚫 {describe(pool.blocker.stats())}")
+            return result
+    
+    result = {"card_id": card_id, "session_id": None, "ok": False, "error": None,
+              "authorization": None, "steps": []}
+    
+    # Get card details and the card's current state in parallel
     print(f"Retrieving card details for {card_id}...")
-    payment_info = get_card(card_id)
+    monitor = AsyncCardMonitor(client, card_id)
+    with timed_step(result, "get_card"):
+        payment_info, monitoring = await asyncio.gather(
+            get_card_async(card_id, client),
+            start_monitor(monitor),
+        )
     
     if not payment_info:
         print("❌ Failed to retrieve card details")
-        return
+        result["error"] = "Could not retrieve the card"
+        if monitoring:
+            await monitor.stop()
+        return result
     
     print("✅ Card details retrieved")
     
-    # Create a BrowserBase session
-    print("Creating BrowserBase session...")
-    session = bb.sessions.create(project_id=bb_project_id)
-    print(f"✅ Session created. Watch live at: https://browserbase.com/sessions/{session.id}")
+    # Take a BrowserBase session from the pool
+    print("Opening BrowserBase session...")
+    try:
+        with timed_step(result, "acquire_session"):
+            lease = await pool.acquire()
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        print(f"❌ Could not open a BrowserBase session: {e}")
+        if monitoring:
+            await monitor.stop()
+        return result
+    print(f"✅ Session ready. Watch live at: {lease.session_url}")
+    result["session_id"] = lease.session_id
+    page = lease.page
+    if trace_path:
+        await start_tracing_async(lease.context)
+    # Until the flow completes, so a cancelled run recycles its session too
+    failed = True
     
-    async with async_playwright() as playwright:
-        # Connect to the BrowserBase session
-        browser = await playwright.chromium.connect_over_cdp(session.connect_url)
-        context = browser.contexts[0]
-        page = context.pages[0]
+    try:
+        await run_flow_async(page, redcross_donation_flow(review_delay), payment_info, result)
         
-        try:
-            print("Navigating to Red Cross donation page...")
-            await page.goto("https://www.redcross.org/donate/donation.html")
-            
-            # Select $75 donation amount (this is a test card, so we're using test mode)
-            print("Selecting donation amount...")
-            await page.click("#modf-handle-0-radio")  # $75 option
-            
-            # Continue to next step
-            print("Proceeding to next step...")
-            await page.click("text=Continue")
-            
-            # Select credit card payment method
-            print("Selecting credit card payment method...")
-            await page.click("text=credit card")
-            await page.click("text=Continue")
-            
-            # Fill billing information
-            print("Filling billing information...")
-            await page.fill("input[name='bill_to_forename']", payment_info["cardholder_firstName"])
-            await page.fill("input[name='bill_to_surname']", payment_info["cardholder_lastName"])
-            await page.fill("input[name='bill_to_email']", payment_info["cardholder_email"])
-            await page.fill("input[name='bill_to_phone']", payment_info["cardholder_phone"])
-            
-            # Fill address information
-            print("Filling address information...")
-            await page.fill("input[name='bill_to_address_line1']", payment_info["cardholder_address"]["line1"])
-            await page.fill("input[name='bill_to_address_city']", payment_info["cardholder_address"]["city"])
-            await page.fill("input[name='bill_to_address_postal_code']", payment_info["cardholder_address"]["postal_code"])
-            await page.select_option("select#bill_to_address_state", payment_info["cardholder_address"]["state"])
-            
-            # Fill card information
-            print("Filling card information...")
-            await page.fill("input#cardnumber", payment_info["card_number"])
-            await page.fill("input#MM", str(payment_info["expiration_month"]))
-            await page.fill("input#YY", str(payment_info["expiration_year"]))
-            await page.fill("input#CVC", str(payment_info["cvc"]))
-            
-            # Wait for user confirmation before submitting
-            print("\n✅ Form filled with virtual card details")
-            print("⚠️  This is a TEST donation using a TEST card in Stripe's test mode")
-            print("⚠️  No actual charges will be made")
-            print("\nWaiting 10 seconds before clicking Donate button...")
-            await asyncio.sleep(10)
-            
-            # Submit donation
-            print("Submitting donation...")
-            await page.click("text=Donate")
-            
-            # Wait for confirmation
-            print("Waiting for confirmation...")
+        # Wait for confirmation
+        print("Waiting for confirmation...")
+        if monitoring:
+            with timed_step(result, "wait_for_authorization"):
+                predicate = authorization_matching(card_id, DONATION_AMOUNT, REDCROSS_MERCHANT)
+                auth = await monitor.wait_for(predicate, timeout=deadline)
+            if auth:
+                result["authorization"] = auth.id
+                print(f"✅ Authorization {auth.id} received")
+            else:
+                print(f"⚠️  No matching authorization within {deadline} seconds")
+        else:
             await asyncio.sleep(5)
-            
-            print("\n✅ Donation process completed")
-            print("Note: Since this is using Stripe's test mode, no actual donation was made")
-            
-        except Exception as e:
-            print(f"❌ Error: {e}")
-        finally:
-            # Close the browser
-            await browser.close()
+        
+        failed = False
+        result["ok"] = True
+        print("\n✅ Donation process completed")
+        print("Note: Since this is using Stripe's test mode, no actual donation was made")
+        
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        print(f"❌ Error: {e}")
+    finally:
+        if trace_path:
+            await stop_tracing_async(lease.context, trace_path)
+        # Hand the session back, recycling it if the run failed
+        await pool.release(lease, failed=failed)
+        if monitoring:
+            await monitor.stop()
+    return result
 
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python3 redcross_donation.py <card_id>")
+    try:
+        blocking, args = pop_block_option(sys.argv[1:])
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    if len(args) != 1:
+        print("Usage: python3 redcross_donation.py <card_id> [--block PROFILE]")
         print("Example: python3 redcross_donation.py ic_1234567890")
         sys.exit(1)
     
-    card_id = sys.argv[1]
-    asyncio.run(make_donation(card_id))
+    card_id = args[0]
+    result = asyncio.run(make_donation(card_id, blocking=blocking))
+    sys.exit(0 if result["ok"] else 1)
 
 if __name__ == "__main__":
+    require_stripe()
     main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Post signed Stripe webhook events to the local receiver.
+
+Replays a saved event JSON file, or builds a synthetic
+issuing_authorization.created / issuing_transaction.created event for a
+card, signs it with STRIPE_WEBHOOK_SECRET exactly like Stripe does and
+posts it to the receiver started by issuing_webhook.py.
+"""
+import os
+import sys
+import time
+import json
+import hmac
+import hashlib
+import argparse
+import requests
+from bootstrap import load_config
+
+
+def sign_payload(payload, secret, timestamp=None):
+    """Build a Stripe-Signature header value for the payload"""
+    timestamp = int(timestamp or time.time())
+    signed = f"{timestamp}.{payload}".encode()
+    signature = hmac.new(secret.encode(), signed, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def build_event(event_type, card_id, amount, merchant):
+    """Build a minimal synthetic issuing event for a card"""
+    now = int(time.time())
+    merchant_data = {"name": merchant, "category": "charitable_and_social_service_organizations_fundraising"}
+    if event_type.startswith("issuing_authorization."):
+        obj = {
+            "id": f"iauth_replay_{now}",
+            "object": "issuing.authorization",
+            "card": {"id": card_id, "object": "issuing.card"},
+            "amount": amount,
+            "currency": "usd",
+            "approved": True,
+            "status": "pending",
+            "created": now,
+            "merchant_data": merchant_data,
+        }
+    else:
+        obj = {
+            "id": f"ipi_replay_{now}",
+            "object": "issuing.transaction",
+            "card": card_id,
+            "amount": -amount,
+            "currency": "usd",
+            "type": "capture",
+            "created": now,
+            "merchant_data": merchant_data,
+        }
+
+    return {
+        "id": f"evt_replay_{now}",
+        "object": "event",
+        "type": event_type,
+        "created": now,
+        "data": {"object": obj},
+    }
+
+
+def post_event(url, payload, secret):
+    """Sign and post one event payload, returning the HTTP response"""
+    headers = {
+        "Content-Type": "application/json",
+        "Stripe-Signature": sign_payload(payload, secret),
+    }
+    return requests.post(url, data=payload.encode(), headers=headers, timeout=10)
+
+
+if __name__ == "__main__":
+    load_config()
+
+    parser = argparse.ArgumentParser(description="Replay signed Stripe webhook events locally")
+    parser.add_argument("events", nargs="*", help="Saved event JSON files to replay")
+    parser.add_argument("--card", metavar="CARD_ID", help="Build a synthetic event for this card")
+    parser.add_argument("--type", default="issuing_authorization.created", help="Synthetic event type")
+    parser.add_argument("--amount", type=int, default=7500, help="Synthetic amount in cents")
+    parser.add_argument("--merchant", default="American Red Cross", help="Synthetic merchant name")
+    parser.add_argument("--url", default=None, help="Receiver URL (default http://WEBHOOK_HOST:WEBHOOK_PORT/webhook)")
+    args = parser.parse_args()
+
+    secret = os.getenv("STRIPE_WEBHOOK_SECRET")
+    if not secret:
+        print("\n⚠️  No STRIPE_WEBHOOK_SECRET found in .env file.")
+        sys.exit(1)
+
+    url = args.url or f"http://{os.getenv('WEBHOOK_HOST', '127.0.0.1')}:{os.getenv('WEBHOOK_PORT', '4242')}/webhook"
+
+    payloads = []
+    for path in args.events:
+        with open(path) as f:
+            payloads.append(f.read())
+    if args.card:
+        payloads.append(json.dumps(build_event(args.type, args.card, args.amount, args.merchant)))
+    if not payloads:
+        parser.error("Pass event files and/or --card")
+
+    for payload in payloads:
+        try:
+            response = post_event(url, payload, secret)
+            print(f"{json.loads(payload)['type']} → {response.status_code} {response.text}")
+        except requests.RequestException as e:
+            print(f"❌ Could not reach {url}: {e}")
+            sys.exit(1)
@@ -0,0 +1,247 @@
+"""
+Request-blocking profiles for the automated browser sessions.
+
+The donation and checkout pages pull in images, fonts, video, ads and
+analytics that the automation never looks at. A RequestBlocker routes every
+request of a context (or page) and aborts the ones its profile rules out,
+by resource type or by domain, and counts what it blocked:
+
+    blocker = RequestBlocker.from_profile("lean")
+    blocker.attach(context)         # await blocker.attach_async(context) on async Playwright
+    ...
+    print(describe(blocker.stats()))
+
+Navigations are never blocked. An allow list, when given, replaces the
+deny list: subresources may then only load from the listed domains and
+from the sites of the pages navigated to. The strict profile allows the
+payment and captcha providers the checkout forms embed; more domains can be
+allowed per run with `--block PROFILE:DOMAIN,DOMAIN`. Aborted requests never
+transfer anything, so the bytes saved are an estimate from typical sizes
+per resource type.
+
+Every browser script (browserbase_redcross, redcross_donation,
+redcross_donation_sync, donation_with_monitoring, stripe_test_payment,
+donation_runner and formfiller) takes `--block PROFILE` (default off).
+
+Routing sends every request through the client, which over a remote
+Browserbase connection adds a round trip per request that is let through;
+use a profile where the blocked traffic outweighs that.
+"""
+from urllib.parse import urlsplit
+
+# Ad, analytics and session-recording hosts seen on the donation and checkout pages
+TRACKING_DOMAINS = (
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net", "googlesyndication.com",
+    "googleadservices.com", "facebook.net", "hotjar.com", "segment.com", "segment.io",
+    "optimizely.com", "newrelic.com", "nr-data.net", "quantserve.com", "scorecardresearch.com",
+    "adnxs.com", "taboola.com", "outbrain.com", "bat.bing.com", "clarity.ms", "demdex.net",
+    "omtrdc.net", "everesttech.net", "fullstory.com", "crazyegg.com", "mouseflow.com",
+    "ads.linkedin.com", "snap.licdn.com", "ct.pinterest.com", "static.ads-twitter.com",
+    "analytics.tiktok.com",
+)
+
+# Third parties the donation and checkout forms need to take a payment
+PAYMENT_DOMAINS = (
+    "stripe.com", "stripe.network", "stripecdn.com", "stripe.dev",
+    "hcaptcha.com", "recaptcha.net", "google.com", "gstatic.com",
+)
+
+PROFILES = {
+    "off": None,
+    # What the flows never look at
+    "lean": {
+        "resource_types": ("image", "media", "font"),
+        "deny_domains": TRACKING_DOMAINS,
+        "allow_domains": (),
+    },
+    # Also drops styling and every third party but the payment providers;
+    # elements stay visible, but layout-dependent clicks may move
+    "strict": {
+        "resource_types": ("image", "media", "font", "stylesheet", "texttrack", "manifest"),
+        "deny_domains": TRACKING_DOMAINS,
+        "allow_domains": PAYMENT_DOMAINS,
+    },
+}
+
+# Typical transfer sizes, used to estimate the bytes a blocked request saved
+TYPICAL_BYTES = {
+    "image": 40_000,
+    "media": 500_000,
+    "font": 30_000,
+    "stylesheet": 20_000,
+    "script": 25_000,
+    "texttrack": 5_000,
+    "manifest": 2_000,
+}
+OTHER_BYTES = 2_000
+
+
+def _matches(host, domains):
+    return any(host == domain or host.endswith("." + domain) for domain in domains)
+
+
+def _site(host):
+    # The last two labels; good enough to let a page load from its own subdomains
+    return ".".join(host.split(".")[-2:])
+
+
+def parse_block_option(value):
+    """
+    Split a `--block` value, "PROFILE" or "PROFILE:DOMAIN,DOMAIN", into its parts.
+
+    Returns:
+        (profile name, extra domains to allow)
+
+    Raises:
+        ValueError: The profile is unknown
+    """
+    name, _, domains = (value or "").partition(":")
+    if name not in PROFILES:
+        raise ValueError(f"--block needs one of: {', '.join(PROFILES)} (optionally PROFILE:DOMAIN,...)")
+    return name, tuple(domain.strip().lower() for domain in domains.split(",") if domain.strip())
+
+
+def block_option(value):
+    """argparse type of a `--block` option; returns the value once it parses"""
+    parse_block_option(value)
+    return value
+
+
+class RequestBlocker:
+    """Abort the requests a profile rules out and count them"""
+
+    def __init__(self, resource_types=(), deny_domains=(), allow_domains=()):
+        """
+        Args:
+            resource_types: Playwright resource types to block ("image", "font", ...)
+            deny_domains: Domains (and their subdomains) to block
+            allow_domains: If given, the only domains besides the visited
+                pages' sites that requests may go to
+        """
+        self.resource_types = frozenset(resource_types)
+        self.deny_domains = tuple(deny_domains)
+        self.allow_domains = tuple(allow_domains)
+        self.page_sites = set()
+        self.allowed = 0
+        self.blocked = 0
+        self.estimated_bytes_saved = 0
+        self.by_reason = {}
+
+    @classmethod
+    def from_profile(cls, value):
+        """
+        Build the blocker of a `--block` value, a profile name with optional
+        extra domains to allow ("strict:example.com,cdn.example.com").
+
+        Returns:
+            A RequestBlocker, or None for the "off" profile
+
+        Raises:
+            ValueError: The profile is unknown
+        """
+        name, extra_allowed = parse_block_option(value)
+        profile = PROFILES[name]
+        if profile is None:
+            return None
+        allow_domains = profile["allow_domains"] + extra_allowed
+        return cls(profile["resource_types"], profile["deny_domains"], allow_domains)
+
+    def reason(self, url, resource_type):
+        """Why a request would be blocked, or None if it may load"""
+        host = (urlsplit(url).hostname or "").lower()
+        if resource_type == "document":
+            if host:
+                self.page_sites.add(_site(host))
+            return None
+        if host and self.allow_domains:
+            if not _matches(host, self.allow_domains) and not _matches(host, self.page_sites):
+                return host
+        elif host and _matches(host, self.deny_domains):
+            return host
+        if resource_type in self.resource_types:
+            return resource_type
+        return None
+
+    def _count(self, request):
+        reason = self.reason(request.url, request.resource_type)
+        if reason is None:
+            self.allowed += 1
+        else:
+            self.blocked += 1
+            self.by_reason[reason] = self.by_reason.get(reason, 0) + 1
+            self.estimated_bytes_saved += TYPICAL_BYTES.get(request.resource_type, OTHER_BYTES)
+        return reason
+
+    def _handle(self, route):
+        try:
+            if self._count(route.request) is None:
+                route.continue_()
+            else:
+                route.abort("blockedbyclient")
+        except Exception:
+            # The page went away while the request was in flight
+            pass
+
+    async def _handle_async(self, route):
+        try:
+            if self._count(route.request) is None:
+                await route.continue_()
+            else:
+                await route.abort("blockedbyclient")
+        except Exception:
+            pass
+
+    def attach(self, target):
+        """Route every request of a sync Playwright context or page through the blocker"""
+        target.route("**/*", self._handle)
+
+    async def attach_async(self, target):
+        """attach() for an async Playwright context or page"""
+        await target.route("**/*", self._handle_async)
+
+    def detach(self, target):
+        """Stop routing a context or page attached with attach()"""
+        target.unroute("**/*", self._handle)
+
+    async def detach_async(self, target):
+        await target.unroute("**/*", self._handle_async)
+
+    def stats(self):
+        """Requests let through and blocked, estimated bytes saved, and what was blocked most"""
+        return {
+            "allowed": self.allowed,
+            "blocked": self.blocked,
+            "estimated_bytes_saved": self.estimated_bytes_saved,
+            "by_reason": dict(sorted(self.by_reason.items(), key=lambda item: -item[1])),
+        }
+
+
+def describe(stats):
+    """One line for a blocker's stats(), for the scripts' reports"""
+    return (f"{stats['blocked']} request(s) blocked, {stats['allowed']} let through, "
+            f"~{stats['estimated_bytes_saved'] / 1e6:.1f} MB saved (estimated)")
+
+
+def pop_block_option(args):
+    """
+    Take `--block PROFILE[:DOMAIN,...]` (or `--block=...`) out of a script's arguments.
+
+    Returns:
+        (value, remaining arguments); the value is "off" when not given and
+        goes to RequestBlocker.from_profile() as is
+
+    Raises:
+        ValueError: The profile is missing or unknown
+    """
+    profile = "off"
+    remaining = []
+    args = iter(args)
+    for arg in args:
+        if arg == "--block":
+            profile = next(args, None)
+        elif arg.startswith("--block="):
+            profile = arg.partition("=")[2]
+        else:
+            remaining.append(arg)
+    parse_block_option(profile)
+    return profile, remaining
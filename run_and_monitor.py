@@ -1,171 +1,91 @@
 #!/usr/bin/env python3
-import os
 import sys
-import time
-import threading
+import json
 import stripe
-import subprocess
-from dotenv import load_dotenv
+from bootstrap import require_stripe
+from browserbase_redcross import donate
+from get_card_details import get_card as getCard
+from card_monitor import CLOCK_SKEW, CardMonitor, authorization_matching
+from event_store import EventStore
 
-# Load environment variables
-load_dotenv()
 
-# Set up Stripe API key
-stripe_api_key = os.getenv("STRIPE_API_KEY")
+# The $75 option browserbase_redcross.py selects, and how the merchant appears
+DONATION_AMOUNT = 7500
+REDCROSS_MERCHANT = ("redcross", "red cross")
+# Default upper bound on waiting for the authorization after the donation
+DEFAULT_DEADLINE = 60
 
-# Validate that we're using a test API key
-if not stripe_api_key:
-    print("\n⚠️  No Stripe API key found in .env file. Please add your test API key.")
-    exit(1)
-elif not stripe_api_key.startswith("sk_test_"):
-    print("\n❌ ERROR: You must use a Stripe TEST API key (starts with sk_test_)")
-    exit(1)
-
-stripe.api_key = stripe_api_key
-print("✅ Using Stripe TEST mode")
-
-# Global variables
-card_id = None
-monitoring_active = True
-initial_auth_ids = set()
-initial_tx_ids = set()
-
-def check_card_authorizations():
-    """Check for authorizations on the card"""
+def start_card_monitor(card_id):
+    """Start monitoring the card in a background thread"""
+    print("\n=== Starting Card Activity Monitoring ===")
+    store = EventStore()
+    monitor = CardMonitor(card_id, store=store)
     try:
-        authorizations = stripe.issuing.Authorization.list(
-            card=card_id,
-            limit=5
-        )
-        
-        if not authorizations.data:
-            return []
-        
-        return authorizations.data
+        monitor.start()
     except stripe.error.StripeError as e:
-        print(f"❌ Error checking authorizations: {e}")
-        return []
-
-def check_card_transactions():
-    """Check for transactions on the card"""
-    try:
-        transactions = stripe.issuing.Transaction.list(
-            card=card_id,
-            limit=5
-        )
-        
-        if not transactions.data:
-            return []
-        
-        return transactions.data
-    except stripe.error.StripeError as e:
-        print(f"❌ Error checking transactions: {e}")
-        return []
-
-def monitor_card_activity():
-    """Monitor card activity in a separate thread"""
-    global initial_auth_ids, initial_tx_ids, monitoring_active
-    
-    print("\n=== Starting Card Activity Monitoring ===")
-    
-    # Get initial state
-    print("Checking for existing authorizations...")
-    initial_auths = check_card_authorizations()
-    initial_auth_ids = set(auth.id for auth in initial_auths)
-    
-    print("Checking for existing transactions...")
-    initial_txs = check_card_transactions()
-    initial_tx_ids = set(tx.id for tx in initial_txs)
-    
-    print(f"Initial state: {len(initial_auth_ids)} authorizations, {len(initial_tx_ids)} transactions")
+        print(f"❌ Error establishing initial card state: {e}")
+        store.close()
+        return None
     
-    # Monitor for changes
-    while monitoring_active:
-        time.sleep(5)  # Check every 5 seconds
-        
-        # Check for new authorizations
-        current_auths = check_card_authorizations()
-        current_auth_ids = set(auth.id for auth in current_auths)
-        
-        new_auth_ids = current_auth_ids - initial_auth_ids
-        if new_auth_ids:
-            print(f"\n✅ DETECTED {len(new_auth_ids)} NEW AUTHORIZATION(S)!")
-            for auth in current_auths:
-                if auth.id in new_auth_ids:
-                    print(f"  New authorization: {auth.id}")
-                    print(f"  Merchant: {auth.merchant_data.name}")
-                    print(f"  Amount: ${auth.amount/100:.2f} {auth.currency.upper()}")
-                    print(f"  Status: {auth.status}")
-                    print(f"  Approved: {auth.approved}")
-            initial_auth_ids = current_auth_ids
-        
-        # Check for new transactions
-        current_txs = check_card_transactions()
-        current_tx_ids = set(tx.id for tx in current_txs)
-        
-        new_tx_ids = current_tx_ids - initial_tx_ids
-        if new_tx_ids:
-            print(f"\n✅ DETECTED {len(new_tx_ids)} NEW TRANSACTION(S)!")
-            for tx in current_txs:
-                if tx.id in new_tx_ids:
-                    print(f"  New transaction: {tx.id}")
-                    print(f"  Type: {tx.type}")
-                    print(f"  Amount: ${tx.amount/100:.2f} {tx.currency.upper()}")
-                    
-                    if hasattr(tx, 'purchase_details') and tx.purchase_details:
-                        if hasattr(tx.purchase_details, 'merchant') and tx.purchase_details.merchant:
-                            print(f"  Merchant: {tx.purchase_details.merchant.name}")
-            initial_tx_ids = current_tx_ids
-    
-    print("\n=== Card Monitoring Stopped ===")
+    print("Initial state recorded, watching for new authorizations and transactions")
+    return monitor
 
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python3 run_and_monitor.py <card_id>")
-        print("Example: python3 run_and_monitor.py ic_1RffUCLP54m13jvUESeDqzHz")
+    """
+    Run the donation in this process while monitoring the card.
+
+    Returns:
+        The run's outcome: the donation's step results and the activity seen
+    """
+    args = [arg for arg in sys.argv[1:] if arg != "--json"]
+    if len(args) not in (1, 2):
+        print("Usage: python3 run_and_monitor.py <card_id> [deadline_seconds] [--json]")
+        print("Example: python3 run_and_monitor.py ic_1RffUCLP54m13jvUESeDqzHz 60")
         sys.exit(1)
     
-    global card_id, monitoring_active
-    card_id = sys.argv[1]
+    card_id = args[0]
+    deadline = int(args[1]) if len(args) == 2 else DEFAULT_DEADLINE
     
     # Start monitoring thread
-    monitor_thread = threading.Thread(target=monitor_card_activity)
-    monitor_thread.daemon = True
-    monitor_thread.start()
+    monitor = start_card_monitor(card_id)
     
-    # Run the existing Red Cross donation script
-    print("\n=== Running Red Cross Donation Script ===")
-    try:
-        subprocess.run([sys.executable, "browserbase_redcross.py", card_id], check=True)
-    except subprocess.CalledProcessError as e:
-        print(f"❌ Error running donation script: {e}")
-    
-    # Keep monitoring for a bit longer to catch any delayed transactions
-    print("\n=== Continuing to monitor for 30 more seconds ===")
-    time.sleep(30)
-    
-    # Stop monitoring
-    monitoring_active = False
-    monitor_thread.join(timeout=5)
+    # Run the Red Cross donation flow with the card fetched once, here
+    print("\n=== Running Red Cross Donation ===")
+    profile = getCard(card_id)
+    if profile:
+        donation = donate(card_id, profile)
+    else:
+        donation = {"card_id": card_id, "session_id": None, "ok": False,
+                    "error": "Could not retrieve the card", "steps": []}
+    for step in donation["steps"]:
+        status = "✅" if step["ok"] else "❌"
+        print(f"{status} {step['name']:<20} {step['seconds']:.2f}s" + (f"  {step['error']}" if step["error"] else ""))
+    
+    # Keep monitoring until the donation's authorization shows up
+    auth = None
+    if monitor:
+        print(f"\n=== Waiting up to {deadline} seconds for the donation authorization ===")
+        predicate = authorization_matching(
+            card_id, DONATION_AMOUNT, REDCROSS_MERCHANT, since=monitor.started_at - CLOCK_SKEW
+        )
+        auth = monitor.wait_for(predicate, timeout=deadline)
+        if auth:
+            print(f"✅ Authorization {auth.id} received")
+        else:
+            print(f"⚠️  No matching authorization within {deadline} seconds")
     
-    # Final check for any activity that might have been missed
+    # Stop monitoring, with a final check for any activity that might have been missed
     print("\n=== Final Card Activity Check ===")
-    
-    # Check for new authorizations
-    current_auths = check_card_authorizations()
-    current_auth_ids = set(auth.id for auth in current_auths)
-    
-    new_auth_count = len(current_auth_ids - initial_auth_ids)
-    
-    # Check for new transactions
-    current_txs = check_card_transactions()
-    current_tx_ids = set(tx.id for tx in current_txs)
-    
-    new_tx_count = len(current_tx_ids - initial_tx_ids)
+    if monitor:
+        monitor.stop()
+        monitor.store.close()
+    print("\n=== Card Monitoring Stopped ===")
     
     print("\n=== Summary ===")
-    if new_auth_count > 0 or new_tx_count > 0:
-        print(f"✅ Detected {new_auth_count} new authorization(s) and {new_tx_count} new transaction(s)")
+    auth_count = monitor.activity.auth_count if monitor else 0
+    tx_count = monitor.activity.tx_count if monitor else 0
+    if auth_count > 0 or tx_count > 0:
+        print(f"✅ Detected {auth_count} new authorization(s) and {tx_count} new transaction(s)")
         print("The payment process is working correctly in test mode!")
     else:
         print("❌ No new activity was detected on this card")
@@ -178,6 +98,17 @@ def main():
     print("1. Go to https://dashboard.stripe.com/test/issuing")
     print("2. Make sure you're in 'Viewing test data' mode")
     print("3. Check the card details and transaction history")
+    
+    return {
+        "donation": donation,
+        "authorization": auth.id if auth else None,
+        "authorizations": auth_count,
+        "transactions": tx_count,
+    }
 
 if __name__ == "__main__":
-    main()
+    require_stripe()
+    outcome = main()
+    if "--json" in sys.argv:
+        print(json.dumps(outcome, indent=2))
+    sys.exit(0 if outcome["donation"]["ok"] else 1)
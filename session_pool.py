@@ -0,0 +1,329 @@
+"""
+Pool of warm Browserbase sessions shared by the browser flows.
+
+Creating a Browserbase session and connecting to it over CDP is the largest
+fixed cost of a run. The pool keeps up to `size` sessions connected and
+hands each run the session's default context, the one Browserbase records
+and applies its stealth and fingerprinting settings to, so pooled runs
+behave like a run on a new session. Between runs the context is wiped:
+cookies and the storage of every origin the run visited are cleared, extra
+pages are closed and the page is left on about:blank. A session is recycled
+(disconnected and released) after `max_uses` runs, as soon as a run fails
+on it or when the wipe fails, and a new one is started when no warm session
+is free.
+
+    with sync_playwright() as playwright:
+        pool = SessionPool(playwright, size=2)
+        with pool.leased() as lease:
+            lease.page.goto(url)
+        print(pool.stats())
+        pool.close()
+
+A RequestBlocker (request_blocking.py) given to the pool is attached to
+every context it hands out, and its counts are part of stats().
+
+AsyncSessionPool does the same for async Playwright. Neither is
+thread-safe: like the Playwright instance it wraps, a pool belongs to one
+thread or event loop.
+"""
+import os
+import asyncio
+from contextlib import asynccontextmanager, contextmanager
+from urllib.parse import urlsplit
+from bootstrap import browserbase
+
+DEFAULT_SIZE = 2
+DEFAULT_MAX_USES = 10
+
+
+class SessionLease:
+    """The default context of a pooled session, handed to one run"""
+
+    __slots__ = ("session_id", "context", "page", "_entry", "_origins")
+
+    def __init__(self, entry, context, page):
+        self.session_id = entry.session.id
+        self.context = context
+        self.page = page
+        self._entry = entry
+        # Origins the run navigated to, whose storage is cleared afterwards
+        self._origins = set()
+        context.on("page", self._watch)
+        self._watch(page)
+
+    def _watch(self, page):
+        page.on("framenavigated", self._visited)
+
+    def _visited(self, frame):
+        parts = urlsplit(frame.url)
+        if parts.scheme in ("http", "https"):
+            self._origins.add(f"{parts.scheme}://{parts.netloc}")
+
+    def _unwatch(self):
+        self.context.remove_listener("page", self._watch)
+        for page in self.context.pages:
+            page.remove_listener("framenavigated", self._visited)
+
+    @property
+    def session_url(self):
+        return f"https://browserbase.com/sessions/{self.session_id}"
+
+
+class _PooledSession:
+    __slots__ = ("session", "browser", "uses")
+
+    def __init__(self, session, browser):
+        self.session = session
+        self.browser = browser
+        self.uses = 0
+
+
+class _BasePool:
+    """Bookkeeping shared by the sync and async pools"""
+
+    def __init__(self, playwright, size=DEFAULT_SIZE, max_uses=DEFAULT_MAX_USES, project_id=None, blocker=None):
+        """
+        Args:
+            playwright: The Playwright instance to connect with
+            size (int): Warm sessions to keep connected between runs
+            max_uses (int): Runs after which a session is recycled
+            project_id (str): Browserbase project (defaults to $BROWSERBASE_PROJECT_ID)
+            blocker: RequestBlocker to attach to every context handed out
+        """
+        self.playwright = playwright
+        self.size = size
+        self.max_uses = max_uses
+        self.project_id = project_id
+        self.blocker = blocker
+        self._idle = []
+        self.hits = 0
+        self.misses = 0
+        self.recycled = 0
+
+    def _project_id(self):
+        return self.project_id or os.environ["BROWSERBASE_PROJECT_ID"]
+
+    def _create_session(self):
+        return browserbase().sessions.create(project_id=self._project_id())
+
+    def _release_session(self, session):
+        try:
+            browserbase().sessions.update(session.id, status="REQUEST_RELEASE", project_id=self._project_id())
+        except Exception as e:
+            # The session times out on its own; a failed release only costs minutes
+            print(f"⚠️  Could not release Browserbase session {session.id}: {e}")
+
+    def _take_idle(self):
+        """
+        Take a warm session whose browser is still connected.
+
+        Returns:
+            (entry or None, disconnected entries); the caller recycles the
+            disconnected ones so their Browserbase sessions are released
+        """
+        dead = []
+        while self._idle:
+            entry = self._idle.pop()
+            if entry.browser.is_connected():
+                self.hits += 1
+                return entry, dead
+            dead.append(entry)
+        self.misses += 1
+        return None, dead
+
+    @staticmethod
+    def _default_context(browser):
+        """The session's own context, and its first page"""
+        context = browser.contexts[0]
+        return context, context.pages
+
+    def _keep(self, entry, failed):
+        """Whether a returned session goes back into the pool"""
+        entry.uses += 1
+        return not failed and entry.uses < self.max_uses and len(self._idle) < self.size
+
+    def stats(self):
+        """Runs served by a warm session, sessions started for a run, sessions recycled"""
+        served = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "recycled": self.recycled,
+            "idle": len(self._idle),
+            "hit_rate": self.hits / served if served else 0.0,
+            "requests": self.blocker.stats() if self.blocker else None,
+        }
+
+
+class SessionPool(_BasePool):
+    """Warm Browserbase sessions for sync Playwright"""
+
+    def _connect(self):
+        session = self._create_session()
+        return _PooledSession(session, self.playwright.chromium.connect_over_cdp(session.connect_url))
+
+    def warm(self):
+        """Start sessions until `size` are waiting"""
+        while len(self._idle) < self.size:
+            self._idle.append(self._connect())
+
+    def acquire(self):
+        """
+        Hand out the default context of a warm (or, failing that, new) session.
+
+        Returns:
+            A SessionLease; hand it back with release()
+        """
+        entry, dead = self._take_idle()
+        for stale in dead:
+            self._recycle(stale)
+        entry = entry or self._connect()
+        try:
+            context, pages = self._default_context(entry.browser)
+            page = pages[0] if pages else context.new_page()
+            if self.blocker:
+                self.blocker.attach(context)
+        except Exception:
+            self._recycle(entry)
+            raise
+        return SessionLease(entry, context, page)
+
+    def _wipe(self, lease):
+        context = lease.context
+        lease._unwatch()
+        if self.blocker:
+            self.blocker.detach(context)
+        for page in context.pages[1:]:
+            page.close()
+        lease.page.goto("about:blank")
+        context.clear_cookies()
+        if lease._origins:
+            cdp = context.new_cdp_session(lease.page)
+            for origin in lease._origins:
+                cdp.send("Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"})
+            cdp.detach()
+
+    def release(self, lease, failed=False):
+        """Wipe the lease's context; recycle its session if the run failed, it is used up or the wipe failed"""
+        entry = lease._entry
+        if self._keep(entry, failed):
+            try:
+                # Only a session that goes back into the pool needs wiping
+                self._wipe(lease)
+                self._idle.append(entry)
+                return
+            except Exception as e:
+                print(f"⚠️  Could not reset Browserbase session {lease.session_id}: {e}")
+        self._recycle(entry)
+
+    @contextmanager
+    def leased(self):
+        """A lease for the block; its session is recycled if the block raises"""
+        lease = self.acquire()
+        try:
+            yield lease
+        except BaseException:
+            self.release(lease, failed=True)
+            raise
+        self.release(lease)
+
+    def _recycle(self, entry):
+        self.recycled += 1
+        try:
+            entry.browser.close()
+        except Exception:
+            pass
+        self._release_session(entry.session)
+
+    def close(self):
+        """Disconnect and release every warm session"""
+        while self._idle:
+            self._recycle(self._idle.pop())
+
+
+class AsyncSessionPool(_BasePool):
+    """Warm Browserbase sessions for async Playwright"""
+
+    async def _connect(self):
+        # The Browserbase client is synchronous; keep its request off the loop
+        session = await asyncio.to_thread(self._create_session)
+        return _PooledSession(session, await self.playwright.chromium.connect_over_cdp(session.connect_url))
+
+    async def warm(self):
+        """Start sessions concurrently until `size` are waiting"""
+        missing = self.size - len(self._idle)
+        if missing > 0:
+            self._idle.extend(await asyncio.gather(*(self._connect() for _ in range(missing))))
+
+    async def acquire(self):
+        """
+        Hand out the default context of a warm (or, failing that, new) session.
+
+        Returns:
+            A SessionLease; hand it back with release()
+        """
+        entry, dead = self._take_idle()
+        if dead:
+            await asyncio.gather(*(self._recycle(stale) for stale in dead))
+        entry = entry or await self._connect()
+        try:
+            context, pages = self._default_context(entry.browser)
+            page = pages[0] if pages else await context.new_page()
+            if self.blocker:
+                await self.blocker.attach_async(context)
+        except Exception:
+            await self._recycle(entry)
+            raise
+        return SessionLease(entry, context, page)
+
+    async def _wipe(self, lease):
+        context = lease.context
+        lease._unwatch()
+        if self.blocker:
+            await self.blocker.detach_async(context)
+        for page in context.pages[1:]:
+            await page.close()
+        await lease.page.goto("about:blank")
+        await context.clear_cookies()
+        if lease._origins:
+            cdp = await context.new_cdp_session(lease.page)
+            for origin in lease._origins:
+                await cdp.send("Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"})
+            await cdp.detach()
+
+    async def release(self, lease, failed=False):
+        """Wipe the lease's context; recycle its session if the run failed, it is used up or the wipe failed"""
+        entry = lease._entry
+        if self._keep(entry, failed):
+            try:
+                # Only a session that goes back into the pool needs wiping
+                await self._wipe(lease)
+                self._idle.append(entry)
+                return
+            except Exception as e:
+                print(f"⚠️  Could not reset Browserbase session {lease.session_id}: {e}")
+        await self._recycle(entry)
+
+    @asynccontextmanager
+    async def leased(self):
+        """A lease for the block; its session is recycled if the block raises"""
+        lease = await self.acquire()
+        try:
+            yield lease
+        except BaseException:
+            await self.release(lease, failed=True)
+            raise
+        await self.release(lease)
+
+    async def _recycle(self, entry):
+        self.recycled += 1
+        try:
+            await entry.browser.close()
+        except Exception:
+            pass
+        await asyncio.to_thread(self._release_session, entry.session)
+
+    async def close(self):
+        """Disconnect and release every warm session"""
+        idle, self._idle = self._idle, []
+        await asyncio.gather(*(self._recycle(entry) for entry in idle))
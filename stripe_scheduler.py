@@ -0,0 +1,239 @@
+"""
+Shared, rate-limit-aware scheduling of every Stripe API request.
+
+All requests of the process draw from one token bucket sized to the
+account's rate limit, so many monitors plus a provisioning run stay just
+under the limit instead of tripping it. A 429 response pauses the whole
+bucket for the `Retry-After` period (or an exponential backoff when the
+header is missing) and the request is retried; only when the retries are
+exhausted does the caller see the RateLimitError, so a throttled call is
+reported as an error and never mistaken for an empty result.
+
+Latency-sensitive requests (monitor ticks) run at INTERACTIVE priority and
+are always served before BULK requests (listings, reports, provisioning)
+waiting for the same tokens:
+
+    install_scheduler()  # route stripe.* calls through the shared scheduler
+    with request_priority(INTERACTIVE):
+        stripe.issuing.Authorization.list(card=card_id, limit=10)
+"""
+import os
+import time
+import random
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+from collections import Counter
+import stripe
+
+INTERACTIVE = 0
+BULK = 1
+
+# Stripe allows 25 requests per second in test mode and 100 in live mode
+DEFAULT_RATE = 25
+MAX_RETRIES = 4
+MAX_BACKOFF = 10
+
+_priority = contextvars.ContextVar("stripe_request_priority", default=BULK)
+
+
+@contextmanager
+def request_priority(priority):
+    """Run the Stripe requests made inside the block at the given priority"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def retry_after(headers):
+    """Return the Retry-After delay in seconds from response headers, or None"""
+    for name, value in (headers or {}).items():
+        if name.lower() == "retry-after":
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                return None
+    return None
+
+
+class RateLimitScheduler:
+    """Token bucket shared by threads and event loops, with priority classes"""
+
+    def __init__(self, rate=None, burst=None, max_retries=MAX_RETRIES):
+        """
+        Args:
+            rate (float): Requests per second (defaults to $STRIPE_RATE_LIMIT or 25)
+            burst (int): Bucket capacity (defaults to one second of requests)
+            max_retries (int): Retries of a throttled request before giving up
+        """
+        self.rate = float(rate or os.getenv("STRIPE_RATE_LIMIT", DEFAULT_RATE))
+        self.burst = burst or max(1, int(self.rate))
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiting = Counter()
+        self.requests = 0
+        self.throttled = 0
+        self.wait_seconds = 0.0
+
+    def _reserve(self, priority):
+        # Take a token and return 0, or return how long to wait before asking again
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if now < self._paused_until:
+                return self._paused_until - now
+            if any(count for waiting, count in self._waiting.items() if waiting < priority):
+                # Leave the next token to a more urgent request
+                return 1 / self.rate
+            if self._tokens >= 1:
+                self._tokens -= 1
+                self.requests += 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def _register(self, priority, delta):
+        with self._lock:
+            self._waiting[priority] += delta
+
+    def acquire(self, priority=None):
+        """Block until a request may be sent"""
+        priority = _priority.get() if priority is None else priority
+        start = time.monotonic()
+        self._register(priority, 1)
+        try:
+            while True:
+                delay = self._reserve(priority)
+                if not delay:
+                    break
+                time.sleep(delay)
+        finally:
+            self._register(priority, -1)
+            self._record_wait(time.monotonic() - start)
+
+    async def acquire_async(self, priority=None):
+        """acquire() without blocking the event loop"""
+        priority = _priority.get() if priority is None else priority
+        start = time.monotonic()
+        self._register(priority, 1)
+        try:
+            while True:
+                delay = self._reserve(priority)
+                if not delay:
+                    break
+                await asyncio.sleep(delay)
+        finally:
+            self._register(priority, -1)
+            self._record_wait(time.monotonic() - start)
+
+    def _record_wait(self, seconds):
+        with self._lock:
+            self.wait_seconds += seconds
+
+    def throttle(self, headers, attempt):
+        """
+        Pause every request after a 429 response.
+
+        Returns:
+            The pause in seconds
+        """
+        pause = retry_after(headers)
+        if pause is None:
+            pause = min(MAX_BACKOFF, 0.5 * 2 ** attempt) * random.uniform(0.5, 1)
+        with self._lock:
+            self.throttled += 1
+            self._tokens = 0.0
+            self._paused_until = max(self._paused_until, time.monotonic() + pause)
+        return pause
+
+    def stats(self):
+        """Requests sent, 429 responses received and total seconds spent waiting"""
+        with self._lock:
+            return {"requests": self.requests, "throttled": self.throttled, "wait_seconds": self.wait_seconds}
+
+
+class RateLimitedHTTPClient(stripe.HTTPClient):
+    """Stripe HTTP client that sends each request through a RateLimitScheduler"""
+
+    def __init__(self, client=None, scheduler=None):
+        """
+        Args:
+            client: The stripe.HTTPClient that sends the requests (defaults
+                to the SDK's default client)
+            scheduler: The RateLimitScheduler to use (defaults to the shared one)
+        """
+        super().__init__()
+        self._client = client or stripe.new_default_http_client(verify_ssl_certs=stripe.verify_ssl_certs, proxy=stripe.proxy)
+        self.scheduler = scheduler or shared_scheduler()
+        self.name = self._client.name
+
+    def request(self, method, url, headers, post_data=None, **kwargs):
+        return self._send(self._client.request, method, url, headers, post_data)
+
+    def request_stream(self, method, url, headers, post_data=None, **kwargs):
+        return self._send(self._client.request_stream, method, url, headers, post_data)
+
+    async def request_async(self, method, url, headers, post_data=None):
+        return await self._send_async(self._client.request_async, method, url, headers, post_data)
+
+    async def request_stream_async(self, method, url, headers, post_data=None):
+        return await self._send_async(self._client.request_stream_async, method, url, headers, post_data)
+
+    def _send(self, send, *args):
+        attempt = 0
+        while True:
+            self.scheduler.acquire()
+            response = send(*args)
+            if response[1] != 429 or attempt >= self.scheduler.max_retries:
+                # A final 429 is raised by the SDK as a RateLimitError
+                return response
+            self.scheduler.throttle(response[2], attempt)
+            attempt += 1
+
+    async def _send_async(self, send, *args):
+        attempt = 0
+        while True:
+            await self.scheduler.acquire_async()
+            response = await send(*args)
+            if response[1] != 429 or attempt >= self.scheduler.max_retries:
+                return response
+            self.scheduler.throttle(response[2], attempt)
+            attempt += 1
+
+    def sleep_async(self, secs):
+        return self._client.sleep_async(secs)
+
+    def close(self):
+        self._client.close()
+
+    async def close_async(self):
+        await self._client.close_async()
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_scheduler():
+    """Return the process-wide RateLimitScheduler, creating it on first use"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = RateLimitScheduler()
+        return _shared
+
+
+def install_scheduler():
+    """
+    Send every request made through the global stripe.* API via the shared
+    scheduler. Safe to call more than once.
+    """
+    if not isinstance(stripe.default_http_client, RateLimitedHTTPClient):
+        stripe.default_http_client = RateLimitedHTTPClient(stripe.default_http_client)
+    return stripe.default_http_client.scheduler
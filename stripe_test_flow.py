@@ -1,25 +1,8 @@
 #!/usr/bin/env python3
-import os
 import time
 import stripe
-from dotenv import load_dotenv
+from bootstrap import require_stripe
 
-# Load environment variables
-load_dotenv()
-
-# Set up Stripe API key
-stripe_api_key = os.getenv("STRIPE_API_KEY")
-
-# Validate that we're using a test API key
-if not stripe_api_key:
-    print("\n⚠️  No Stripe API key found in .env file. Please add your test API key.")
-    exit(1)
-elif not stripe_api_key.startswith("sk_test_"):
-    print("\n❌ ERROR: You must use a Stripe TEST API key (starts with sk_test_)")
-    exit(1)
-
-stripe.api_key = stripe_api_key
-print("✅ Using Stripe TEST mode")
 
 def create_payment_intent():
     """
@@ -257,4 +240,5 @@ def run_test_flow():
         print("Some part of the payment flow did not complete successfully.")
 
 if __name__ == "__main__":
+    require_stripe()
     run_test_flow()
@@ -1,76 +1,92 @@
 #!/usr/bin/env python3
-from playwright.sync_api import Playwright, sync_playwright
-from browserbase import Browserbase
 from get_card_details import get_card as getCard
-import os
 import sys
-import time
-from dotenv import load_dotenv
+from typing import TYPE_CHECKING
+from bootstrap import require_stripe
+from flows import FlowError, race_selectors, timed_step, wait_until_ready
+from flow_profiler import record_run
+from session_pool import SessionPool
+from request_blocking import RequestBlocker, describe, pop_block_option
 
-# Load environment variables
-load_dotenv()
+if TYPE_CHECKING:
+    from playwright.sync_api import Playwright
 
-# Validate Stripe API key is in test mode
-stripe_api_key = os.getenv("STRIPE_API_KEY")
-if not stripe_api_key or not stripe_api_key.startswith("sk_test_"):
-    print("\n❌ ERROR: You must use a Stripe TEST API key (starts with sk_test_)")
-    exit(1)
+def run(playwright: "Playwright", card_id: str, pool=None, blocking="off") -> dict:
+    """
+    Pay on Stripe's test checkout page with a virtual card.
 
-# Set up BrowserBase
-bb = Browserbase(api_key=os.environ["BROWSERBASE_API_KEY"])
+    Args:
+        playwright: The sync Playwright instance
+        card_id (str): The virtual card to pay with
+        pool: A SessionPool on `playwright` to take a warm session from
+        blocking (str): Request-blocking profile of a one-off session
 
-def run(playwright: Playwright, card_id: str) -> None:
-    session = bb.sessions.create(
-        project_id=os.environ["BROWSERBASE_PROJECT_ID"],
-    )
+    Returns:
+        The outcome: {"card_id", "session_id", "ok", "error", "steps"}, where
+        each step is {"name", "ok", "start", "seconds", "error"}
+    """
+    result = {"card_id": card_id, "session_id": None, "ok": False, "error": None, "steps": []}
+    if pool is None:
+        # A one-off run: the session is released as soon as the run is done
+        pool = SessionPool(playwright, size=0, blocker=RequestBlocker.from_profile(blocking))
+    lease = None
+    failed = False
 
-    browser = playwright.chromium.connect_over_cdp(session.connect_url)
-    context = browser.contexts[0]
-    page = context.pages[0]
+    try:
+        with timed_step(result, "acquire_session"):
+            lease = pool.acquire()
+        result["session_id"] = lease.session_id
+        page = lease.page
 
-    payment_info = getCard(card_id)
+        with timed_step(result, "get_card"):
+            payment_info = getCard(card_id)
+        if payment_info is None:
+            raise RuntimeError(f"Could not retrieve card {card_id}")
 
-    # Watch the session
-    print(f"Session URL: https://browserbase.com/sessions/{session.id}")
-    print("✅ BrowserBase session created")
+        # Watch the session
+        print(f"Session URL: {lease.session_url}")
+        print("✅ BrowserBase session created")
 
-    try:
         # Navigate to the Stripe test payment page
         print("Navigating to Stripe test payment page...")
-        page.goto("https://checkout.stripe.dev/preview")
-        page.wait_for_load_state("networkidle")
+        with timed_step(result, "open_payment_page"):
+            page.goto("https://checkout.stripe.dev/preview", wait_until="domcontentloaded")
+            # Ready once the payment methods render, not when the network settles
+            wait_until_ready(page, {"selector": "text=Card"})
         print("✅ Page loaded successfully")
 
         # Select a payment method
         print("Selecting card payment method...")
-        page.wait_for_selector("text=Card", timeout=60000)
-        page.click("text=Card")
+        with timed_step(result, "choose_card"):
+            page.click("text=Card")
 
         # Fill in the card information
         print("Filling card information...")
         try:
-            # Wait for card fields to be available
-            page.wait_for_selector("input[placeholder='1234 1234 1234 1234']", timeout=60000)
-            
-            # Fill card information
-            page.fill("input[placeholder='1234 1234 1234 1234']", payment_info["card_number"])
-            page.fill("input[placeholder='MM / YY']", f"{payment_info['expiration_month']}/{payment_info['expiration_year']}")
-            page.fill("input[placeholder='CVC']", payment_info["cvc"])
-            
-            # Fill name field if available
-            try:
-                name_field = page.query_selector("input[placeholder='Name on card']") or page.query_selector("input[placeholder='Full name']")
-                if name_field:
-                    name_field.fill(f"{payment_info['cardholder_firstName']} {payment_info['cardholder_lastName']}")
-            except Exception as e:
-                print(f"Note: Could not fill name field: {e}")
+            with timed_step(result, "fill_card"):
+                # Wait for card fields to be available
+                page.wait_for_selector("input[placeholder='1234 1234 1234 1234']", timeout=60000)
+                
+                # Fill card information
+                page.fill("input[placeholder='1234 1234 1234 1234']", payment_info.number)
+                page.fill("input[placeholder='MM / YY']", f"{payment_info.exp_month}/{payment_info.exp_year_short}")
+                page.fill("input[placeholder='CVC']", payment_info.cvc)
+                
+                # Fill name field if available
+                try:
+                    name_field = page.query_selector("input[placeholder='Name on card']") or page.query_selector("input[placeholder='Full name']")
+                    if name_field:
+                        name_field.fill(payment_info.full_name)
+                except Exception as e:
+                    print(f"Note: Could not fill name field: {e}")
             
             print("✅ Card information filled")
         except Exception as e:
+            result["error"] = f"Could not fill card information: {e}"
             print(f"❌ Error filling card information: {e}")
             page.screenshot(path="stripe_test_error.png")
             print("Screenshot saved as stripe_test_error.png")
-            return
+            return result
 
         # Submit the payment
         print("\n✅ Form filled with virtual card details")
@@ -78,7 +94,7 @@ def run(playwright: Playwright, card_id: str) -> None:
         print("⚠️  No actual charges will be made")
         print("\nSubmitting payment...")
         
-        # Try different possible selectors for the pay button
+        # Race the possible selectors for the pay button
         pay_selectors = [
             "text=Pay",
             "button:has-text('Pay')",
@@ -86,27 +102,21 @@ def run(playwright: Playwright, card_id: str) -> None:
             "button[type='submit']"
         ]
         
-        button_clicked = False
-        for selector in pay_selectors:
-            try:
-                if page.is_visible(selector, timeout=5000):
-                    page.click(selector)
-                    button_clicked = True
-                    print(f"Clicked pay button using selector: {selector}")
-                    break
-            except Exception:
-                continue
-        
-        if not button_clicked:
+        try:
+            with timed_step(result, "submit"):
+                selector = race_selectors(page, pay_selectors, timeout=20000)
+                page.click(selector)
+            print(f"Clicked pay button using selector: {selector}")
+        except FlowError:
+            result["error"] = "Could not find the pay button"
             print("❌ Could not find pay button with standard selectors")
             page.screenshot(path="stripe_test_form.png")
             print("Screenshot saved as stripe_test_form.png")
-            return
+            return result
         
         # Wait for confirmation
         print("Waiting for confirmation...")
-        time.sleep(5)
-        
+
         # Check for success message
         success_selectors = [
             "text=Payment successful",
@@ -116,47 +126,62 @@ def run(playwright: Playwright, card_id: str) -> None:
             "#success"
         ]
         
-        success_found = False
-        for selector in success_selectors:
-            try:
-                if page.is_visible(selector, timeout=5000):
-                    print(f"✅ Payment success confirmed! Found: {selector}")
-                    success_found = True
-                    break
-            except Exception:
-                continue
-        
-        if not success_found:
+        try:
+            with timed_step(result, "confirm"):
+                selector = race_selectors(page, success_selectors, timeout=30000)
+            print(f"✅ Payment success confirmed! Found: {selector}")
+        except FlowError:
             print("⚠️  Could not confirm payment success message")
             print("Taking screenshot of current page state...")
             page.screenshot(path="stripe_test_result.png")
             print("Screenshot saved as stripe_test_result.png")
         
+        result["ok"] = True
         print("\n✅ Test payment process completed")
         print("Note: Since this is using Stripe's test mode, no actual payment was made")
         
     except Exception as e:
+        failed = True
+        result["error"] = f"{type(e).__name__}: {e}"
         print(f"❌ Error: {e}")
         try:
-            page.screenshot(path="stripe_test_error.png")
-            print("Screenshot saved as stripe_test_error.png")
+            if lease:
+                lease.page.screenshot(path="stripe_test_error.png")
+                print("Screenshot saved as stripe_test_error.png")
         except:
             pass
     finally:
-        # Close the browser
-        page.close()
-        browser.close()
+        # Hand the session back, recycling it if the run failed
+        if lease:
+            pool.release(lease, failed=failed)
+        if pool.blocker:
+            print(f"🚫 {describe(pool.blocker.stats())}")
+    return result
 
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python3 stripe_test_payment.py <card_id>")
+    from playwright.sync_api import sync_playwright
+
+    try:
+        blocking, args = pop_block_option(sys.argv[1:])
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    profiling = "--profile" in args
+    args = [arg for arg in args if arg != "--profile"]
+    if len(args) != 1:
+        print("Usage: python3 stripe_test_payment.py <card_id> [--profile] [--block PROFILE]")
         print("Example: python3 stripe_test_payment.py ic_1RffUCLP54m13jvUESeDqzHz")
+        print("  --profile  add the run's step timeline to profiles/ and print percentiles over all runs")
         sys.exit(1)
     
-    card_id = sys.argv[1]
+    card_id = args[0]
     
     with sync_playwright() as playwright:
-        run(playwright, card_id)
+        result = run(playwright, card_id, blocking=blocking)
+    if profiling:
+        record_run(result, name="stripe_test_payment")
+    sys.exit(0 if result["ok"] else 1)
 
 if __name__ == "__main__":
+    require_stripe()
     main()
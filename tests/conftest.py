@@ -0,0 +1,163 @@
+"""
+Shared fixtures: a stubbed Stripe HTTP client that answers from memory.
+
+StubStripe stands in for the SDK's HTTP client behind the rate-limit
+scheduler, so tests exercise the real stripe-python request, pagination and
+error handling without the network. It lists, retrieves, creates and
+modifies issuing objects, and serves queued responses (e.g. 429s) first.
+"""
+import os
+import sys
+import json
+import itertools
+from urllib.parse import parse_qsl, urlsplit
+import pytest
+import stripe
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stripe_scheduler import RateLimitScheduler, RateLimitedHTTPClient  # noqa: E402
+
+RESOURCES = {
+    "authorizations": ("issuing.authorization", "iauth"),
+    "transactions": ("issuing.transaction", "ipi"),
+    "cards": ("issuing.card", "ic"),
+    "cardholders": ("issuing.cardholder", "ich"),
+}
+# List parameters that filter on a field of the objects
+FILTERS = ("card", "email", "status")
+
+
+def _form(query):
+    # Decode stripe-python's form encoding (a[b][0]=c) into nested dicts
+    params = {}
+    for key, value in parse_qsl(query, keep_blank_values=True):
+        parts = key.replace("]", "").split("[")
+        target = params
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return params
+
+
+def _card_id(obj):
+    card = obj.get("card")
+    return card["id"] if isinstance(card, dict) else card
+
+
+class StubStripe(stripe.HTTPClient):
+    """In-memory Stripe API for the issuing resources the scripts use"""
+
+    name = "stub"
+
+    def __init__(self):
+        super().__init__()
+        self.objects = {resource: [] for resource in RESOURCES}
+        self.queued = []
+        self.requests = []
+        self._ids = itertools.count(1)
+        self._created = itertools.count(1_700_000_000)
+
+    def queue(self, status, body=None, headers=None):
+        """Serve this response to the next request instead of answering it"""
+        self.queued.append((json.dumps(body or {}), status, headers or {}))
+
+    def add(self, resource, **fields):
+        """Store an object as if Stripe had created it, and return it"""
+        object_name, prefix = RESOURCES[resource]
+        obj = {"id": f"{prefix}_{next(self._ids)}", "object": object_name, "created": next(self._created),
+               "livemode": False, **fields}
+        self.objects[resource].append(obj)
+        return obj
+
+    def calls(self, method=None, resource=None):
+        """The requests made so far, as (method, path, params)"""
+        return [call for call in self.requests
+                if (method is None or call[0] == method) and (resource is None or f"/{resource}" in call[1])]
+
+    def request(self, method, url, headers, post_data=None, **kwargs):
+        parts = urlsplit(url)
+        body = post_data.decode() if isinstance(post_data, bytes) else post_data or ""
+        params = _form(parts.query if method == "get" else body)
+        self.requests.append((method, parts.path, params))
+        if self.queued:
+            return self.queued.pop(0)
+        path = parts.path.split("/")[3:]  # after /v1/issuing
+        if not path or path[0] not in RESOURCES:
+            return self._error(404, f"Unrecognized request URL ({parts.path})")
+        resource, object_id = path[0], path[1] if len(path) > 1 else None
+        if method == "get":
+            return self._retrieve(resource, object_id) if object_id else self._list(resource, params, parts.path)
+        if object_id:
+            return self._modify(resource, object_id, params)
+        return self._create(resource, params)
+
+    def _find(self, resource, object_id):
+        return next((obj for obj in self.objects[resource] if obj["id"] == object_id), None)
+
+    def _ok(self, body):
+        return json.dumps(body), 200, {"request-id": f"req_{next(self._ids)}"}
+
+    def _error(self, status, message, param=None):
+        body = {"error": {"type": "invalid_request_error", "message": message, "param": param}}
+        return json.dumps(body), status, {}
+
+    def _list(self, resource, params, path):
+        newest_first = [
+            obj for obj in reversed(self.objects[resource])
+            if all((_card_id(obj) if name == "card" else obj.get(name)) == params[name]
+                   for name in FILTERS if name in params)
+        ]
+        if "created" in params:
+            newest_first = [obj for obj in newest_first if obj["created"] >= int(params["created"]["gte"])]
+        limit = int(params.get("limit", 10))
+        ids = [obj["id"] for obj in newest_first]
+        if params.get("ending_before"):
+            # The page of objects just newer than the cursor, still newest first
+            newer = newest_first[:ids.index(params["ending_before"])]
+            page, has_more = newer[-limit:], len(newer) > limit
+        else:
+            start = ids.index(params["starting_after"]) + 1 if params.get("starting_after") else 0
+            older = newest_first[start:]
+            page, has_more = older[:limit], len(older) > limit
+        return self._ok({"object": "list", "url": path, "data": page, "has_more": has_more})
+
+    def _retrieve(self, resource, object_id):
+        obj = self._find(resource, object_id)
+        if obj is None:
+            return self._error(404, f"No such {RESOURCES[resource][0]}: '{object_id}'", "id")
+        return self._ok(obj)
+
+    def _create(self, resource, params):
+        params.pop("expand", None)
+        if resource == "cards":
+            cardholder = self._find("cardholders", params["cardholder"])
+            if cardholder is None:
+                return self._error(400, f"No such cardholder: '{params['cardholder']}'", "cardholder")
+            params.update(cardholder=cardholder, number=f"40000099{next(self._ids):08d}", cvc="123",
+                          exp_month=12, exp_year=2030, brand="Visa", status="active")
+        return self._ok(self.add(resource, **params))
+
+    def _modify(self, resource, object_id, params):
+        obj = self._find(resource, object_id)
+        if obj is None:
+            return self._error(404, f"No such {RESOURCES[resource][0]}: '{object_id}'", "id")
+        params.pop("expand", None)
+        obj.update(params)
+        return self._ok(obj)
+
+
+@pytest.fixture
+def stripe_api(monkeypatch):
+    """
+    Route the global stripe.* API to a StubStripe behind a fresh scheduler.
+
+    Returns:
+        The StubStripe; its scheduler is at `stripe_api.scheduler`
+    """
+    stub = StubStripe()
+    stub.scheduler = RateLimitScheduler(rate=1000, max_retries=2)
+    monkeypatch.setattr(stripe, "api_key", "sk_test_stub")
+    monkeypatch.setattr(stripe, "max_network_retries", 0)
+    monkeypatch.setattr(stripe, "default_http_client", RateLimitedHTTPClient(stub, stub.scheduler))
+    return stub
@@ -0,0 +1,113 @@
+import asyncio
+import pytest
+import stripe
+from card_poller import authorization_poller, transaction_poller
+from event_store import EventStore
+
+
+def authorize(stripe_api, card_id="ic_1", amount=7500, status="pending"):
+    return stripe_api.add("authorizations", card={"id": card_id, "object": "issuing.card"},
+                          amount=amount, currency="usd", status=status, approved=True,
+                          merchant_data={"name": "American Red Cross"})["id"]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = EventStore(str(tmp_path / "events.db"))
+    yield store
+    store.close()
+
+
+def test_prime_treats_existing_objects_as_seen(stripe_api):
+    authorize(stripe_api)
+    newest = authorize(stripe_api)
+    poller = authorization_poller("ic_1")
+
+    assert poller.prime() == newest
+    assert poller.poll() == []
+
+
+def test_poll_returns_new_objects_oldest_first_across_pages(stripe_api):
+    baseline = authorize(stripe_api)
+    poller = authorization_poller("ic_1", page_size=2)
+    poller.prime()
+
+    new_ids = [authorize(stripe_api) for _ in range(5)]
+    authorize(stripe_api, card_id="ic_other")
+
+    assert [obj.id for obj in poller.poll()] == new_ids
+    # Each page asks for the objects just newer than the previous page
+    pages = [params["ending_before"] for _, _, params in stripe_api.calls("get")[1:]]
+    assert pages == [baseline, new_ids[1], new_ids[3]]
+    assert poller.cursor == new_ids[-1]
+    assert poller.poll() == []
+
+
+def test_poll_without_prime_returns_everything_oldest_first(stripe_api):
+    ids = [stripe_api.add("transactions", card="ic_1", amount=-7500, currency="usd")["id"] for _ in range(3)]
+    poller = transaction_poller("ic_1", page_size=2)
+
+    assert [obj.id for obj in poller.poll()] == ids
+    assert poller.cursor == ids[-1]
+
+
+def test_failed_poll_returns_none_and_keeps_the_cursor(stripe_api):
+    poller = authorization_poller("ic_1")
+    baseline = poller.prime()
+    missed = authorize(stripe_api)
+    stripe_api.queue(500, {"error": {"type": "api_error", "message": "Something went wrong"}})
+
+    assert poller.poll() is None
+    assert isinstance(poller.last_error, stripe.error.APIError)
+    assert poller.cursor == baseline
+    assert [obj.id for obj in poller.poll()] == [missed]
+    assert poller.last_error is None
+
+
+def test_restarted_poller_resumes_from_the_store(stripe_api, store):
+    authorize(stripe_api)
+    first = authorization_poller("ic_1", store=store)
+    first.prime()
+    seen = authorize(stripe_api)
+    first.poll()
+
+    missed = [authorize(stripe_api) for _ in range(2)]
+    listed = len(stripe_api.calls("get", "authorizations"))
+    restarted = authorization_poller("ic_1", store=store)
+
+    assert restarted.prime() == seen
+    assert len(stripe_api.calls("get", "authorizations")) == listed
+    assert [obj.id for obj in restarted.poll()] == missed
+    assert store.cursor("ic_1", "issuing.authorization") == missed[-1]
+
+
+def test_prime_backfills_objects_since_a_time(stripe_api, store):
+    old = authorize(stripe_api)
+    recent = [authorize(stripe_api) for _ in range(3)]
+    since = stripe_api.objects["authorizations"][1]["created"]
+    poller = authorization_poller("ic_1", page_size=2, store=store)
+
+    assert poller.prime(backfill_since=since) == recent[-1]
+    stored = [row["id"] for row in store.recent("ic_1", "issuing.authorization")]
+    assert stored == list(reversed(recent))
+    assert old not in stored
+
+
+class ListingClient:
+    """The parts of AsyncStripe the pollers use, answered by the global stubbed API"""
+
+    async def list(self, resource, priority=None, **params):
+        return resource.list(**params)
+
+    async def list_all(self, resource, priority=None, **params):
+        return list(resource.list(**params).auto_paging_iter())
+
+
+def test_prime_async_backfills_like_prime(stripe_api, store):
+    authorize(stripe_api)
+    recent = [authorize(stripe_api) for _ in range(2)]
+    since = stripe_api.objects["authorizations"][1]["created"]
+    poller = authorization_poller("ic_1", store=store)
+
+    assert asyncio.run(poller.prime_async(ListingClient(), backfill_since=since)) == recent[-1]
+    assert [row["id"] for row in store.recent("ic_1", "issuing.authorization")] == list(reversed(recent))
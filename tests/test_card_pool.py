@@ -0,0 +1,122 @@
+import sqlite3
+import pytest
+import card_profiles
+import cardholder_registry
+from card_pool import CardPool, LEASED, READY, RETIRED
+
+
+@pytest.fixture
+def pool(stripe_api, tmp_path, monkeypatch):
+    # Fresh process-wide caches, kept out of the working directory
+    monkeypatch.setenv("CARDHOLDER_CACHE", str(tmp_path / "cardholders.json"))
+    monkeypatch.delenv("CARD_CACHE_KEY", raising=False)
+    monkeypatch.setattr(cardholder_registry, "_shared", None)
+    monkeypatch.setattr(card_profiles, "_shared", None)
+    pool = CardPool(size=2, path=str(tmp_path / "pool.db"))
+    yield pool
+    pool.close()
+
+
+def stored_profiles(pool):
+    with sqlite3.connect(pool.path) as db:
+        return [row[0] for row in db.execute("SELECT profile FROM pool_cards ORDER BY added_at")]
+
+
+def deactivated(stripe_api):
+    return [path.rsplit("/", 1)[1] for method, path, params in stripe_api.calls("post", "cards/")
+            if params.get("status") == "inactive"]
+
+
+def test_refill_provisions_ready_cards_with_one_cardholder(pool, stripe_api):
+    assert pool.refill() == 2
+    assert pool.counts() == {READY: 2, LEASED: 0, RETIRED: 0}
+    assert len(stripe_api.objects["cardholders"]) == 1
+    assert pool.refill() == 0
+
+
+def test_lease_rebuilds_the_encrypted_profile_without_an_api_call(pool, stripe_api, monkeypatch, tmp_path):
+    fernet = pytest.importorskip("cryptography.fernet")
+    monkeypatch.setenv("CARD_CACHE_KEY", fernet.Fernet.generate_key().decode())
+    monkeypatch.setenv("CARD_CACHE_PATH", str(tmp_path / "profiles.enc"))
+    pool.refill()
+    stored = stored_profiles(pool)
+    assert all(stored)
+    assert not any(card["number"] in token for token in stored for card in stripe_api.objects["cards"])
+    first = stripe_api.objects["cards"][0]
+    # A fresh process with an empty profile cache
+    monkeypatch.setattr(card_profiles, "_shared", None)
+    (tmp_path / "profiles.enc").unlink()
+    requests = len(stripe_api.requests)
+
+    profile = pool.lease()
+
+    assert len(stripe_api.requests) == requests
+    assert profile.card_id == first["id"]
+    assert profile.number == first["number"]
+    assert profile.full_name == "Browserbase User"
+    assert pool.counts()[LEASED] == 1
+
+
+def test_without_a_key_only_the_card_id_is_stored(pool, stripe_api):
+    pool.refill()
+    first = stripe_api.objects["cards"][0]
+
+    assert stored_profiles(pool) == [None, None]
+    assert pool.lease().number == first["number"]
+
+
+def test_release_returns_the_card_until_it_is_used_up(pool, stripe_api):
+    pool.max_uses = 2
+    pool.refill()
+    profile = pool.lease()
+
+    assert pool.release(profile.card_id) is True
+    assert pool.counts() == {READY: 2, LEASED: 0, RETIRED: 0}
+
+    while pool.lease().card_id != profile.card_id:
+        pass
+    assert pool.release(profile.card_id) is False
+    assert deactivated(stripe_api) == [profile.card_id]
+    assert pool.counts()[RETIRED] == 1
+
+
+def test_failed_run_retires_the_card(pool, stripe_api):
+    pool.max_uses = 5
+    pool.refill()
+
+    with pytest.raises(RuntimeError):
+        with pool.leased() as profile:
+            raise RuntimeError("donation failed")
+
+    assert deactivated(stripe_api) == [profile.card_id]
+    assert pool.counts() == {READY: 1, LEASED: 0, RETIRED: 1}
+
+
+def test_empty_pool_provisions_a_card_already_leased(pool, stripe_api):
+    profile = pool.lease()
+
+    assert profile.card_id == stripe_api.objects["cards"][0]["id"]
+    assert pool.counts() == {READY: 0, LEASED: 1, RETIRED: 0}
+    assert pool.release(profile.card_id, retire=True) is False
+    assert deactivated(stripe_api) == [profile.card_id]
+
+
+def test_rejected_cardholder_is_forgotten(pool, stripe_api):
+    pool.refill()
+    cardholder_id = stripe_api.objects["cardholders"][0]["id"]
+    stripe_api.objects["cardholders"].clear()
+
+    assert pool._add_card() is None
+    assert cardholder_registry.shared_registry().find("Browserbase User", "hello@browserbase.com") is None
+    assert pool._add_card() is not None
+    assert stripe_api.objects["cardholders"][0]["id"] != cardholder_id
+
+
+def test_lease_puts_the_card_back_when_its_profile_cannot_be_retrieved(pool, stripe_api):
+    pool.refill()
+    card_profiles.shared_profiles().invalidate(stripe_api.objects["cards"][0]["id"])
+    stripe_api.queue(500, {"error": {"type": "api_error", "message": "Something went wrong"}})
+
+    assert pool.lease() is None
+    assert pool.counts() == {READY: 2, LEASED: 0, RETIRED: 0}
+    assert pool.lease().card_id == stripe_api.objects["cards"][0]["id"]
@@ -0,0 +1,85 @@
+import json
+import pytest
+import stripe
+from card_poller import authorization_poller
+from event_store import EventStore
+
+KIND = "issuing.authorization"
+
+
+def authorization(object_id, created, status="pending", card_id="ic_1", amount=7500):
+    return stripe.issuing.Authorization.construct_from({
+        "id": object_id, "object": KIND, "created": created, "status": status, "approved": True,
+        "amount": amount, "currency": "usd", "card": {"id": card_id, "object": "issuing.card"},
+        "merchant_data": {"name": "American Red Cross"},
+    }, "sk_test_stub")
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = EventStore(str(tmp_path / "events.db"))
+    yield store
+    store.close()
+
+
+def test_save_indexes_the_object_and_keeps_its_payload(store):
+    store.save(KIND, [authorization("iauth_1", 100)])
+
+    row, = store.recent("ic_1", KIND)
+    assert (row["id"], row["status"], row["approved"], row["amount"], row["merchant"]) == \
+        ("iauth_1", "pending", 1, 7500, "American Red Cross")
+    assert json.loads(row["payload"])["card"]["id"] == "ic_1"
+
+
+def test_saving_again_updates_the_status_in_place(store):
+    store.save(KIND, [authorization("iauth_1", 100)])
+    store.save(KIND, [authorization("iauth_1", 100, status="closed")])
+
+    rows = store.recent("ic_1", KIND)
+    assert [(row["id"], row["status"]) for row in rows] == [("iauth_1", "closed")]
+    assert json.loads(rows[0]["payload"])["status"] == "closed"
+
+
+def test_recent_filters_and_orders_newest_first(store):
+    store.save(KIND, [
+        authorization("iauth_1", 100, status="closed"),
+        authorization("iauth_2", 200),
+        authorization("iauth_3", 300),
+        authorization("iauth_4", 400, card_id="ic_2"),
+    ])
+
+    assert [row["id"] for row in store.recent("ic_1", KIND)] == ["iauth_3", "iauth_2", "iauth_1"]
+    assert [row["id"] for row in store.recent("ic_1", KIND, since=200)] == ["iauth_3", "iauth_2"]
+    assert [row["id"] for row in store.recent("ic_1", KIND, status="closed")] == ["iauth_1"]
+    assert [row["id"] for row in store.recent("ic_1", KIND, limit=1)] == ["iauth_3"]
+
+
+def test_cursor_is_upserted_per_card_and_kind(store):
+    assert store.cursor("ic_1", KIND) is None
+    store.set_cursor("ic_1", KIND, "iauth_1")
+    store.set_cursor("ic_1", KIND, "iauth_2")
+    store.set_cursor("ic_2", KIND, "iauth_9")
+
+    assert store.cursor("ic_1", KIND) == "iauth_2"
+    assert store.cursor("ic_2", KIND) == "iauth_9"
+    assert store.cursor("ic_1", "issuing.transaction") is None
+
+
+def test_unsettled_lists_only_open_objects(store):
+    store.save(KIND, [authorization("iauth_1", 100, status="closed"), authorization("iauth_2", 200),
+                      authorization("iauth_3", 300, card_id="ic_2")])
+
+    assert store.unsettled("ic_1", KIND) == ["iauth_2"]
+
+
+def test_refresh_brings_stored_statuses_up_to_date(stripe_api, store):
+    pending = stripe_api.add("authorizations", card={"id": "ic_1", "object": "issuing.card"}, amount=7500,
+                             currency="usd", status="pending", approved=True, merchant_data={"name": "Red Cross"})
+    poller = authorization_poller("ic_1", store=store)
+    poller.poll()
+    pending["status"] = "closed"
+
+    assert [obj.id for obj in poller.refresh()] == [pending["id"]]
+    assert store.unsettled("ic_1", KIND) == []
+    assert store.recent("ic_1", KIND)[0]["status"] == "closed"
+    assert poller.refresh() == []
@@ -0,0 +1,63 @@
+import time
+import pytest
+import stripe
+import stripe_scheduler
+from stripe_scheduler import BULK, INTERACTIVE, RateLimitScheduler, retry_after
+
+RATE_LIMITED = {"error": {"type": "invalid_request_error", "code": "rate_limit", "message": "Too many requests"}}
+
+
+def test_retry_after_header_is_read_case_insensitively():
+    assert retry_after({"Retry-After": "2"}) == 2.0
+    assert retry_after({"retry-after": "0.5"}) == 0.5
+    assert retry_after({"Retry-After": "soon"}) is None
+    assert retry_after({}) is None
+
+
+def test_429_pauses_for_retry_after_and_retries(stripe_api):
+    stripe_api.add("authorizations", card="ic_1", amount=7500)
+    stripe_api.queue(429, RATE_LIMITED, {"Retry-After": "0.2"})
+
+    started = time.monotonic()
+    page = stripe.issuing.Authorization.list(card="ic_1")
+
+    assert time.monotonic() - started >= 0.2
+    assert [obj.amount for obj in page.data] == [7500]
+    assert len(stripe_api.requests) == 2
+    assert stripe_api.scheduler.stats()["throttled"] == 1
+    assert stripe_api.scheduler.stats()["requests"] == 2
+
+
+def test_429_without_retry_after_backs_off_exponentially(monkeypatch):
+    monkeypatch.setattr(stripe_scheduler.random, "uniform", lambda low, high: 1)
+    scheduler = RateLimitScheduler(rate=1000)
+
+    assert scheduler.throttle({}, 0) == 0.5
+    assert scheduler.throttle({}, 2) == 2.0
+    assert scheduler.throttle({}, 10) == stripe_scheduler.MAX_BACKOFF
+
+
+def test_429_after_the_last_retry_is_raised(stripe_api):
+    for _ in range(stripe_api.scheduler.max_retries + 1):
+        stripe_api.queue(429, RATE_LIMITED, {"Retry-After": "0"})
+
+    with pytest.raises(stripe.error.RateLimitError):
+        stripe.issuing.Authorization.list(card="ic_1")
+    assert len(stripe_api.requests) == stripe_api.scheduler.max_retries + 1
+
+
+def test_a_pause_holds_back_every_request(stripe_api):
+    stripe_api.scheduler.throttle({"Retry-After": "0.2"}, 0)
+
+    started = time.monotonic()
+    stripe.issuing.Transaction.list(card="ic_1")
+
+    assert time.monotonic() - started >= 0.2
+
+
+def test_interactive_requests_go_before_waiting_bulk_ones():
+    scheduler = RateLimitScheduler(rate=1000)
+    scheduler._register(INTERACTIVE, 1)
+
+    assert scheduler._reserve(BULK) > 0
+    assert scheduler._reserve(INTERACTIVE) == 0